@@ -0,0 +1,106 @@
+"""
+Matching a subject against rule blocks of 10, 100 and 1000 random
+rules, trying the rules in turn, through the head symbol index and
+through the left-to-right matching automaton.
+
+Half of the subjects are instances of some rule's left hand side, the
+rest random terms over the same signature.
+
+    PYTHONPATH=. python bench/bench_automaton.py
+"""
+
+import random
+import time
+
+from rewrite import aparse
+from rewrite.matching import NoMatch, FAIL
+from rewrite.dsl import module
+from rewrite.dsl.toplevel import RuleBlock
+
+SIGNATURE = [('F%d' % i, i % 4) for i in range(24)]
+
+class LinearBlock(RuleBlock):
+    """ Every rule in order, failing through NoMatch ( for comparison ). """
+
+    def rewrite(self, pattern):
+        for rule in self.rules:
+            try:
+                return rule.rewrite(pattern)
+            except NoMatch:
+                continue
+        raise NoMatch()
+
+    def apply(self, pattern):
+        try:
+            return self.rewrite(pattern)
+        except NoMatch:
+            return FAIL
+
+def pattern(depth, rng, var, top=False):
+    if depth == 0 or (not top and rng.random() < 0.2):
+        if var and rng.random() < 0.6:
+            return 'x%d' % rng.randint(0, 3)
+        return rng.choice(['%d' % rng.randint(0, 3), 'C%d()' % rng.randint(0, 3)])
+    name, n = rng.choice([sig for sig in SIGNATURE if sig[1] or not top])
+    return '%s(%s)' % (name, ', '.join(pattern(depth - 1, rng, var)
+                                       for i in range(n)))
+
+def instance(lhs, rng):
+    # substitute a ground term for each variable
+    out = lhs
+    for v in ('x0', 'x1', 'x2', 'x3'):
+        out = out.replace(v, pattern(2, rng, False))
+    return out
+
+def timeit(f, n=3):
+    best = float('inf')
+    for i in range(n):
+        start = time.time()
+        res = f()
+        best = min(best, time.time() - start)
+    return best, res
+
+def run(block, subjects):
+    out = []
+    for s in subjects:
+        try:
+            out.append(block(s))
+        except NoMatch:
+            out.append(None)
+    return out
+
+def main():
+    for nrules in (10, 100, 1000):
+        rng = random.Random(nrules)
+        lhs = [pattern(3, rng, True, top=True) for i in range(nrules)]
+        source = '\n'.join('E : %s -> R%d()' % (l, i) for i, l in enumerate(lhs))
+
+        subjects = []
+        for i in range(2000):
+            if i % 2:
+                subjects.append(aparse(instance(rng.choice(lhs), rng)))
+            else:
+                subjects.append(aparse(pattern(4, rng, False)))
+
+        linear = module(source, _env={'E': LinearBlock(label='E')})['E']
+        indexed = module(source)['E']
+        automaton = module(source, automaton=True)['E']
+
+        # first run builds the automaton states the subjects reach
+        start = time.time()
+        expected = run(automaton, subjects)
+        build = time.time() - start
+
+        n = len(subjects)
+        print '%d rules, %d subjects, %d states after warmup ( %.3f s )' % (
+            nrules, n, len(automaton.matcher()), build)
+        base = None
+        for name, block in [('linear', linear), ('indexed', indexed),
+                            ('automaton', automaton)]:
+            t, res = timeit(lambda: run(block, subjects))
+            assert res == expected
+            base = base or t
+            print '  %-10s %8.2f us/subject  ( %.1fx )' % (name, t / n * 1e6, base / t)
+
+if __name__ == '__main__':
+    main()
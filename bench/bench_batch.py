@@ -0,0 +1,64 @@
+"""
+bottomup(repeat(Eval)) from examples/eval over many small random
+boolean formulas: one call per term in a single process against
+Pool.imap with 1, 2, 4 and 8 workers and several chunk sizes, in terms
+per second.
+
+The pools include the cost of sending the terms to the workers and
+their results back, but not of starting the workers.
+
+    PYTHONPATH=. python bench/bench_batch.py [terms]
+"""
+
+import sys
+import random
+import time
+import multiprocessing
+
+from rewrite.terms import aappl, aterm
+from rewrite.matching import FAIL
+from rewrite.dsl import module
+from rewrite.dsl.parallel import Pool
+
+source = open('examples/eval').read()
+
+def formula(depth, rng):
+    if depth == 0 or rng.random() < 0.1:
+        return aappl(aterm(rng.choice(['True', 'False']), None), [])
+    op = rng.choice(['And', 'Or', 'Impl', 'Eq', 'Not'])
+    if op == 'Not':
+        return aappl(aterm(op, None), [formula(depth - 1, rng)])
+    return aappl(aterm(op, None), [formula(depth - 1, rng),
+                                   formula(depth - 1, rng)])
+
+def timeit(f, n=3):
+    best = float('inf')
+    for i in range(n):
+        start = time.time()
+        res = f()
+        best = min(best, time.time() - start)
+    return best, res
+
+def main():
+    n = int(sys.argv[1]) if sys.argv[1:] else 20000
+    rng = random.Random(0)
+    terms = [formula(4, rng) for i in xrange(n)]
+    print '%d terms, %d nodes, %d cpus' % (
+        n, sum(t.size for t in terms), multiprocessing.cpu_count())
+
+    apply = module(source, compiled=True)['eval'].apply
+    base, expected = timeit(lambda: map(apply, terms))
+    assert FAIL not in expected
+    print '  1 process                %8.0f terms/s' % (n / base)
+
+    for workers in (1, 2, 4, 8):
+        with Pool(source, workers=workers) as pool:
+            for chunksize in (16, 64, 256, 1024):
+                t, res = timeit(lambda: list(pool.imap('eval', terms,
+                                                       chunksize)))
+                assert res == expected
+                print '  %d workers, chunks %-5d %8.0f terms/s  ( %.2fx )' % (
+                    workers, chunksize, n / t, base / t)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Size and throughput of the binary term format against the text format.
+
+    PYTHONPATH=. python bench/bench_binary.py
+"""
+
+import random
+import time
+from cStringIO import StringIO
+
+from rewrite import aparse
+from rewrite.terms import aappl, aterm, aint, astr, alist
+from rewrite.binary import Writer, Reader, dumps, loads
+
+SYMBOLS = ['Add', 'Mul', 'Sub', 'Map', 'Filter', 'Concat']
+
+def random_term(depth, rng):
+    if depth == 0:
+        r = rng.random()
+        if r < 0.4:
+            return aint(rng.randint(0, 1000))
+        elif r < 0.7:
+            return aterm('x%d' % rng.randint(0, 50), None)
+        else:
+            return astr('col%d' % rng.randint(0, 50))
+    n = rng.randint(1, 3)
+    args = [random_term(depth - 1, rng) for i in range(n)]
+    if rng.random() < 0.1:
+        return alist(args)
+    return aappl(aterm(rng.choice(SYMBOLS), None), args)
+
+def shared_term(depth):
+    """ A term whose size doubles at each level but whose DAG does not. """
+    t = aint(1)
+    for i in range(depth):
+        t = aappl(aterm('Pair', None), [t, t])
+    return t
+
+def timeit(f, n=3):
+    best = float('inf')
+    for i in range(n):
+        start = time.time()
+        res = f()
+        best = min(best, time.time() - start)
+    return best, res
+
+def report(name, term, nodes):
+    text_time, text = timeit(lambda: str(term))
+    parse_time, _ = timeit(lambda: aparse(text), 1)
+    bin_time, data = timeit(lambda: dumps(term))
+    load_time, _ = timeit(lambda: loads(data))
+
+    print name
+    print '  %-8s %10d bytes  write %7.3f s  read %7.3f s  ( %8.0f nodes/s )' % (
+        'text', len(text), text_time, parse_time, nodes / parse_time)
+    print '  %-8s %10d bytes  write %7.3f s  read %7.3f s  ( %8.0f nodes/s )' % (
+        'binary', len(data), bin_time, load_time, nodes / load_time)
+
+def stream(count):
+    rng = random.Random(1)
+    terms = [random_term(6, rng) for i in range(count)]
+
+    fd = StringIO()
+    start = time.time()
+    w = Writer(fd)
+    for t in terms:
+        w.write(t)
+    w.close()
+    write = time.time() - start
+
+    fd.seek(0)
+    start = time.time()
+    n = sum(1 for t in Reader(fd))
+    read = time.time() - start
+
+    print 'stream of %d terms' % n
+    print '  %10d bytes  write %7.0f terms/s  read %7.0f terms/s' % (
+        len(fd.getvalue()), count / write, count / read)
+
+def main():
+    rng = random.Random(0)
+    term = random_term(13, rng)
+    report('random term ( %d nodes )' % term.size, term, term.size)
+
+    term = shared_term(16)
+    report('shared term ( %d nodes, %d distinct )' % (term.size, 17),
+           term, term.size)
+
+    stream(2000)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+The cost of budgets: bottomup(repeat(Eval)) from examples/eval over
+random boolean formulas, interpreted and compiled, in a module without
+budgets and run within a budget which does not run out, counting terms
+and rewrites and reading the clock, in median times.
+
+    PYTHONPATH=. python bench/bench_budget.py
+"""
+
+import random
+import time
+
+from rewrite.terms import aappl, aterm
+from rewrite.dsl import module
+from rewrite.dsl.budget import Budget
+
+source = open('examples/eval').read()
+
+def formula(depth, rng):
+    if depth == 0 or rng.random() < 0.1:
+        return aappl(aterm(rng.choice(['True', 'False']), None), [])
+    op = rng.choice(['And', 'Or', 'Impl', 'Eq', 'Not'])
+    if op == 'Not':
+        return aappl(aterm(op, None), [formula(depth - 1, rng)])
+    return aappl(aterm(op, None), [formula(depth - 1, rng),
+                                   formula(depth - 1, rng)])
+
+def medians(f, g, n=21):
+    # alternating runs, as the difference is within the drift between
+    # separate series of runs
+    fs, gs = [], []
+    for i in range(n):
+        for f_, ts in ((f, fs), (g, gs)):
+            start = time.time()
+            f_()
+            ts.append(time.time() - start)
+    fs.sort()
+    gs.sort()
+    return fs[n // 2], gs[n // 2]
+
+def main():
+    rng = random.Random(0)
+    terms = [formula(8, rng) for i in range(200)]
+    print 'eval, %d terms, %d nodes' % (len(terms), sum(t.size for t in terms))
+
+    for compiled in (False, True):
+        plain = module(source, compiled=compiled)['eval']
+        metered = module(source, compiled=compiled, budgets=True)['eval']
+
+        def run():
+            for t in terms:
+                res, exhausted = metered.run(t, Budget(visits=10 ** 6,
+                                                       rewrites=10 ** 6,
+                                                       seconds=60))
+                assert not exhausted
+
+        budgets = [Budget() for t in terms]
+        assert [metered.run(t, b)[0] for t, b in zip(terms, budgets)] == \
+            map(plain, terms)
+        pt, bt = medians(lambda: map(plain, terms), run)
+        print '  %-12s %8.1f ms  %8.1f ms in budget  ( %+.1f%% )' % (
+            'compiled' if compiled else 'interpreted',
+            pt * 1e3, bt * 1e3, (bt / pt - 1) * 100)
+    print '  %d terms tried, %d rewrites a pass' % (
+        sum(b.visited for b in budgets), sum(b.rewritten for b in budgets))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Per-rewrite cost of compiled right hand sides against fold.
+
+Each rule is matched once up front, then only the construction of the
+result is timed. Retained objects counts the garbage collected objects
+( terms and their argument tuples ) kept alive by one result.
+
+    PYTHONPATH=. python bench/bench_build.py
+"""
+
+import gc
+import time
+
+from rewrite import aparse
+from rewrite.matching import fold
+from rewrite.dsl import module
+
+rules = """
+E : Dnf(Eq(x, y))        -> Dnf(And(Impl(x, y), Impl(y, x)))
+E : DnfR(Not(And(x, y))) -> Or(Dnf(Not(x)), Dnf(Not(y)))
+E : Expand(x, y, z)      -> Add(Mul(x, y), Mul(x, z), Mul(y, z), Zero(), Unit(1, 1))
+E : Norm(x)              -> Ann(x, Type(Int(), Const(True(), (1, 2))))
+"""
+
+subjects = [
+    'Dnf(Eq(p, q))',
+    'DnfR(Not(And(p, q)))',
+    'Expand(a, b, c)',
+    'Norm(x)',
+]
+
+N = 100000
+
+def timeit(f, n=3):
+    best = float('inf')
+    for i in range(n):
+        start = time.time()
+        f()
+        best = min(best, time.time() - start)
+    return best
+
+def retained(f):
+    gc.collect()
+    gc.disable()
+    try:
+        before = gc.get_count()[0]
+        keep = [f() for i in xrange(100)]
+        return (gc.get_count()[0] - before - 1) / 100.0
+    finally:
+        gc.enable()
+
+def main():
+    mod = module(rules)
+    for rule, s in zip(mod['E'].rules, subjects):
+        values = rule.match(aparse(s))
+
+        bound = []
+        for b in rule.lpat:
+            if b not in bound:
+                bound.append(b)
+        cap = zip(bound, values)
+
+        old = lambda: fold(rule.rpat, rule.right, cap)
+        new = lambda: rule.build(values)
+        assert old() == new()
+
+        ft = timeit(lambda: [old() for i in xrange(N)])
+        bt = timeit(lambda: [new() for i in xrange(N)])
+
+        print s
+        print '  %-9s %6.2f us/rewrite  %5.1f retained objects' % (
+            'fold', ft / N * 1e6, retained(old))
+        print '  %-9s %6.2f us/rewrite  %5.1f retained objects  ( %.1fx )' % (
+            'compiled', bt / N * 1e6, retained(new), ft / bt)
+
+if __name__ == '__main__':
+    main()
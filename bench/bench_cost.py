@@ -0,0 +1,77 @@
+"""
+Cost-guided rule selection: random join plans rewritten by innermost
+with the first rule to match and with cheapest, looking 0, 1 and 2
+rewrites ahead, in median times and the cost of the plans found. The
+costs are memoised on term identity across the rewrites of a run, and
+as a baseline only within the pricing of each term, which prices every
+subterm again at each position.
+
+    PYTHONPATH=. python bench/bench_cost.py
+"""
+
+import random
+import time
+
+from rewrite.terms import aappl, aterm
+from rewrite.dsl import module
+from rewrite.dsl.cost import CostModel, MAXSIZE
+
+source = """
+plan: join(a, b) -> loop(a, b)
+plan: join(a, b) -> hash(a, b)
+plan: join(a, b) -> sort(a, b)
+plan: sort(a, b) -> merge(a, b)
+plan: scan(t) -> index(t)
+plan: scan(t) -> seq(t)
+
+first = innermost(plan)
+best = innermost(cheapest(plan))
+"""
+
+costs = dict(loop=20, hash=10, sort=15, merge=5, index=3, seq=2)
+
+def plan(n, rng):
+    if n == 1:
+        return aappl(aterm('scan', None), [aterm('t%d' % rng.randint(0, 9),
+                                                  None)])
+    k = rng.randint(1, n - 1)
+    return aappl(aterm('join', None), [plan(k, rng), plan(n - k, rng)])
+
+def median(f, n=3):
+    ts = []
+    for i in range(n):
+        start = time.time()
+        f()
+        ts.append(time.time() - start)
+    ts.sort()
+    return ts[n // 2]
+
+def main():
+    rng = random.Random(0)
+    price = CostModel(costs)
+    for leaves in (100, 1000):
+        terms = [plan(leaves, rng) for i in range(10)]
+        print 'join plans, %d of %d scans' % (len(terms), leaves)
+
+        runs = [('first', 0, None)]
+        for depth in (0, 1, 2):
+            runs.append(('cheapest', depth, MAXSIZE))
+            runs.append(('  unshared', depth, 1))
+        for name, depth, maxsize in runs:
+            if name == 'first':
+                st = module(source)['first']
+                model = None
+            else:
+                model = CostModel(costs, maxsize)
+                st = module(source, costs=model, lookahead=depth)['best']
+            t = median(lambda: map(st, terms))
+            cost = sum(price(st(u)) for u in terms)
+            hits = ''
+            if model is not None:
+                total = float(model.hits + model.misses)
+                hits = '%5.1f%% hits' % (model.hits / total * 100)
+            print '  %-10s %d %8.1f ms  cost %8d  %s' % (
+                name, depth, t * 1e3, cost, hits)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+The cost of checking for cycles: bottomup(repeat(Eval)) from
+examples/eval over random boolean formulas, and innermost(E <+ D) from
+examples/dnff over random formulas, interpreted and compiled, without
+and with ``cycles`` set, in median times.
+
+    PYTHONPATH=. python bench/bench_cycles.py
+"""
+
+import sys
+import random
+import time
+
+from rewrite.terms import aappl, aterm
+from rewrite.dsl import module
+
+def boolean(depth, rng):
+    if depth == 0 or rng.random() < 0.1:
+        return aappl(aterm(rng.choice(['True', 'False']), None), [])
+    op = rng.choice(['And', 'Or', 'Impl', 'Eq', 'Not'])
+    if op == 'Not':
+        return aappl(aterm(op, None), [boolean(depth - 1, rng)])
+    return aappl(aterm(op, None), [boolean(depth - 1, rng),
+                                   boolean(depth - 1, rng)])
+
+def formula(depth, rng):
+    if depth == 0 or rng.random() < 0.15:
+        return aappl(aterm('Atom', None),
+                     [aterm('p%d' % rng.randint(0, 3), None)])
+    op = rng.choice(['Eq', 'Impl', 'And', 'Or'])
+    return aappl(aterm(op, None), [formula(depth - 1, rng),
+                                   formula(depth - 1, rng)])
+
+def medians(f, g, n=15):
+    # alternating runs, as the difference is within the drift between
+    # separate series of runs
+    fs, gs = [], []
+    for i in range(n):
+        for f_, ts in ((f, fs), (g, gs)):
+            start = time.time()
+            res = f_()
+            ts.append(time.time() - start)
+    fs.sort()
+    gs.sort()
+    return fs[n // 2], gs[n // 2], res
+
+def workloads():
+    rng = random.Random(0)
+    yield 'eval', 'eval', [boolean(8, rng) for i in range(200)]
+    yield 'dnff', 'dnf', [aappl(aterm('Dnf', None), [formula(2, rng)])
+                          for i in range(100)]
+
+def main():
+    sys.setrecursionlimit(10000)
+    for example, name, terms in workloads():
+        source = open('examples/' + example).read()
+        print '%s, %d terms' % (name, len(terms))
+        for compiled in (False, True):
+            plain = module(source, compiled=compiled)[name]
+            checked = module(source, compiled=compiled, cycles=True)[name]
+            assert map(plain, terms) == map(checked, terms)
+            pt, ct, res = medians(lambda: map(plain, terms),
+                                  lambda: map(checked, terms))
+            print '  %-12s %8.1f ms  %8.1f ms checked  ( %+.1f%% )' % (
+                'compiled' if compiled else 'interpreted',
+                pt * 1e3, ct * 1e3, (ct / pt - 1) * 100)
+
+if __name__ == '__main__':
+    main()
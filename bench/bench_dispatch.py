@@ -0,0 +1,76 @@
+"""
+Visits per second of bottomup(try(Eval)) over large random boolean
+terms, trying every rule of the block in turn against dispatching on
+the head symbol and arity of each subterm.
+
+    PYTHONPATH=. python bench/bench_dispatch.py
+"""
+
+import random
+import time
+
+from rewrite.terms import aappl, aterm
+from rewrite.matching import NoMatch, FAIL
+from rewrite.dsl import module
+from rewrite.dsl.toplevel import RuleBlock
+
+class LinearBlock(RuleBlock):
+    """ Every rule in order, failing through NoMatch ( for comparison ). """
+
+    def rewrite(self, pattern):
+        for rule in self.rules:
+            try:
+                return rule.rewrite(pattern)
+            except NoMatch:
+                continue
+        raise NoMatch()
+
+    def apply(self, pattern):
+        try:
+            return self.rewrite(pattern)
+        except NoMatch:
+            return FAIL
+
+def random_term(depth, rng):
+    if depth == 0 or rng.random() < 0.1:
+        return rng.choice([
+            aappl(aterm('True', None), []),
+            aappl(aterm('False', None), []),
+            aterm('p%d' % rng.randint(0, 100), None),
+        ])
+    if rng.random() < 0.2:
+        return aappl(aterm('Not', None), [random_term(depth - 1, rng)])
+    op = rng.choice(['And', 'Or', 'Eq', 'Impl'])
+    return aappl(aterm(op, None), [random_term(depth - 1, rng),
+                                   random_term(depth - 1, rng)])
+
+def timeit(f, n=3):
+    best = float('inf')
+    for i in range(n):
+        start = time.time()
+        res = f()
+        best = min(best, time.time() - start)
+    return best, res
+
+def main():
+    source = open('examples/eval').read() + '\nt = bottomup(try(Eval))\n'
+
+    rng = random.Random(0)
+    terms = [random_term(16, rng) for i in range(10)]
+    visits = sum(t.size for t in terms)
+
+    indexed = module(source)
+    linear = module(source, _env={'Eval': LinearBlock(label='Eval')})
+    assert isinstance(linear['Eval'], LinearBlock)
+
+    lt, lres = timeit(lambda: map(linear['t'], terms))
+    it, ires = timeit(lambda: map(indexed['t'], terms))
+    assert lres == ires
+
+    print 'bottomup(try(Eval)), %d rules, %d visits' % (
+        len(indexed['Eval'].rules), visits)
+    print '  %-8s %10.0f visits/s' % ('linear', visits / lt)
+    print '  %-8s %10.0f visits/s  ( %.1fx )' % ('indexed', visits / it, lt / it)
+
+if __name__ == '__main__':
+    main()
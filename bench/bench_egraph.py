@@ -0,0 +1,71 @@
+"""
+Equality saturation over fusion chains of increasing length, with the
+rules of examples/fusion, against innermost(fuse), in the cost of the
+plan found, counting 10 for each pass over the data, and in time.
+
+    maps      map(f1, map(f2, .. map(fn, xs)))
+    zipwith   map(k, zipwith(z, map(g, map(f1, .. map(fn, xs))),
+                             map(g, ys)))
+
+Without associativity of compose the class of a chain of n maps holds
+a term for each bracketing of the n functions, so the e-graph grows as
+the Catalan numbers until the node limit stops it.
+
+    PYTHONPATH=. python bench/bench_egraph.py
+"""
+
+import time
+
+from rewrite import aparse
+from rewrite.dsl import module
+from rewrite.dsl.egraph import EGraph, rewrites, weighted
+
+source = open('examples/fusion').read() + """
+fusion = innermost(fuse)
+"""
+
+passes = weighted(dict(map=10, filter=10, zipwith=10, concat=10))
+
+LIMIT = 20000
+
+def maps(n, xs='xs'):
+    for i in range(n):
+        xs = 'map(f%d, %s)' % (i, xs)
+    return xs
+
+def zipwith(n):
+    return 'map(k, zipwith(z, map(g, %s), map(g, ys)))' % maps(n)
+
+def cost(t):
+    eg = EGraph()
+    return eg.extract(eg.add(t), passes)[1]
+
+def main():
+    env = module(source)
+    rules = rewrites(env)
+
+    for name, chain in (('maps', maps), ('zipwith', zipwith)):
+        print '%s, at most %d e-nodes' % (name, LIMIT)
+        print '  %3s %10s %10s %8s %10s  %-10s %6s %6s' % (
+            'n', 'innermost', 'e-graph', 'nodes', 'classes', 'stop',
+            'cost', 'egcost')
+        for n in (2, 4, 6, 8, 10, 12, 16):
+            t = aparse(chain(n))
+
+            start = time.time()
+            fused = env['fusion'](t)
+            st = time.time() - start
+
+            start = time.time()
+            eg = EGraph()
+            root = eg.add(t)
+            stop = eg.saturate(rules, nodes=LIMIT)
+            best, c = eg.extract(root, passes)
+            et = time.time() - start
+
+            print '  %3d %8.2f ms %8.1f ms %8d %10d  %-10s %6d %6d' % (
+                n, st * 1e3, et * 1e3, len(eg.memo), len(eg.classes),
+                stop, cost(fused), c)
+
+if __name__ == '__main__':
+    main()
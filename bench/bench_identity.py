@@ -0,0 +1,62 @@
+"""
+Passes of topdown(try(E)), bottomup(try(E)) and innermost(E) over a
+large term on which E never fires, and over the same term with one
+leaf in a hundred rewritten, with the applications the traversals built.
+
+    PYTHONPATH=. python bench/bench_identity.py
+"""
+
+import random
+import time
+
+from rewrite.terms import aappl, aterm
+from rewrite.dsl import module
+from rewrite.dsl import traverse
+
+source = """
+E : A() -> B()
+
+t = topdown(try(E))
+b = bottomup(try(E))
+i = innermost(E)
+"""
+
+def term(depth, rng, hits):
+    if depth == 0:
+        if rng.random() < hits:
+            return aappl(aterm('A', None), [])
+        return aappl(aterm('C', None), [])
+    return aappl(aterm(rng.choice(['F', 'G']), None),
+                 [term(depth - 1, rng, hits) for i in range(3)])
+
+def timeit(f, n=3):
+    best = float('inf')
+    for i in range(n):
+        start = time.time()
+        res = f()
+        best = min(best, time.time() - start)
+    return best, res
+
+def main():
+    interpreted = module(source)
+    compiled = module(source, compiled=True)
+
+    allocations = getattr(traverse, 'allocations', None)
+
+    for hits in (0, 0.01):
+        subject = term(9, random.Random(0), hits)
+        print '%d nodes, %.0f%% rewritten' % (subject.size, hits * 100)
+
+        for name in ('t', 'b', 'i'):
+            for kind, mod in [('interpreted', interpreted), ('compiled', compiled)]:
+                if allocations:
+                    allocations.reset()
+                res = mod[name].apply(subject)
+                built = allocations.count if allocations else None
+                t, _ = timeit(lambda: mod[name].apply(subject), 5)
+                print '  %-10s %-12s %8.1f ms  %s built%s' % (
+                    mod[name].combinator.__class__.__name__.lower(), kind,
+                    t * 1e3, built, ', same term' if res is subject else '')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Throughput of topdown, bottomup and innermost over lists of a million
+elements, interpreted and compiled: as a native list rewritten in a
+batch, as a native list stepped through element by element, and as
+the Cons/Nil encoding lists were wrapped in before the traversals
+entered lists.
+
+    PYTHONPATH=. python bench/bench_lists.py
+"""
+
+import sys
+import time
+
+from rewrite.terms import AAppl, ATerm, AList, AInt, aappl, aterm
+from rewrite.dsl import module
+from rewrite.dsl import traverse
+
+source = """
+E : A() -> B()
+E : 0 -> 1
+
+t = topdown(try(E))
+b = bottomup(try(E))
+i = innermost(E)
+"""
+
+def consed(xs):
+    cons = ATerm('Cons')
+    t = aappl(aterm('Nil', None), [])
+    for x in reversed(xs):
+        t = AAppl(cons, (x, t))
+    return t
+
+def timeit(f, n=3):
+    best = float('inf')
+    for i in range(n):
+        start = time.time()
+        res = f()
+        best = min(best, time.time() - start)
+    return best, res
+
+def main():
+    n = int(sys.argv[1]) if sys.argv[1:] else 10 ** 6
+    interpreted = module(source)
+    compiled = module(source, compiled=True)
+
+    a, c = aappl(aterm('A', None), []), aappl(aterm('C', None), [])
+    workloads = [
+        ('constructors', [a, c, c, c] * (n / 4)),
+        ('integers', [AInt(k % 4) for k in xrange(n)]),
+    ]
+
+    batch = traverse.BATCH
+    for name, xs in workloads:
+        print '%s, %d elements, one in four rewritten' % (name, len(xs))
+        native, cons = AList(xs), consed(xs)
+        for s in ('t', 'b', 'i'):
+            for kind, mod in [('interpreted', interpreted), ('compiled', compiled)]:
+                apply = mod[s].apply
+                bt, _ = timeit(lambda: apply(native))
+                traverse.BATCH = float('inf')
+                try:
+                    et, _ = timeit(lambda: apply(native))
+                finally:
+                    traverse.BATCH = batch
+                ct, _ = timeit(lambda: apply(cons))
+                print '  %-10s %-12s batch %6.2f M/s   stepped %6.2f M/s   cons %6.2f M/s  ( %.1fx, %.1fx )' % (
+                    mod[s].combinator.__class__.__name__.lower(), kind,
+                    n / bt / 1e6, n / et / 1e6, n / ct / 1e6, et / bt, ct / bt)
+
+if __name__ == '__main__':
+    main()
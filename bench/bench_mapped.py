@@ -0,0 +1,92 @@
+"""
+Resident memory and time to first rewrite when loading a large term.
+
+Writes the same term as text, as a binary stream and as a mapped file,
+then in a fresh interpreter per format loads it and applies a rule at
+the root.
+
+    PYTHONPATH=. python bench/bench_mapped.py
+"""
+
+import os
+import sys
+import time
+import tempfile
+import subprocess
+
+from rewrite import aparse
+from rewrite.terms import aappl, aterm, aint
+from rewrite.dsl import module
+from rewrite import binary, mapped
+
+DEPTH = 18
+
+rules = """
+Q : Query(x, y) -> Plan(y, x)
+"""
+
+def build():
+    spine = aterm('Node', None)
+    counter = [0]
+    def go(d):
+        if d == 0:
+            counter[0] += 1
+            return aint(counter[0])
+        return aappl(spine, [go(d-1), go(d-1)])
+    return aappl(aterm('Query', None), [go(DEPTH), go(DEPTH)])
+
+def rss():
+    """ Current resident set size in MB ( Linux only ). """
+    with open('/proc/self/status') as fd:
+        for line in fd:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024.0
+
+def measure(fmt, path):
+    mod = module(rules)
+    base = rss()
+
+    start = time.time()
+    if fmt == 'text':
+        with open(path) as fd:
+            term = aparse(fd.read())
+    elif fmt == 'binary':
+        with open(path, 'rb') as fd:
+            term = binary.load(fd)
+    else:
+        term = mapped.load(path)
+    res = mod['Q'](term)
+    elapsed = time.time() - start
+
+    print '%-8s %8.3f s  %8.1f MB' % (fmt, elapsed, rss() - base)
+
+def main():
+    if len(sys.argv) == 3:
+        return measure(*sys.argv[1:])
+
+    term = build()
+    tmp = tempfile.mkdtemp()
+    paths = {
+        'text'   : os.path.join(tmp, 'term.txt'),
+        'binary' : os.path.join(tmp, 'term.baf'),
+        'mapped' : os.path.join(tmp, 'term.tam'),
+    }
+
+    with open(paths['text'], 'w') as fd:
+        fd.write(str(term))
+    with open(paths['binary'], 'wb') as fd:
+        binary.dump(term, fd)
+    with open(paths['mapped'], 'wb') as fd:
+        mapped.dump(term, fd)
+
+    print '%d nodes' % term.size
+    print '%-8s %10s  %11s' % ('format', 'first rewrite', 'resident')
+    for fmt in ('text', 'binary', 'mapped'):
+        subprocess.check_call([sys.executable, __file__, fmt, paths[fmt]])
+
+    for path in paths.values():
+        os.unlink(path)
+    os.rmdir(tmp)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Per-match cost of compiled matchers against the interpreted unfold.
+
+Every rule of the eval and dnff examples is matched against a pool of
+random formulas.
+
+    PYTHONPATH=. python bench/bench_match.py
+"""
+
+import random
+import time
+
+from rewrite.terms import aappl, aterm
+from rewrite.matching import unfold, NoMatch, FAIL
+from rewrite.dsl import module
+
+def random_term(depth, rng):
+    if depth == 0 or rng.random() < 0.2:
+        return rng.choice([
+            aappl(aterm('True', None), []),
+            aappl(aterm('False', None), []),
+            aterm('p%d' % rng.randint(0, 3), None),
+        ])
+    if rng.random() < 0.3:
+        return aappl(aterm('Not', None), [random_term(depth - 1, rng)])
+    op = rng.choice(['And', 'Or', 'Eq', 'Impl'])
+    return aappl(aterm(op, None), [random_term(depth - 1, rng),
+                                   random_term(depth - 1, rng)])
+
+def interpreted(rule, s):
+    try:
+        for b in unfold(rule.lpat, rule.left, s):
+            pass
+        return True
+    except NoMatch:
+        return False
+
+def compiled(rule, s):
+    return rule.match(s) is not FAIL
+
+def timeit(f, n=3):
+    best = float('inf')
+    for i in range(n):
+        start = time.time()
+        res = f()
+        best = min(best, time.time() - start)
+    return best, res
+
+def run(name, rules, subjects):
+    def loop(match):
+        hits = 0
+        for rule in rules:
+            for s in subjects:
+                hits += match(rule, s)
+        return hits
+
+    n = len(rules) * len(subjects)
+    it, ihits = timeit(lambda: loop(interpreted))
+    ct, chits = timeit(lambda: loop(compiled))
+    assert ihits == chits
+
+    print '%s ( %d rules, %d matches, %d hits )' % (name, len(rules), n, chits)
+    print '  %-12s %8.2f us/match' % ('unfold', it / n * 1e6)
+    print '  %-12s %8.2f us/match  ( %.1fx )' % ('compiled', ct / n * 1e6, it / ct)
+
+def main():
+    rng = random.Random(0)
+    subjects = [random_term(4, rng) for i in range(5000)]
+    run('eval', module(open('examples/eval').read())['Eval'].rules, subjects)
+
+    mod = module(open('examples/dnff').read())
+    rules = mod['E'].rules + mod['D'].rules
+    subjects = [aappl(aterm(rng.choice(['Dnf', 'DnfR']), None), [s])
+                for s in subjects]
+    run('dnff', rules, subjects)
+
+if __name__ == '__main__':
+    main()
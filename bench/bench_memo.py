@@ -0,0 +1,78 @@
+"""
+innermost(E <+ D) from examples/dnff over nested Eq/Impl formulas,
+without a memo table and with tables of several sizes.
+
+The rules of examples/dnff renormalise each negated subformula from
+scratch, so nesting Eq three deep already takes minutes without a memo
+and is left out.
+
+    PYTHONPATH=. python bench/bench_memo.py
+"""
+
+import sys
+import random
+import time
+
+from rewrite.terms import aappl, aterm
+from rewrite.dsl import module
+
+def atom(i):
+    return aappl(aterm('Atom', None), [aterm('p%d' % i, None)])
+
+def formula(depth, rng, ops):
+    if depth == 0 or rng.random() < 0.15:
+        return atom(rng.randint(0, 3))
+    return aappl(aterm(rng.choice(ops), None),
+                 [formula(depth - 1, rng, ops), formula(depth - 1, rng, ops)])
+
+def dnf(t):
+    return aappl(aterm('Dnf', None), [t])
+
+def timeit(f, n=3):
+    best = float('inf')
+    for i in range(n):
+        start = time.time()
+        res = f()
+        best = min(best, time.time() - start)
+    return best, res
+
+def workloads():
+    rng = random.Random(0)
+
+    yield 'Eq(p0, p1)', [dnf(aappl(aterm('Eq', None), [atom(0), atom(1)]))]
+    yield 'Eq(Impl(p0, p1), Eq(p2, p3))', [dnf(
+        aappl(aterm('Eq', None), [aappl(aterm('Impl', None), [atom(0), atom(1)]),
+                                  aappl(aterm('Eq', None), [atom(2), atom(3)])]))]
+    yield '20 random over Eq, Impl', [
+        dnf(formula(2, rng, ['Eq', 'Impl'])) for i in range(20)]
+    yield '20 random over Eq, Impl, And, Or', [
+        dnf(formula(2, rng, ['Eq', 'Impl', 'And', 'Or'])) for i in range(20)]
+
+def main():
+    sys.setrecursionlimit(10000)
+    source = open('examples/dnff').read()
+
+    for name, terms in workloads():
+        plain = module(source)['dnf']
+        pt, expected = timeit(lambda: map(plain, terms))
+
+        print '%s, %d nodes in results' % (name, sum(t.size for t in expected))
+        print '  %-12s %10.2f ms' % ('no memo', pt * 1e3)
+
+        for size in (256, 4096, 65536):
+            memoized = module(source, memo=size)['dnf']
+
+            # each run starts from an empty table
+            def run():
+                memoized.memo.clear()
+                return map(memoized, terms)
+
+            mt, res = timeit(run)
+            assert res == expected
+            table = memoized.memo
+            print '  %-12s %10.2f ms  ( %.1fx )  %d hits, %d misses, %d evictions' % (
+                'memo %d' % size, mt * 1e3, pt / mt,
+                table.hits, table.misses, table.evictions)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Strategies of examples/ and the DSL tests as written against after
+the algebraic optimizer, and after pruning the rules which cannot fire
+on the input.
+
+The dnf strategy of examples/dnf, repeat(topdown(E) <+ id), can never
+fail and so never terminates; it is left out.
+
+    PYTHONPATH=. python bench/bench_optimize.py
+"""
+
+import sys
+import random
+import time
+
+from rewrite.terms import aappl, aterm
+from rewrite.dsl import module
+from rewrite.dsl.optimize import Optimizer, show, symbols
+import rewrite.dsl.combinators as comb
+
+# strategies of rewrite/tests/test_codegen.py and test_optimize.py
+tests = """
+E : Not(Not(x)) -> x
+E : Not(And(x, y)) -> Or(Not(x), Not(y))
+D : Or(x, x) -> x
+D : Impl(x, y) -> Or(Not(x), y)
+
+t = topdown(try(E))
+b = bottomup(try(E <+ D))
+i = innermost(E <+ D)
+r = repeat(all(E) ; some(D)) <+ fail
+t0 = try(try(E))
+t3 = id ; E ; id
+t4 = all(E) ; all(D)
+t5 = innermost(E <+ D) ; innermost(E <+ D)
+"""
+
+def formula(depth, rng, leaves, ops, negate=True):
+    if depth == 0 or rng.random() < 0.15:
+        return rng.choice(leaves)()
+    if negate and rng.random() < 0.2:
+        return aappl(aterm('Not', None), [formula(depth - 1, rng, leaves, ops)])
+    return aappl(aterm(rng.choice(ops), None),
+                 [formula(depth - 1, rng, leaves, ops, negate),
+                  formula(depth - 1, rng, leaves, ops, negate)])
+
+def atom(rng):
+    return lambda: aappl(aterm('Atom', None), [aterm('p%d' % rng.randint(0, 9), None)])
+
+def const(name):
+    return lambda: aappl(aterm(name, None), [])
+
+def timeit(f, n=3):
+    best = float('inf')
+    for i in range(n):
+        start = time.time()
+        res = f()
+        best = min(best, time.time() - start)
+    return best, res
+
+def workloads():
+    rng = random.Random(0)
+
+    terms = [aappl(aterm('Dnf', None),
+                   [formula(3, rng, [atom(rng)], ['And', 'Or'])])
+             for i in range(200)]
+    yield 'examples/dnff', open('examples/dnff').read(), ['dnf'], terms
+
+    leaves = [const('True'), const('False'), lambda: aterm('p', None)]
+    terms = [formula(8, rng, leaves, ['And', 'Or', 'Impl'])
+             for i in range(200)]
+    yield 'examples/eval', open('examples/eval').read(), ['eval'], terms
+
+    terms = [const(rng.choice('AB'))() for i in range(20000)]
+    yield 'examples/foo', open('examples/foo').read(), ['a0', 'a1', 'a2'], terms
+
+    # without Not no rule of E can fire
+    leaves = [lambda: aterm('p', None), lambda: aterm('q', None)]
+    terms = [formula(8, rng, leaves, ['And', 'Or'], False) for i in range(200)]
+    yield 'tests', tests, ['t', 'b', 'i', 'r', 't0', 't3', 't4', 't5'], terms
+
+def main():
+    sys.setrecursionlimit(10000)
+
+    for path, source, names, terms in workloads():
+        plain = module(source)
+        optimized = module(source, optimized=True)
+
+        names_in = set()
+        for t in terms:
+            symbols(t, names_in)
+
+        for name in names:
+            opt = Optimizer(names_in)
+            pruned = opt(plain[name])
+            prune = comb.lift(pruned)
+
+            pt, pres = timeit(lambda: map(plain[name].apply, terms))
+            ot, ores = timeit(lambda: map(optimized[name].apply, terms))
+            rt, rres = timeit(lambda: map(prune, terms))
+            assert pres == ores == rres
+
+            n = len(terms)
+            print '%s %s, %d terms' % (path, name, n)
+            print '  %-10s %10.0f terms/s    %s' % ('written', n / pt, show(plain[name]))
+            print '  %-10s %10.0f terms/s  ( %.1fx )  %s' % (
+                'optimized', n / ot, pt / ot, show(optimized[name]))
+            print '  %-10s %10.0f terms/s  ( %.1fx )  %s' % (
+                'pruned', n / rt, pt / rt, show(pruned))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Parallel pools of 1, 2, 4 and 8 workers against a single process over
+wide Table(...) terms: all(eval) and topdown(try(Eval)) from
+examples/eval over random boolean columns, where each node is cheap to
+rewrite, and all(dnf) from examples/dnff over random formulas, where
+each column takes many rewrites.
+
+The pools include the cost of sending the columns to the workers and
+their results back, but not of starting the workers.
+
+    PYTHONPATH=. python bench/bench_parallel.py [columns]
+"""
+
+import sys
+import random
+import time
+import multiprocessing
+
+from rewrite.terms import aappl, aterm
+from rewrite.dsl import module
+from rewrite.dsl.combinators import All, Topdown
+from rewrite.dsl.parallel import Pool
+
+source = open('examples/eval').read() + open('examples/dnff').read() + """
+step = try(Eval)
+"""
+
+def boolean(depth, rng):
+    if depth == 0 or rng.random() < 0.1:
+        return aappl(aterm(rng.choice(['True', 'False']), None), [])
+    op = rng.choice(['And', 'Or', 'Impl', 'Eq', 'Not'])
+    if op == 'Not':
+        return aappl(aterm(op, None), [boolean(depth - 1, rng)])
+    return aappl(aterm(op, None), [boolean(depth - 1, rng),
+                                   boolean(depth - 1, rng)])
+
+def formula(depth, rng):
+    if depth == 0 or rng.random() < 0.15:
+        return aappl(aterm('Atom', None),
+                     [aterm('p%d' % rng.randint(0, 3), None)])
+    op = rng.choice(['Eq', 'Impl', 'And', 'Or'])
+    return aappl(aterm(op, None), [formula(depth - 1, rng),
+                                   formula(depth - 1, rng)])
+
+def table(cols):
+    return aappl(aterm('Table', None), cols)
+
+def timeit(f, n=3):
+    best = float('inf')
+    for i in range(n):
+        start = time.time()
+        res = f()
+        best = min(best, time.time() - start)
+    return best, res
+
+def workloads(n):
+    rng = random.Random(0)
+    cheap = table([boolean(6, rng) for i in xrange(n)])
+    heavy = table([aappl(aterm('Dnf', None), [formula(2, rng)])
+                   for i in xrange(n / 20)])
+    yield 'all(eval)', cheap, All, 'all', 'eval'
+    yield 'topdown(try(Eval))', cheap, Topdown, 'topdown', 'step'
+    yield 'all(dnf)', heavy, All, 'all', 'dnf'
+
+def main():
+    n = int(sys.argv[1]) if sys.argv[1:] else 20000
+    print '%d cpus' % multiprocessing.cpu_count()
+
+    env = module(source, compiled=True)
+    for name, subject, local, kind, strategy in workloads(n):
+        print '%s, %d columns, %d nodes' % (name, len(subject.args),
+                                            subject.size)
+        seq = local(env[strategy])
+        base, expected = timeit(lambda: seq(subject))
+        print '  1 process   %7.0f ms' % (base * 1e3)
+        for workers in (1, 2, 4, 8):
+            with Pool(source, workers=workers, threshold=100) as pool:
+                par = getattr(pool, kind)(strategy)
+                t, res = timeit(lambda: par(subject))
+            assert res == expected
+            print '  %d workers   %7.0f ms  ( %.2fx )' % (
+                workers, t * 1e3, base / t)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Throughput of innermost(E <+ D) from examples/dnff under the
+exception based failure protocol against the FAIL sentinel, and
+through the exception raising compatibility interface.
+
+    PYTHONPATH=. python bench/bench_protocol.py
+"""
+
+import sys
+import random
+import time
+
+from rewrite.terms import AAppl, aappl, aterm
+from rewrite.matching import NoMatch
+from rewrite.dsl import module
+from rewrite.dsl.combinators import STFail
+
+#------------------------------------------------------------------------
+# Exception based combinators ( for comparison )
+#------------------------------------------------------------------------
+
+class Choice(object):
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+
+    def __call__(self, t):
+        try:
+            return self.left(t)
+        except (STFail, NoMatch):
+            return self.right(t)
+
+class Seq(object):
+    def __init__(self, s1, s2):
+        self.s1 = s1
+        self.s2 = s2
+
+    def __call__(self, o):
+        return self.s2(self.s1(o))
+
+class Try(object):
+    def __init__(self, s):
+        self.s = s
+
+    def __call__(self, o):
+        try:
+            return self.s(o)
+        except (STFail, NoMatch):
+            return o
+
+class All(object):
+    def __init__(self, s):
+        self.s = s
+
+    def __call__(self, o):
+        if isinstance(o, AAppl):
+            return AAppl(o.spine, map(self.s, o.args))
+        else:
+            return o
+
+class Bottomup(object):
+    def __init__(self, s):
+        self.s = s
+
+    def __call__(self, o):
+        return self.s(All(self)(o))
+
+class Innermost(object):
+    def __init__(self, s):
+        self.s = s
+
+    def __call__(self, o):
+        return Bottomup(Try(Seq(self.s, self)))(o)
+
+#------------------------------------------------------------------------
+
+def random_term(depth, rng):
+    if depth == 0 or rng.random() < 0.15:
+        return aappl(aterm('Atom', None), [aterm('p%d' % rng.randint(0, 9), None)])
+    if rng.random() < 0.2:
+        return aappl(aterm('Not', None), [random_term(depth - 1, rng)])
+    op = rng.choice(['And', 'Or', 'Impl'])
+    return aappl(aterm(op, None), [random_term(depth - 1, rng),
+                                   random_term(depth - 1, rng)])
+
+def timeit(f, n=3):
+    best = float('inf')
+    for i in range(n):
+        start = time.time()
+        res = f()
+        best = min(best, time.time() - start)
+    return best, res
+
+def main():
+    # the exception based innermost nests six frames per level
+    sys.setrecursionlimit(20000)
+
+    mod = module(open('examples/dnff').read())
+
+    rng = random.Random(0)
+    terms = [aappl(aterm('Dnf', None), [random_term(3, rng)]) for i in range(200)]
+
+    legacy = Innermost(Choice(mod['E'].rewrite, mod['D'].rewrite))
+    strategy = mod['dnf']
+
+    lt, lres = timeit(lambda: map(legacy, terms))
+    st, sres = timeit(lambda: map(strategy.apply, terms))
+    ct, cres = timeit(lambda: map(strategy, terms))
+    assert lres == sres == cres
+
+    n = len(terms)
+    print 'innermost(E <+ D), %d terms, %d nodes in results' % (
+        n, sum(t.size for t in sres))
+    print '  %-12s %8.0f terms/s' % ('exceptions', n / lt)
+    print '  %-12s %8.0f terms/s  ( %.1fx )' % ('sentinel', n / st, lt / st)
+    print '  %-12s %8.0f terms/s  ( %.1fx )' % ('wrapper', n / ct, lt / ct)
+
+if __name__ == '__main__':
+    main()
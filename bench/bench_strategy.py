@@ -0,0 +1,76 @@
+"""
+Interpreted against compiled execution of the strategies defined in
+examples/.
+
+The dnf strategy of examples/dnf, repeat(topdown(E) <+ id), can never
+fail and so never terminates; it is left out.
+
+    PYTHONPATH=. python bench/bench_strategy.py
+"""
+
+import sys
+import random
+import time
+
+from rewrite.terms import aappl, aterm
+from rewrite.dsl import module
+
+def formula(depth, rng, leaves, ops):
+    if depth == 0 or rng.random() < 0.15:
+        return rng.choice(leaves)()
+    if rng.random() < 0.2:
+        return aappl(aterm('Not', None), [formula(depth - 1, rng, leaves, ops)])
+    return aappl(aterm(rng.choice(ops), None),
+                 [formula(depth - 1, rng, leaves, ops),
+                  formula(depth - 1, rng, leaves, ops)])
+
+def atom(rng):
+    return lambda: aappl(aterm('Atom', None), [aterm('p%d' % rng.randint(0, 9), None)])
+
+def const(name):
+    return lambda: aappl(aterm(name, None), [])
+
+def timeit(f, n=3):
+    best = float('inf')
+    for i in range(n):
+        start = time.time()
+        res = f()
+        best = min(best, time.time() - start)
+    return best, res
+
+def workloads():
+    rng = random.Random(0)
+
+    terms = [aappl(aterm('Dnf', None),
+                   [formula(3, rng, [atom(rng)], ['And', 'Or', 'Impl'])])
+             for i in range(200)]
+    yield 'examples/dnff', ['dnf'], terms
+
+    leaves = [const('True'), const('False'), lambda: aterm('p', None)]
+    terms = [formula(8, rng, leaves, ['And', 'Or', 'Impl', 'Eq'])
+             for i in range(200)]
+    yield 'examples/eval', ['eval'], terms
+
+    terms = [const(rng.choice('AB'))() for i in range(20000)]
+    yield 'examples/foo', ['a0', 'a1', 'a2'], terms
+
+def main():
+    sys.setrecursionlimit(10000)
+
+    for path, names, terms in workloads():
+        source = open(path).read()
+        interpreted = module(source)
+        compiled = module(source, compiled=True)
+
+        for name in names:
+            it, ires = timeit(lambda: map(interpreted[name].apply, terms))
+            ct, cres = timeit(lambda: map(compiled[name].apply, terms))
+            assert ires == cres
+
+            n = len(terms)
+            print '%s %s, %d terms' % (path, name, n)
+            print '  %-12s %10.0f terms/s' % ('interpreted', n / it)
+            print '  %-12s %10.0f terms/s  ( %.1fx )' % ('compiled', n / ct, it / ct)
+
+if __name__ == '__main__':
+    main()
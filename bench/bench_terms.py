@@ -0,0 +1,85 @@
+"""
+Memory and construction cost of the term representation.
+
+Builds a complete binary term of roughly a million nodes and reports
+bytes per node for the slotted term classes against the dict-backed
+layout they replaced, and for the same term stored in a TermArena.
+
+    PYTHONPATH=. python bench/bench_terms.py
+"""
+
+import sys
+import time
+
+from rewrite.terms import AAppl, AInt, ATerm
+from rewrite.arena import TermArena
+
+DEPTH = 19 # 2**20 - 1 nodes
+
+#------------------------------------------------------------------------
+# Dict-backed layout ( for comparison )
+#------------------------------------------------------------------------
+
+class LegacyAppl(object):
+    def __init__(self, spine, args):
+        self.spine = spine
+        self.args = args
+
+class LegacyInt(object):
+    def __init__(self, val):
+        self.val = val
+
+#------------------------------------------------------------------------
+
+def build(appl, leaf, spine, depth):
+    counter = [0]
+    def go(d):
+        if d == 0:
+            counter[0] += 1
+            return leaf(counter[0])
+        return appl(spine, [go(d-1), go(d-1)])
+    return go(depth)
+
+def footprint(term):
+    """ Bytes held by the nodes of ``term`` and their containers. """
+    total = nodes = 0
+    stack = [term]
+    while stack:
+        t = stack.pop()
+        nodes += 1
+        total += sys.getsizeof(t)
+        if hasattr(t, '__dict__'):
+            total += sys.getsizeof(t.__dict__)
+        args = getattr(t, 'args', None)
+        if args is not None:
+            total += sys.getsizeof(args)
+            stack.extend(args)
+    return total, nodes
+
+def run(name, appl, leaf, spine):
+    start = time.time()
+    term = build(appl, leaf, spine, DEPTH)
+    elapsed = time.time() - start
+
+    total, nodes = footprint(term)
+    print '%-8s %8d nodes %8.1f bytes/node %8.3f s build' % (
+        name, nodes, total / float(nodes), elapsed)
+
+def main():
+    spine = ATerm('f', None)
+    run('dict', LegacyAppl, LegacyInt, spine)
+    run('slots', AAppl, AInt, spine)
+
+    term = build(AAppl, AInt, spine, DEPTH)
+    arena = TermArena()
+    start = time.time()
+    arena.add(term)
+    elapsed = time.time() - start
+
+    # literal payloads are interned Python ints held by the arena
+    total = arena.nbytes() + sum(map(sys.getsizeof, arena.literals))
+    print '%-8s %8d nodes %8.1f bytes/node %8.3f s add' % (
+        'arena', len(arena), total / float(len(arena)), elapsed)
+
+if __name__ == '__main__':
+    main()
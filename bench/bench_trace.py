@@ -0,0 +1,79 @@
+"""
+The cost of tracing: bottomup(repeat(Eval)) from examples/eval over
+random boolean formulas, interpreted, in a module without a trace, in
+one traced to a hook doing nothing and in one writing a derivation log
+to a file, in median times.
+
+    PYTHONPATH=. python bench/bench_trace.py
+"""
+
+import os
+import random
+import time
+import tempfile
+
+from rewrite.terms import aappl, aterm
+from rewrite.dsl import module
+from rewrite.dsl.tracing import Tracer, DerivationLog, summary
+
+source = open('examples/eval').read()
+
+def formula(depth, rng):
+    if depth == 0 or rng.random() < 0.1:
+        return aappl(aterm(rng.choice(['True', 'False']), None), [])
+    op = rng.choice(['And', 'Or', 'Impl', 'Eq', 'Not'])
+    if op == 'Not':
+        return aappl(aterm(op, None), [formula(depth - 1, rng)])
+    return aappl(aterm(op, None), [formula(depth - 1, rng),
+                                   formula(depth - 1, rng)])
+
+def medians(fs, n=11):
+    # alternating runs, as the drift between separate series of runs
+    # is as large as the differences
+    ts = [[] for f in fs]
+    for i in range(n):
+        for f, t in zip(fs, ts):
+            start = time.time()
+            f()
+            t.append(time.time() - start)
+    return [sorted(t)[n // 2] for t in ts]
+
+def main():
+    rng = random.Random(0)
+    terms = [formula(10, rng) for i in range(200)]
+    print 'eval, %d terms, %d nodes' % (len(terms), sum(t.size for t in terms))
+
+    plain = module(source)['eval']
+    expected = map(plain, terms)
+
+    tracer = Tracer(lambda rule, path, before, after: None)
+    hooked = module(source, trace=tracer)['eval']
+    assert map(hooked, terms) == expected
+
+    path = tempfile.mktemp()
+    logger = Tracer()
+    strategy = module(source, trace=logger)['eval']
+    def logged():
+        with open(path, 'wb') as fd:
+            with DerivationLog(fd) as log:
+                logger.hooks = [log]
+                for t in terms:
+                    logger.run(strategy, t)
+
+    pt, ht, lt = medians([lambda: map(plain, terms),
+                          lambda: map(hooked, terms), logged])
+
+    with open(path, 'rb') as fd:
+        runs, steps, rules = summary(fd)
+    size = os.path.getsize(path)
+    os.remove(path)
+
+    print '  %-12s %8.1f ms' % ('untraced', pt * 1e3)
+    for name, t in (('hook', ht), ('log', lt)):
+        print '  %-12s %8.1f ms  ( %+.1f%%, %.2f us a step )' % (
+            name, t * 1e3, (t / pt - 1) * 100, (t - pt) / steps * 1e6)
+    print '  %d steps of %d rules, log of %d bytes, %.1f bytes a step' % (
+        steps, len(rules), size, float(size) / steps)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Topdown, bottomup and innermost over deep lists and wide bushy terms,
+recursing through Python frames against the explicit stack traversal
+engine, interpreted and compiled.
+
+The recursive traversals run under the default recursion limit and
+fail on the deeper lists.
+
+    PYTHONPATH=. python bench/bench_traverse.py
+"""
+
+import time
+
+from rewrite.terms import AAppl, ATerm, aappl, aterm
+from rewrite.matching import FAIL
+from rewrite.dsl import module
+from rewrite.dsl.combinators import lift, all_args
+
+source = """
+E : A() -> B()
+E : Nil() -> End()
+
+t = topdown(try(E))
+b = bottomup(try(E))
+i = innermost(E)
+"""
+
+#------------------------------------------------------------------------
+# Recursive traversals ( for comparison )
+#------------------------------------------------------------------------
+
+class Topdown(object):
+    def __init__(self, s):
+        self.s = lift(s)
+
+    def __call__(self, o):
+        val = self.s(o)
+        if val is FAIL:
+            return FAIL
+        return all_args(self, val)
+
+class Bottomup(object):
+    def __init__(self, s):
+        self.s = lift(s)
+
+    def __call__(self, o):
+        val = all_args(self, o)
+        if val is FAIL:
+            return FAIL
+        return self.s(val)
+
+class Innermost(object):
+    def __init__(self, s):
+        self.s = lift(s)
+
+    def __call__(self, o):
+        val = all_args(self, o)
+        res = self.s(val)
+        if res is FAIL:
+            return val
+        return self(res)
+
+#------------------------------------------------------------------------
+
+def deep(n):
+    cons = ATerm('Cons')
+    t = aappl(aterm('Nil', None), [])
+    a = aappl(aterm('A', None), [])
+    for i in xrange(n):
+        t = AAppl(cons, (a, t))
+    return t
+
+def bushy(depth):
+    if depth == 0:
+        return aappl(aterm('A', None), [])
+    return aappl(aterm('Node', None), [bushy(depth - 1), bushy(depth - 1),
+                                       aterm('x', None)])
+
+def timeit(f, n=3):
+    best = float('inf')
+    for i in range(n):
+        start = time.time()
+        res = f()
+        best = min(best, time.time() - start)
+    return best, res
+
+def main():
+    interpreted = module(source)
+    compiled = module(source, compiled=True)
+    E = interpreted['E']
+
+    recursive = {
+        't': Topdown(lift(interpreted['t'].combinator.s)),
+        'b': Bottomup(lift(interpreted['b'].combinator.s)),
+        'i': Innermost(E),
+    }
+
+    workloads = [
+        ('list 100', deep(100)),
+        ('list 10^4', deep(10 ** 4)),
+        ('list 10^6', deep(10 ** 6)),
+        ('bushy depth 12', bushy(12)),
+    ]
+
+    for name, term in workloads:
+        print '%s, %d nodes' % (name, term.size)
+        n = 1 if term.size > 10 ** 5 else 3
+        for s in ('t', 'b', 'i'):
+            try:
+                rt, _ = timeit(lambda: recursive[s](term), n)
+                rec = '%8.0f knodes/s' % (term.size / rt / 1e3)
+            except RuntimeError:
+                rt, rec = None, '%17s' % 'RuntimeError'
+            it, _ = timeit(lambda: interpreted[s].apply(term), n)
+            ct, _ = timeit(lambda: compiled[s].apply(term), n)
+
+            ratio = lambda t: '( %.1fx )' % (rt / t) if rt else ''
+            print '  %-10s recursive %s  engine %8.0f knodes/s %-9s compiled %8.0f knodes/s %s' % (
+                interpreted[s].combinator.__class__.__name__.lower(), rec,
+                term.size / it / 1e3, ratio(it), term.size / ct / 1e3, ratio(ct))
+
+if __name__ == '__main__':
+    main()
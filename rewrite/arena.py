@@ -0,0 +1,430 @@
+"""
+Array-backed term storage.
+
+A TermArena stores terms as integer node ids into a set of typed
+columns rather than as one Python object per node::
+
+    kind     node kind ( TERM, APPL, INT, ... )
+    sym      interned symbol id of the constructor or name
+    first    offset of the first child in the ``kids`` column
+    arity    number of children
+    payload  literal id, annotation id or spine node
+
+Literals and symbols are interned, so a node costs a fixed number of
+machine words regardless of its type. Nodes are immutable once added;
+rewriting appends new nodes and shares unchanged children. Strategies
+of the DSL are run over node ids by rewrite.dsl.arena.
+"""
+
+from array import array
+
+from rewrite.terms import AAppl, ATerm, AInt, AReal, AString, AList, \
+    ATuple, APlaceholder, termtype
+
+#------------------------------------------------------------------------
+# Node Kinds
+#------------------------------------------------------------------------
+
+TERM, ANNOT, APPL, INT, REAL, STR, LIST, TUPLE, PLACEHOLDER = range(9)
+
+literal_kinds = {
+    AInt    : INT,
+    AReal   : REAL,
+    AString : STR,
+}
+
+literal_types = dict((v, k) for k, v in literal_kinds.items())
+
+LITERALS = (INT, REAL, STR)
+
+# the kinds whose children the traversals rewrite
+CONGRUENT = (APPL, LIST, TUPLE)
+
+# node kinds accepted by each placeholder type, mirrors
+# rewrite.matching.placeholders
+placeholder_kinds = {
+    'appl'        : (APPL,),
+    'str'         : (STR,),
+    'int'         : (INT,),
+    'real'        : (REAL,),
+    'term'        : (TERM, ANNOT, APPL, STR, INT, REAL),
+    'placeholder' : (PLACEHOLDER,),
+    'list'        : (LIST,),
+}
+
+#------------------------------------------------------------------------
+# Arena
+#------------------------------------------------------------------------
+
+class TermArena(object):
+
+    def __init__(self):
+        self.kind    = array('b')
+        self.sym     = array('i')
+        self.first   = array('i')
+        self.arity   = array('i')
+        self.payload = array('i')
+        self.kids    = array('i')
+
+        self.symbols  = []
+        self.symtab   = {}
+        self.literals = []
+        self.littab   = {}
+
+        # annotations are arbitrary tuples of terms and are kept as
+        # Python objects
+        self.annotations = []
+
+        self._leaves = {}
+        self._consts = {}
+
+    def __len__(self):
+        return len(self.kind)
+
+    def __repr__(self):
+        return '<TermArena: %d nodes, %d symbols>' % (len(self), len(self.symbols))
+
+    def nbytes(self):
+        """ Bytes used by the node columns. """
+        cols = (self.kind, self.sym, self.first, self.arity,
+                self.payload, self.kids)
+        return sum(len(c) * c.itemsize for c in cols)
+
+    #--------------------------------------------------------------------
+    # Interning
+    #--------------------------------------------------------------------
+
+    def symbol(self, name):
+        try:
+            return self.symtab[name]
+        except KeyError:
+            sid = self.symtab[name] = len(self.symbols)
+            self.symbols.append(name)
+            return sid
+
+    def literal(self, val):
+        key = (type(val), val)
+        try:
+            return self.littab[key]
+        except KeyError:
+            lid = self.littab[key] = len(self.literals)
+            self.literals.append(val)
+            return lid
+
+    #--------------------------------------------------------------------
+    # Construction
+    #--------------------------------------------------------------------
+
+    def node(self, kind, sym, kids, payload=-1):
+        nid = len(self.kind)
+        self.kind.append(kind)
+        self.sym.append(sym)
+        self.first.append(len(self.kids))
+        self.arity.append(len(kids))
+        self.payload.append(payload)
+        self.kids.extend(kids)
+        return nid
+
+    def leaf(self, sym):
+        """ The shared TERM node for symbol id ``sym``. """
+        try:
+            return self._leaves[sym]
+        except KeyError:
+            nid = self._leaves[sym] = self.node(TERM, sym, ())
+            return nid
+
+    def appl(self, spine, kids):
+        """ Build an APPL node from the node id of its spine. """
+        if self.kind[spine] == TERM:
+            return self.node(APPL, self.sym[spine], kids)
+        else:
+            return self.node(APPL, self.sym[spine], kids, spine)
+
+    def rebuild(self, nid, kids):
+        """
+        A node like ``nid`` with children ``kids``, or ``nid`` itself
+        if the children are unchanged.
+        """
+        f = self.first[nid]
+        if list(self.kids[f:f+self.arity[nid]]) == kids:
+            return nid
+        return self.node(self.kind[nid], self.sym[nid], kids, self.payload[nid])
+
+    def add(self, term):
+        """
+        Add a term object to the arena and return its node id. Shared
+        subterms of ``term`` are stored once.
+        """
+        memo = {}
+        results = []
+        stack = [(term, False)]
+
+        while stack:
+            t, ready = stack.pop()
+
+            if not ready:
+                if id(t) in memo:
+                    results.append(memo[id(t)])
+                    continue
+                stack.append((t, True))
+                for c in reversed(self._subterms(t)):
+                    stack.append((c, False))
+                continue
+
+            n = len(self._subterms(t))
+            if n:
+                kids = results[-n:]
+                del results[-n:]
+            else:
+                kids = []
+
+            nid = memo[id(t)] = self._emit(t, kids)
+            results.append(nid)
+
+        return results[0]
+
+    def _subterms(self, t):
+        if isinstance(t, (AAppl, AList, ATuple)):
+            return t.args
+        elif isinstance(t, ATerm) and not isinstance(t.term, str):
+            return (t.term,)
+        elif isinstance(t, APlaceholder) and t.args is not None:
+            return t.args
+        else:
+            return ()
+
+    def _emit(self, t, kids):
+        cls = termtype(t)
+        if cls is AAppl:
+            spine = t.spine
+            if spine.annotation is None and isinstance(spine.term, str):
+                return self.node(APPL, self.symbol(spine.term), kids)
+            else:
+                return self.node(APPL, self.symbol(str(spine.term)), kids,
+                                 self.add(spine))
+        elif cls is ATerm:
+            if t.annotation is None and isinstance(t.term, str):
+                return self.leaf(self.symbol(t.term))
+            aid = len(self.annotations)
+            self.annotations.append(t.annotation)
+            if isinstance(t.term, str):
+                return self.node(ANNOT, self.symbol(t.term), (), aid)
+            else:
+                return self.node(ANNOT, -1, kids, aid)
+        elif cls in literal_kinds:
+            return self.node(literal_kinds[cls], -1, (), self.literal(t.val))
+        elif cls is AList:
+            return self.node(LIST, -1, kids)
+        elif cls is ATuple:
+            return self.node(TUPLE, -1, kids)
+        elif cls is APlaceholder:
+            return self.node(PLACEHOLDER, self.symbol(t.type), kids,
+                             int(t.args is not None))
+        else:
+            raise TypeError('Not a term: %r' % (t,))
+
+    def constant(self, pat):
+        """ Node id for a ground pattern, added once per arena. """
+        try:
+            return self._consts[id(pat)][1]
+        except KeyError:
+            nid = self.add(pat)
+            self._consts[id(pat)] = (pat, nid)
+            return nid
+
+    #--------------------------------------------------------------------
+    # Access
+    #--------------------------------------------------------------------
+
+    def children(self, nid):
+        f = self.first[nid]
+        return self.kids[f:f+self.arity[nid]]
+
+    def name(self, nid):
+        sym = self.sym[nid]
+        return self.symbols[sym] if sym >= 0 else None
+
+    def spine(self, nid):
+        """ Node id of the spine of an APPL node. """
+        spine = self.payload[nid]
+        if spine >= 0:
+            return spine
+        return self.leaf(self.sym[nid])
+
+    def equal(self, a, b):
+        """ Structural equality of two nodes, ignoring annotations. """
+        stack = [(a, b)]
+        while stack:
+            a, b = stack.pop()
+            if a == b:
+                continue
+            kind = self.kind[a]
+            if kind in (TERM, ANNOT) and self.kind[b] in (TERM, ANNOT):
+                pass
+            elif kind != self.kind[b]:
+                return False
+            if (self.sym[a] != self.sym[b] or
+                self.arity[a] != self.arity[b]):
+                return False
+            if kind in LITERALS:
+                if self.literals[self.payload[a]] != self.literals[self.payload[b]]:
+                    return False
+            elif kind == PLACEHOLDER and self.payload[a] != self.payload[b]:
+                return False
+            stack.extend(zip(self.children(a), self.children(b)))
+        return True
+
+    #--------------------------------------------------------------------
+    # Materialization
+    #--------------------------------------------------------------------
+
+    def term(self, nid):
+        """ Rebuild the term object for node ``nid``. """
+        memo = {}
+        stack = [(nid, False)]
+
+        while stack:
+            n, ready = stack.pop()
+            if n in memo:
+                continue
+            if not ready:
+                stack.append((n, True))
+                stack.extend((k, False) for k in self.children(n))
+                continue
+            memo[n] = self._object(n, [memo[k] for k in self.children(n)])
+
+        return memo[nid]
+
+    def _object(self, n, args):
+        kind = self.kind[n]
+        if kind == APPL:
+            spine = self.payload[n]
+            if spine >= 0:
+                spine = self.term(spine)
+            else:
+                spine = ATerm(self.symbols[self.sym[n]], None)
+            return AAppl(spine, args)
+        elif kind == TERM:
+            return ATerm(self.symbols[self.sym[n]], None)
+        elif kind == ANNOT:
+            annotation = self.annotations[self.payload[n]]
+            if args:
+                return ATerm(args[0], annotation)
+            return ATerm(self.symbols[self.sym[n]], annotation)
+        elif kind in LITERALS:
+            return literal_types[kind](self.literals[self.payload[n]])
+        elif kind == LIST:
+            return AList(args)
+        elif kind == TUPLE:
+            return ATuple(args)
+        elif kind == PLACEHOLDER:
+            return APlaceholder(self.symbols[self.sym[n]],
+                                args if self.payload[n] else None)
+        else:
+            raise ValueError('Unknown node kind %d' % kind)
+
+    #--------------------------------------------------------------------
+    # Matching
+    #--------------------------------------------------------------------
+
+    def unfold(self, pat, nid, captures):
+        """
+        Match the pattern ``pat`` ( as produced by ``freev`` ) against
+        node ``nid``, appending captured node ids to ``captures`` in
+        the same order as ``rewrite.matching.unfold``.
+        """
+        kind = self.kind[nid]
+        cls = type(pat)
+
+        if cls in literal_kinds:
+            return kind in LITERALS and \
+                self.literals[self.payload[nid]] == pat.val
+
+        elif cls is ATerm:
+            return (kind == TERM and pat.annotation is None and
+                    self.symbols[self.sym[nid]] == pat.term)
+
+        elif cls is AAppl:
+            if kind != APPL or self.arity[nid] != len(pat.args):
+                return False
+            if self.symbols[self.sym[nid]] != pat.spine.term:
+                return False
+            for p, k in zip(pat.args, self.children(nid)):
+                if not self.unfold(p, k, captures):
+                    return False
+            return True
+
+        elif cls is ATuple:
+            if kind != TUPLE or self.arity[nid] != len(pat.args):
+                return False
+            for p, k in zip(pat.args, self.children(nid)):
+                if not self.unfold(p, k, captures):
+                    return False
+            return True
+
+        elif cls is APlaceholder:
+            # <appl(...)>
+            if pat.args:
+                if kind != APPL:
+                    return False
+                captures.append(self.spine(nid))
+                for p, k in zip(pat.args, self.children(nid)):
+                    if not self.unfold(p, k, captures):
+                        return False
+                return True
+            # <term>
+            elif kind in placeholder_kinds[pat.type]:
+                captures.append(nid)
+                return True
+
+        return False
+
+    def fold(self, pat, vals):
+        """
+        Build the pattern ``pat`` substituting placeholders left to
+        right from the iterator ``vals``.
+        """
+        cls = type(pat)
+
+        if cls is ATerm or cls in literal_kinds:
+            return self.constant(pat)
+
+        elif cls is AAppl:
+            kids = [self.fold(p, vals) for p in pat.args]
+            return self.appl(self.constant(pat.spine), kids)
+
+        elif cls is ATuple:
+            return self.node(TUPLE, -1, [self.fold(p, vals) for p in pat.args])
+
+        elif cls is AList:
+            return self.node(LIST, -1, [self.fold(p, vals) for p in pat.args])
+
+        elif cls is APlaceholder:
+            # <appl(...)>
+            if pat.args:
+                spine = next(vals)
+                return self.appl(spine, [self.fold(p, vals) for p in pat.args])
+            # <term>
+            else:
+                return next(vals)
+
+        raise NotImplementedError
+
+    def rewrite(self, rule, nid):
+        """
+        Apply a ``Rule`` to node ``nid``, returning the id of the result
+        or None if the rule does not match.
+        """
+        captures = []
+        if not self.unfold(rule.left, nid, captures):
+            return None
+
+        bindings = {}
+        for bind, capture in zip(rule.lpat, captures):
+            if bind in bindings:
+                if not self.equal(bindings[bind], capture):
+                    return None
+            else:
+                bindings[bind] = capture
+
+        return self.fold(rule.right, iter([bindings[b] for b in rule.rpat]))
@@ -0,0 +1,483 @@
+"""
+Binary term exchange format.
+
+A compact encoding of terms modeled on the StrategoXT binary and
+shared ATerm formats. A stream starts with a short header followed by
+a sequence of records, each either a symbol definition or a complete
+term::
+
+    stream : MAGIC VERSION record*
+    record : SYM len bytes          -- define the next symbol id
+           | term                   -- a top level term
+
+Symbols used by a term are defined before it, so a reader always has
+the symbol table it needs up front. Integers are zigzag varints, reals
+are 8 byte IEEE doubles. Every term written is numbered in postorder
+and a repeated occurrence of the same object is written as a back
+reference to that number, so sharing in the input is preserved on
+reading. The numbering restarts with each top level term, which lets
+readers and writers stream an unbounded sequence of terms in bounded
+memory.
+"""
+
+import struct
+from cStringIO import StringIO
+
+from rewrite.terms import AAppl, ATerm, AInt, AReal, AString, AList, \
+    ATuple, APlaceholder, termtype, termtypes
+
+MAGIC   = 'PBAF'
+VERSION = 1
+
+# record tags
+SYM      = 0x01
+REF      = 0x02
+TERM     = 0x03 # name
+APPL     = 0x04 # sym arity args*
+APPLS    = 0x05 # arity spine args*
+INT      = 0x06 # zigzag varint
+REAL     = 0x07 # double
+STR      = 0x08 # len bytes
+LIST     = 0x09 # n args*
+TUPLE    = 0x0A # n args*
+ANNOT    = 0x0B # term annotation
+ANNOTS   = 0x0C # sym annotation
+PH       = 0x0D # sym n+1 args* ( 0 for no args )
+
+# annotation values
+NONE     = 0x0E
+PYTUPLE  = 0x0F # n items*
+
+BUFSIZE = 1 << 16
+
+double = struct.Struct('<d')
+
+class BinaryFormatError(Exception):
+    pass
+
+#------------------------------------------------------------------------
+# Writer
+#------------------------------------------------------------------------
+
+class Writer(object):
+    """
+    Write terms incrementally to a file object opened in binary mode.
+    """
+
+    magic = MAGIC
+    version = VERSION
+
+    def __init__(self, fd):
+        self.fd = fd
+        self.buf = bytearray(self.magic)
+        self.buf.append(self.version)
+        self.symbols = {}
+
+    def write(self, term):
+        self._symbols(term)
+        self._refs = {}
+        self._keep = []
+        self._term(term)
+        del self._refs, self._keep
+
+        if len(self.buf) >= BUFSIZE:
+            self.flush()
+
+    def flush(self):
+        self.fd.write(self.buf)
+        del self.buf[:]
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+    #--------------------------------------------------------------------
+
+    def _varint(self, n):
+        buf = self.buf
+        while n > 0x7F:
+            buf.append((n & 0x7F) | 0x80)
+            n >>= 7
+        buf.append(n)
+
+    def _bytes(self, s):
+        self._varint(len(s))
+        self.buf.extend(s)
+
+    def _symbol(self, name):
+        if name not in self.symbols:
+            self.symbols[name] = len(self.symbols)
+            self.buf.append(SYM)
+            self._bytes(name)
+
+    def _symbols(self, term):
+        """ Define the symbols of ``term`` ahead of it. """
+        stack = [term]
+        seen = set()
+        while stack:
+            t = stack.pop()
+            if id(t) in seen:
+                continue
+            seen.add(id(t))
+
+            if isinstance(t, AAppl):
+                stack.append(t.spine)
+                stack.extend(t.args)
+            elif isinstance(t, ATerm):
+                if isinstance(t.term, str):
+                    self._symbol(t.term)
+                else:
+                    stack.append(t.term)
+                if t.annotation is not None:
+                    stack.append(t.annotation)
+            elif isinstance(t, (AList, ATuple)):
+                stack.extend(t.args)
+            elif isinstance(t, tuple):
+                stack.extend(t)
+            elif isinstance(t, APlaceholder):
+                self._symbol(t.type)
+                if t.args is not None:
+                    stack.extend(t.args)
+
+    def _term(self, t):
+        buf = self.buf
+        refs = self._refs
+        keep = self._keep
+        symbols = self.symbols
+        varint = self._varint
+
+        # the work left, pushed in reverse: a term to write, an
+        # annotation to write as a 1-tuple, or a term to number once its
+        # arguments are written as a 1-list
+        stack = [t]
+        while stack:
+            t = stack.pop()
+            cls = type(t)
+
+            if cls is list:
+                t = t[0]
+                refs[id(t)] = len(keep)
+                keep.append(t)
+                continue
+
+            if cls is tuple:
+                t = t[0]
+                if t is None:
+                    buf.append(NONE)
+                    continue
+                elif isinstance(t, tuple):
+                    buf.append(PYTUPLE)
+                    varint(len(t))
+                    stack.extend([(a,) for a in reversed(t)])
+                    continue
+
+            ref = refs.get(id(t))
+            if ref is not None:
+                buf.append(REF)
+                varint(ref)
+                continue
+
+            if cls not in termtypes:
+                cls = termtype(t)
+
+            if cls is AAppl:
+                args = t.args
+                spine = t.spine
+                if spine.annotation is None and isinstance(spine.term, str):
+                    buf.append(APPL)
+                    varint(symbols[spine.term])
+                    if not args:
+                        # a constant, the most common leaf
+                        buf.append(0)
+                        refs[id(t)] = len(keep)
+                        keep.append(t)
+                        continue
+                    varint(len(args))
+                    stack.append([t])
+                    stack.extend(reversed(args))
+                else:
+                    buf.append(APPLS)
+                    varint(len(args))
+                    stack.append([t])
+                    stack.extend(reversed(args))
+                    stack.append(spine)
+                continue
+
+            elif cls is ATerm:
+                if t.annotation is None and isinstance(t.term, str):
+                    buf.append(TERM)
+                    varint(symbols[t.term])
+                else:
+                    stack.append([t])
+                    stack.append((t.annotation,))
+                    if isinstance(t.term, str):
+                        buf.append(ANNOTS)
+                        varint(symbols[t.term])
+                    else:
+                        buf.append(ANNOT)
+                        stack.append(t.term)
+                    continue
+
+            elif cls is AInt:
+                buf.append(INT)
+                n = t.val
+                varint((n << 1) if n >= 0 else ((-n << 1) - 1))
+
+            elif cls is AReal:
+                buf.append(REAL)
+                buf.extend(double.pack(t.val))
+
+            elif cls is AString:
+                buf.append(STR)
+                self._bytes(t.val)
+
+            elif cls is AList or cls is ATuple:
+                buf.append(LIST if cls is AList else TUPLE)
+                varint(len(t.args))
+                stack.append([t])
+                stack.extend(reversed(t.args))
+                continue
+
+            elif cls is APlaceholder:
+                buf.append(PH)
+                varint(symbols[t.type])
+                if t.args is None:
+                    varint(0)
+                else:
+                    varint(len(t.args) + 1)
+                    stack.append([t])
+                    stack.extend(reversed(t.args))
+                    continue
+
+            else:
+                raise TypeError('Not a term: %r' % (t,))
+
+            # a leaf, numbered at once and kept alive so its id stays
+            # unique
+            refs[id(t)] = len(keep)
+            keep.append(t)
+
+#------------------------------------------------------------------------
+# Reader
+#------------------------------------------------------------------------
+
+class Reader(object):
+    """
+    Read terms incrementally from a file object opened in binary mode.
+    Iterating a reader yields each top level term in turn.
+    """
+
+    magic = MAGIC
+    version = VERSION
+
+    def __init__(self, fd):
+        self.fd = fd
+        self.buf = bytearray()
+        self.pos = 0
+        self.symbols = []
+
+        magic = self.magic
+        header = self._read(len(magic) + 1)
+        if header[:len(magic)] != magic:
+            raise BinaryFormatError('Not a binary term stream')
+        if header[-1] != self.version:
+            raise BinaryFormatError('Unsupported version %d' % header[-1])
+
+    def read(self):
+        """ Read the next term, raising EOFError at the end of stream. """
+        while True:
+            if not self._fill(1):
+                raise EOFError()
+            if self.buf[self.pos] == SYM:
+                self.pos += 1
+                self.symbols.append(str(self._read(self._varint())))
+            else:
+                self._refs = []
+                term = self._term()
+                del self._refs
+                return term
+
+    def __iter__(self):
+        while True:
+            try:
+                yield self.read()
+            except EOFError:
+                return
+
+    #--------------------------------------------------------------------
+
+    def _fill(self, n):
+        """ Ensure ``n`` bytes are buffered, False at end of stream. """
+        while len(self.buf) - self.pos < n:
+            chunk = self.fd.read(BUFSIZE)
+            if not chunk:
+                return False
+            del self.buf[:self.pos]
+            self.pos = 0
+            self.buf.extend(chunk)
+        return True
+
+    def _read(self, n):
+        if not self._fill(n):
+            raise BinaryFormatError('Truncated stream')
+        pos = self.pos
+        self.pos = pos + n
+        return self.buf[pos:pos+n]
+
+    def _byte(self):
+        if self.pos >= len(self.buf) and not self._fill(1):
+            raise BinaryFormatError('Truncated stream')
+        b = self.buf[self.pos]
+        self.pos += 1
+        return b
+
+    def _varint(self):
+        n = shift = 0
+        while True:
+            b = self._byte()
+            n |= (b & 0x7F) << shift
+            if b < 0x80:
+                return n
+            shift += 7
+
+    def _term(self):
+        byte = self._byte
+        varint = self._varint
+        symbols = self.symbols
+        refs = self._refs
+
+        # the terms begun, as [ tag, arguments wanted, arguments read,
+        # symbol or spine ] frames
+        stack = []
+        while True:
+            tag = byte()
+            if tag == NONE or tag == PYTUPLE:
+                # annotation values, only read where the frame on top
+                # wants an annotation
+                top = stack[-1] if stack else None
+                if top is None or not (top[0] == ANNOTS or top[0] == PYTUPLE
+                                       or top[0] == ANNOT and top[2]):
+                    raise BinaryFormatError('Unknown tag 0x%02x' % tag)
+
+            if tag == NONE:
+                t = None
+
+            elif tag == PYTUPLE:
+                n = varint()
+                if n:
+                    stack.append([PYTUPLE, n, [], None])
+                    continue
+                t = ()
+
+            elif tag == REF:
+                t = refs[varint()]
+
+            elif tag == APPL:
+                spine = ATerm(symbols[varint()], None)
+                n = varint()
+                if n:
+                    stack.append([APPL, n, [], spine])
+                    continue
+                t = AAppl(spine, [])
+                refs.append(t)
+
+            elif tag == APPLS:
+                stack.append([APPLS, varint() + 1, [], None])
+                continue
+
+            elif tag == TERM:
+                t = ATerm(symbols[varint()], None)
+                refs.append(t)
+
+            elif tag == ANNOTS:
+                stack.append([ANNOTS, 1, [], symbols[varint()]])
+                continue
+
+            elif tag == ANNOT:
+                stack.append([ANNOT, 2, [], None])
+                continue
+
+            elif tag == INT:
+                n = varint()
+                t = AInt((n >> 1) if not n & 1 else -((n + 1) >> 1))
+                refs.append(t)
+
+            elif tag == REAL:
+                t = AReal(double.unpack(bytes(self._read(8)))[0])
+                refs.append(t)
+
+            elif tag == STR:
+                t = AString(str(self._read(varint())))
+                refs.append(t)
+
+            elif tag == LIST or tag == TUPLE:
+                n = varint()
+                if n:
+                    stack.append([tag, n, [], None])
+                    continue
+                t = AList([]) if tag == LIST else ATuple([])
+                refs.append(t)
+
+            elif tag == PH:
+                type = symbols[varint()]
+                n = varint()
+                if n > 1:
+                    stack.append([PH, n - 1, [], type])
+                    continue
+                t = APlaceholder(type, [] if n else None)
+                refs.append(t)
+
+            else:
+                raise BinaryFormatError('Unknown tag 0x%02x' % tag)
+
+            # the frames the value completes
+            while stack:
+                tag, n, args, extra = stack[-1]
+                args.append(t)
+                if len(args) < n:
+                    break
+                stack.pop()
+                if tag == PYTUPLE:
+                    t = tuple(args)
+                    continue
+                elif tag == APPL:
+                    t = AAppl(extra, args)
+                elif tag == APPLS:
+                    t = AAppl(args[0], args[1:])
+                elif tag == ANNOTS:
+                    t = ATerm(extra, args[0])
+                elif tag == ANNOT:
+                    t = ATerm(args[0], args[1])
+                elif tag == LIST:
+                    t = AList(args)
+                elif tag == TUPLE:
+                    t = ATuple(args)
+                else:
+                    t = APlaceholder(extra, args)
+                refs.append(t)
+            else:
+                return t
+
+#------------------------------------------------------------------------
+# Toplevel
+#------------------------------------------------------------------------
+
+def dump(term, fd):
+    with Writer(fd) as w:
+        w.write(term)
+
+def dumps(term):
+    fd = StringIO()
+    dump(term, fd)
+    return fd.getvalue()
+
+def load(fd):
+    return Reader(fd).read()
+
+def loads(s):
+    return load(StringIO(s))
@@ -0,0 +1,202 @@
+"""
+Strategies over the node ids of a TermArena.
+
+A strategy over term objects is translated into the equivalent
+strategy over node ids of an arena::
+
+    arena = TermArena()
+    nid = translate(arena, mod['t'])(arena.add(term))
+
+Combinators which only sequence their arguments work unchanged on node
+ids, rule blocks and traversals are replaced by their arena
+counterparts. The traversals run on an explicit stack, so they go as
+deep as the term does.
+"""
+
+from rewrite.arena import CONGRUENT
+from rewrite.matching import NoMatch, FAIL
+import combinators as comb
+from toplevel import Strategy, RuleBlock, Rule
+
+#------------------------------------------------------------------------
+# Arena Combinators
+#------------------------------------------------------------------------
+
+class Rules(object):
+    def __init__(self, arena, rules):
+        self.arena = arena
+        self.rules = rules
+
+    def __call__(self, nid):
+        for rule in self.rules:
+            res = self.arena.rewrite(rule, nid)
+            if res is not None:
+                return res
+        raise NoMatch()
+
+class All(object):
+    def __init__(self, arena, s):
+        self.arena = arena
+        self.s = s
+
+    def __call__(self, nid):
+        arena = self.arena
+        if arena.kind[nid] in CONGRUENT:
+            return arena.rebuild(nid, map(self.s, arena.children(nid)))
+        else:
+            return nid
+
+class Some(object):
+    def __init__(self, arena, s):
+        self.arena = arena
+        self.s = s
+
+    def __call__(self, nid):
+        arena = self.arena
+        if arena.kind[nid] in CONGRUENT:
+            kids = []
+            for k in arena.children(nid):
+                try:
+                    kids.append(self.s(k))
+                except comb.STFail:
+                    kids.append(k)
+            return arena.rebuild(nid, kids)
+        else:
+            raise comb.STFail()
+
+# the traversals keep a frame ( node, children, results ) for each node
+# on the path from the root, its children are rewritten left to right
+
+class Topdown(object):
+    def __init__(self, arena, s):
+        self.arena = arena
+        self.s = s
+
+    def __call__(self, nid):
+        arena, s = self.arena, self.s
+        nid = s(nid)
+        stack = [(nid, children(arena, nid), [])]
+        while True:
+            nid, kids, out = stack[-1]
+            if len(out) < len(kids):
+                k = s(kids[len(out)])
+                stack.append((k, children(arena, k), []))
+                continue
+            stack.pop()
+            if kids:
+                nid = arena.rebuild(nid, out)
+            if not stack:
+                return nid
+            stack[-1][2].append(nid)
+
+class Bottomup(object):
+    def __init__(self, arena, s):
+        self.arena = arena
+        self.s = s
+
+    def __call__(self, nid):
+        arena, s = self.arena, self.s
+        stack = [(nid, children(arena, nid), [])]
+        while True:
+            nid, kids, out = stack[-1]
+            if len(out) < len(kids):
+                k = kids[len(out)]
+                stack.append((k, children(arena, k), []))
+                continue
+            stack.pop()
+            if kids:
+                nid = arena.rebuild(nid, out)
+            nid = s(nid)
+            if not stack:
+                return nid
+            stack[-1][2].append(nid)
+
+class Innermost(object):
+    def __init__(self, arena, s):
+        self.arena = arena
+        self.s = s
+        self._s = comb.lift(s)
+
+    def __call__(self, nid):
+        # a node rewritten takes the place of its frame, to be
+        # normalised in turn
+        arena, s = self.arena, self._s
+        stack = [(nid, children(arena, nid), [])]
+        while True:
+            nid, kids, out = stack[-1]
+            if len(out) < len(kids):
+                k = kids[len(out)]
+                stack.append((k, children(arena, k), []))
+                continue
+            stack.pop()
+            if kids:
+                nid = arena.rebuild(nid, out)
+            res = s(nid)
+            if res is not FAIL:
+                stack.append((res, children(arena, res), []))
+                continue
+            if not stack:
+                return nid
+            stack[-1][2].append(nid)
+
+class Debug(object):
+    def __init__(self, arena, s):
+        self.arena = arena
+        self.s = s
+
+    def __call__(self, nid):
+        res = self.s(nid)
+        print self.arena.term(res)
+        return res
+
+def children(arena, nid):
+    # the children a traversal rewrites
+    if arena.kind[nid] in CONGRUENT:
+        return arena.children(nid)
+    return ()
+
+#------------------------------------------------------------------------
+# Translation
+#------------------------------------------------------------------------
+
+# combinators which only sequence their arguments work unchanged on
+# node ids, traversals are replaced by their arena counterparts
+traversals = {
+    comb.All       : All,
+    comb.Some      : Some,
+    comb.Topdown   : Topdown,
+    comb.Bottomup  : Bottomup,
+    comb.Innermost : Innermost,
+    comb.Debug     : Debug,
+}
+
+def translate(arena, s):
+    """
+    Translate a strategy over term objects into the equivalent
+    strategy over node ids of ``arena``.
+    """
+    t = lambda x: translate(arena, x)
+
+    if isinstance(s, Strategy):
+        return t(s.combinator)
+    elif isinstance(s, RuleBlock):
+        return Rules(arena, s.rules)
+    elif isinstance(s, Rule):
+        return Rules(arena, [s])
+    elif type(s) in traversals:
+        return traversals[type(s)](arena, t(s.s))
+    elif isinstance(s, comb.Choice):
+        return comb.Choice(t(s.left), t(s.right))
+    elif isinstance(s, comb.Seq):
+        return comb.Seq(t(s.s1), t(s.s2))
+    elif isinstance(s, comb.Try):
+        return comb.Try(t(s.s))
+    elif isinstance(s, comb.Repeat):
+        r = comb.Repeat(t(s.p))
+        r.cycles = s.cycles
+        return r
+    elif isinstance(s, comb.Ternary):
+        return comb.Ternary(t(s.s1), t(s.s2), t(s.s3))
+    else:
+        # identity, fail and plain functions
+        return s
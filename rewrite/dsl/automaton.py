@@ -0,0 +1,210 @@
+"""
+Left-to-right pattern matching automata for rule blocks.
+
+Following Graf, "Left-to-right tree pattern matching" ( RTA 1991 ),
+the left hand sides of a block are flattened into their preorder
+symbol strings, with ``*`` standing for a variable::
+
+    f(g(x), a)   =>   f/2 g/1 * a/0
+
+A state of the automaton is the set of ( rule, remaining string )
+items still alive after reading a prefix of the subject in preorder.
+Reading a symbol advances the items expecting it, and expands a ``*``
+into one ``_`` per argument of the subject node so that wildcard items
+keep pace with the others. A ``*`` only reads the kinds of term a
+variable binds, while ``_`` ( inside a subterm already bound ) reads
+anything. Every node of the subject is read at most once, and subtrees
+where every live item is at a wildcard are skipped without being read
+at all. The items left when the subject is consumed
+are the rules which match it structurally.
+
+States are built lazily as subjects reach them, so only the part of
+the automaton a workload exercises is ever constructed. Symbols no
+item in a state mentions share a single transition, which keeps the
+number of transitions bounded by the patterns rather than the input.
+
+Bindings of a matching rule are read off the subject along the paths
+of its variables, then checked for non-linear equalities in rule
+order; the first rule whose checks pass wins.
+"""
+
+from rewrite.terms import AAppl, ATerm, AInt, AReal, AString, ATuple, \
+    APlaceholder
+from rewrite.matching import placeholders, FAIL
+from codegen import compile_matcher
+
+STAR = '*'
+ANY  = '_'
+
+# subjects a <term> variable can bind
+WILDCARD = placeholders['term']
+
+#------------------------------------------------------------------------
+# Symbols
+#------------------------------------------------------------------------
+
+# Symbols are ( kind, name, arity ) triples. The name of a literal is
+# its value ( so 1 and 1.0 coincide as in aterm_zip ) and that of a
+# constant its term and annotation. An application symbol with no name
+# is an as-pattern head, which reads any application of its arity.
+
+def symbol(t):
+    if isinstance(t, AAppl):
+        return ('appl', t.spine.term, len(t.args))
+    elif isinstance(t, (AInt, AReal, AString)):
+        return ('literal', t.val, 0)
+    elif isinstance(t, ATerm):
+        return ('term', (t.term, t.annotation), 0)
+    elif isinstance(t, ATuple):
+        return ('tuple', None, len(t.args))
+    else:
+        return ('other', None, 0)
+
+def flatten(p, out):
+    """ The preorder symbol string of a ``freev`` pattern. """
+    if isinstance(p, AAppl):
+        out.append(('appl', p.spine.term, len(p.args)))
+    elif isinstance(p, (AInt, AReal, AString)):
+        out.append(('literal', p.val, 0))
+    elif isinstance(p, ATerm):
+        out.append(('term', (p.term, p.annotation), 0))
+    elif isinstance(p, ATuple):
+        out.append(('tuple', None, len(p.args)))
+    elif isinstance(p, APlaceholder):
+        # <appl(...)>
+        if p.args:
+            out.append(('appl', None, len(p.args)))
+        # <term>
+        else:
+            out.append(STAR)
+            return out
+    else:
+        # lists never match
+        return None
+
+    for a in getattr(p, 'args', ()):
+        if flatten(a, out) is None:
+            return None
+    return out
+
+def reads(head, sym):
+    return head == sym or (head[0] == 'appl' and head[1] is None and
+                           sym[0] == 'appl' and head[2] == sym[2])
+
+#------------------------------------------------------------------------
+# Automaton
+#------------------------------------------------------------------------
+
+class State(object):
+    __slots__ = ('items', 'trans', 'expects', 'skip', 'accept')
+
+    def __init__(self, items):
+        self.items = items
+        self.trans = {}
+        self.expects = set(rest[0] for r, rest in items if rest)
+        # every live item is at a wildcard
+        self.skip = bool(self.expects) and self.expects <= set([STAR, ANY])
+        self.accept = tuple(sorted(r for r, rest in items if not rest))
+
+class Automaton(object):
+    """
+    A matching automaton for the left hand sides ``patterns``, each a
+    ( ``freev`` pattern, capture names ) pair, tried in order.
+    """
+
+    def __init__(self, patterns):
+        self.states = {}
+        self.extract = []
+
+        items = []
+        for i, (pattern, lpat) in enumerate(patterns):
+            string = flatten(pattern, [])
+            if string is not None:
+                items.append((i, tuple(string)))
+            self.extract.append(compile_matcher(pattern, lpat, check=False))
+
+        self.dead = self.state(())
+        self.start = self.state(tuple(items))
+
+    def __len__(self):
+        return len(self.states)
+
+    def state(self, items):
+        key = frozenset(items)
+        try:
+            return self.states[key]
+        except KeyError:
+            st = self.states[key] = State(items)
+            return st
+
+    def step(self, st, sym):
+        """ The state reached from ``st`` on reading ``sym``. """
+        kind, name, arity = sym
+
+        # names no item expects share one transition
+        if sym not in st.expects:
+            sym = (kind, None, arity)
+
+        try:
+            return st.trans[sym]
+        except KeyError:
+            pass
+
+        items = []
+        for r, rest in st.items:
+            head = rest[0]
+            if head is ANY or (head is STAR and kind in ('appl', 'literal', 'term')):
+                items.append((r, (ANY,) * arity + rest[1:]))
+            elif head is STAR:
+                continue
+            elif reads(head, sym):
+                items.append((r, rest[1:]))
+
+        nxt = st.trans[sym] = self.state(tuple(items))
+        return nxt
+
+    def skipped(self, st, wild):
+        """
+        The state reached from ``st`` on skipping a subtree, ``wild``
+        if it is a term a variable can bind.
+        """
+        key = (STAR, wild)
+        try:
+            return st.trans[key]
+        except KeyError:
+            nxt = st.trans[key] = self.state(tuple(
+                (r, rest[1:]) for r, rest in st.items
+                if wild or rest[0] is ANY))
+            return nxt
+
+    def candidates(self, subject):
+        """ The rules matching ``subject`` up to non-linear checks. """
+        st = self.start
+        dead = self.dead
+        stack = [subject]
+
+        while stack:
+            t = stack.pop()
+            if st.skip:
+                st = self.skipped(st, isinstance(t, WILDCARD))
+            else:
+                sym = symbol(t)
+                nxt = st.trans.get(sym)
+                st = nxt if nxt is not None else self.step(st, sym)
+                if sym[2]:
+                    stack.extend(reversed(t.args))
+            if st is dead:
+                return ()
+
+        return st.accept
+
+    def match(self, subject):
+        """
+        The index of the first rule matching ``subject`` and its
+        bindings, or ``FAIL``.
+        """
+        for r in self.candidates(subject):
+            values = self.extract[r](subject)
+            if values is not FAIL:
+                return r, values
+        return FAIL
@@ -0,0 +1,153 @@
+"""
+Budgets for strategy runs.
+
+A budget bounds a single run of a strategy by the number of terms its
+rules are tried on, the number of rewrites they make and the wall-clock
+time taken::
+
+    env = module(source, budgets=True)
+    res, exhausted = env['eval'].run(t, Budget(rewrites=10000, seconds=0.05))
+
+The rule blocks of a module built with ``budgets`` set share a Meter,
+which counts against the budget of the run in progress. Once the
+budget is spent every rule fails, and the loops of repeat, innermost
+and the traversals, which check the meter where they would otherwise
+go on or fail, stop where they are, leaving the terms not yet reached
+as they are: the result is the term reached so far, still a reduct of
+the subject.
+
+As the meter is shared a module runs within one budget at a time. A
+run started while another is in progress, from another thread or from
+within the run itself, raises RuntimeError; runs in parallel each take
+a module of their own.
+
+The meter keeps the number of terms and of rewrites left as plain
+counters, decremented by the rule blocks, and is only called into as
+one runs out. The clock is read every CHECK terms.
+"""
+
+import sys
+import time
+from threading import Lock
+
+UNLIMITED = sys.maxint
+
+# terms tried between readings of the clock
+CHECK = 1024
+
+class Budget(object):
+    """
+    At most ``visits`` terms tried by rules, ``rewrites`` rewrites and
+    ``seconds`` of wall-clock time, each unlimited if None. After a run
+    ``exhausted`` is set if the budget ran out, and ``visited`` and
+    ``rewritten`` hold what was spent.
+    """
+
+    def __init__(self, visits=None, rewrites=None, seconds=None):
+        self.visits = visits
+        self.rewrites = rewrites
+        self.seconds = seconds
+        self.exhausted = False
+        self.visited = 0
+        self.rewritten = 0
+
+    def __repr__(self):
+        return '<Budget: %d visited, %d rewritten%s>' % (
+            self.visited, self.rewritten,
+            ', exhausted' if self.exhausted else '')
+
+class Meter(object):
+    """
+    The terms tried and the rewrites made by the rule blocks of a
+    module, as the number of each left: ``fuel`` terms before ``check``
+    is next called, and ``rewrites`` before ``spent`` is. ``exhausted``
+    is set once the budget of the run is spent.
+    """
+
+    # slots make the counters cheaper to decrement in the rule blocks
+    __slots__ = ('budget', 'fuel', 'granted', 'rewrites', 'limit',
+                 'visited', 'deadline', 'exhausted', 'running')
+
+    def __init__(self):
+        # held from start to stop
+        self.running = Lock()
+        self.budget = None
+        self.fuel = self.granted = UNLIMITED
+        self.rewrites = self.limit = UNLIMITED
+        self.visited = 0
+        self.deadline = None
+        self.exhausted = False
+
+    def start(self, budget):
+        """
+        Count against ``budget`` from now on, raising RuntimeError if a
+        run is already counting.
+        """
+        if not self.running.acquire(False):
+            raise RuntimeError('A run within a budget of the module is in '
+                               'progress')
+        self.budget = budget
+        budget.exhausted = False
+        self.exhausted = False
+        self.visited = 0
+        self.limit = UNLIMITED if budget.rewrites is None else budget.rewrites
+        self.rewrites = self.limit
+        self.deadline = None
+        if budget.seconds is not None:
+            self.deadline = time.time() + budget.seconds
+        self.fuel = self.granted = self.grant()
+
+    def stop(self):
+        """ Stop counting, recording what was spent in the budget. """
+        budget = self.budget
+        if budget is not None:
+            budget.visited = self.visited + self.granted - max(self.fuel, 0)
+            budget.rewritten = self.limit - self.rewrites
+        self.budget = None
+        self.fuel = self.granted = UNLIMITED
+        self.rewrites = UNLIMITED
+        self.exhausted = False
+        if budget is not None:
+            self.running.release()
+        return budget
+
+    def grant(self):
+        # the terms which may be tried before the next check
+        budget = self.budget
+        n = UNLIMITED
+        if budget.visits is not None:
+            n = budget.visits - self.visited
+        if self.deadline is not None:
+            n = min(n, CHECK)
+        return n
+
+    def check(self):
+        """
+        Called by a rule block as the fuel runs out, whether the budget
+        is spent. Otherwise the term being tried is counted against a
+        fresh grant of fuel.
+        """
+        budget = self.budget
+        if budget is None:
+            self.fuel = self.granted = UNLIMITED
+            return False
+        if budget.exhausted:
+            self.fuel = 0
+            return True
+
+        self.visited += self.granted
+        self.fuel = self.granted = 0
+        n = self.grant()
+        if n <= 0 or self.rewrites <= 0 or \
+                self.deadline is not None and time.time() >= self.deadline:
+            budget.exhausted = self.exhausted = True
+            return True
+
+        self.granted = n
+        self.fuel = n - 1
+        return False
+
+    def spent(self):
+        """ Called by a rule block on making the last rewrite allowed. """
+        self.visited += self.granted - self.fuel
+        self.fuel = self.granted = 0
@@ -1,13 +1,20 @@
 import sys
+import time
 import pprint
 import argparse
 import readline
 import traceback
+from collections import deque
 from functools import partial
+from itertools import imap, chain
 
 from rewrite import aparse #, match
-from rewrite.matching import freev
+from rewrite import binary
+from rewrite.matching import freev, FAIL
 from toplevel import module, NoMatch
+from parallel import Pool, WorkerError
+from profiling import Profile, ORDERS
+from tracing import Tracer, DerivationLog, replay, summary
 
 #------------------------------------------------------------------------
 # Toplevel
@@ -34,6 +41,7 @@ help = """
   :let
   :load
   :browse
+  :profile [time|failures|calls|clear]
   :help
 
 """
@@ -47,11 +55,223 @@ def completer(mod, text, state):
 
 prelude = {}
 
+#------------------------------------------------------------------------
+# Streaming
+#------------------------------------------------------------------------
+
+# pyrewrite apply MODULE STRATEGY [files] rewrites a stream of terms,
+# one per line or in the binary format, and writes each result as soon
+# as it is ready, so the input is never held in memory as a whole.
+
+class Prefixed(object):
+    """ The file ``fd`` with ``head``, already read from it, put back. """
+
+    def __init__(self, head, fd):
+        self.head = head
+        self.fd = fd
+
+    def read(self, n):
+        if not self.head:
+            return self.fd.read(n)
+        head, self.head = self.head, ''
+        return head + self.fd.read(max(n - len(head), 0))
+
+def read_terms(fd, parse=aparse):
+    """
+    The terms of ``fd``, binary or one per line, read lazily, each with
+    its line number or its position in the binary stream. The lines
+    are passed through ``parse``, and a line it raises on comes with
+    the exception in place of the term.
+    """
+    head = fd.read(len(binary.MAGIC))
+    if head == binary.MAGIC:
+        for i, t in enumerate(binary.Reader(Prefixed(head, fd))):
+            yield i, t
+        return
+
+    lines = chain((head + fd.readline()).splitlines(), fd)
+    for i, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            t = parse(line)
+        except Exception as e:
+            t = e
+        yield i, t
+
+def guard(f):
+    # pass the lines which failed to parse through as their exceptions
+    def apply(t):
+        return t if isinstance(t, Exception) else f(t)
+    return apply
+
+def apply(source, name, fds, out, err, binary_out=False, workers=0,
+          chunksize=64, trace=None):
+    """
+    Rewrite the terms of the files ``fds`` with the strategy ``name``
+    of the module built from ``source``, writing the results in order
+    to ``out``, in ``workers`` processes or in this one. A term the
+    strategy fails on, and a line which does not parse or a term the
+    strategy raises on in the workers, is reported to ``err`` and left
+    out. Returns the number of terms read, the number failed and the
+    number in error. With ``trace``, a file and no workers, the
+    derivation of each term is logged to it.
+
+    The workers parse the lines read and, unless ``binary_out`` is set,
+    print the results, which for the cheap rules costs more than the
+    rewriting.
+    """
+    # the file and line of each term whose result is yet to come
+    lines = deque()
+    def read(parse=aparse):
+        for fd in fds:
+            path = getattr(fd, 'name', '<input>')
+            for i, t in read_terms(fd, parse):
+                lines.append((path, i))
+                yield t
+
+    pool = log = None
+    if trace is not None:
+        log = DerivationLog(trace)
+        tracer = Tracer(log)
+        strategy = module(source, trace=tracer)[name]
+        results = imap(guard(partial(tracer.run, strategy)), read())
+    elif workers:
+        pool = Pool(source, workers)
+        results = pool.imap(name, read(str.rstrip), chunksize,
+                            not binary_out)
+    else:
+        strategy = module(source, compiled=True)[name]
+        results = imap(guard(strategy.apply), read())
+
+    if binary_out:
+        writer = binary.Writer(out)
+        write = writer.write
+    else:
+        write = lambda t: out.write('%s\n' % t)
+
+    count = failed = errors = 0
+    try:
+        for res in results:
+            path, line = lines.popleft()
+            if res is FAIL:
+                err.write('%s:%d: failed\n' % (path, line))
+                failed += 1
+            elif isinstance(res, WorkerError):
+                err.write('%s:%d: %s: %s\n' % (path, line, res.kind,
+                                               res.message))
+                errors += 1
+            elif isinstance(res, Exception):
+                err.write('%s:%d: %s: %s\n' % (path, line,
+                                               type(res).__name__, res))
+                errors += 1
+            else:
+                write(res)
+            count += 1
+    finally:
+        if pool:
+            pool.terminate()
+    if binary_out:
+        writer.flush()
+    if log is not None:
+        log.flush()
+    out.flush()
+    return count, failed, errors
+
+def apply_main(argv):
+    parser = argparse.ArgumentParser(prog='pyrewrite apply')
+    parser.add_argument('module', help='Module')
+    parser.add_argument('strategy', help='Rule or strategy to apply')
+    parser.add_argument('files', nargs='*',
+                        help='Term files, binary or one term per line '
+                             '( default stdin )')
+    parser.add_argument('-b', '--binary', action='store_true',
+                        help='Write the results in the binary format')
+    parser.add_argument('-j', '--workers', type=int, default=0,
+                        help='Worker processes ( default none )')
+    parser.add_argument('--chunksize', type=int, default=64,
+                        help='Terms sent to a worker at a time')
+    parser.add_argument('--trace', metavar='LOG',
+                        help='Write the derivations to a log to replay')
+
+    # files may follow the options as well as precede them
+    args, rest = parser.parse_known_args(argv)
+    for path in rest:
+        if path.startswith('-') and path != '-':
+            parser.error('unrecognized argument: %s' % path)
+    args.files += rest
+
+    with open(args.module) as fd:
+        source = fd.read()
+    if args.strategy not in module(source):
+        parser.error("No such rule or strategy '%s'" % args.strategy)
+    if args.trace and args.workers:
+        parser.error('Derivations are only traced without workers')
+
+    def files():
+        for path in args.files or ['-']:
+            if path == '-':
+                yield sys.stdin
+            else:
+                with open(path, 'rb') as fd:
+                    yield fd
+
+    trace = open(args.trace, 'wb') if args.trace else None
+    start = time.time()
+    try:
+        count, failed, errors = apply(source, args.strategy, files(),
+                                      sys.stdout, sys.stderr, args.binary,
+                                      args.workers, args.chunksize, trace)
+    finally:
+        if trace is not None:
+            trace.close()
+    elapsed = time.time() - start
+    sys.stderr.write('%d terms, %d failed, %d errors, %.2f s, '
+                     '%.0f terms/s\n' % (count, failed, errors, elapsed,
+                                         count / elapsed if elapsed else 0))
+    if errors:
+        sys.exit(1)
+
+#------------------------------------------------------------------------
+# Replay
+#------------------------------------------------------------------------
+
+# pyrewrite replay LOG summarises a log written by apply --trace, the
+# number of times each rule fired, or lists its steps.
+
+def replay_main(argv):
+    parser = argparse.ArgumentParser(prog='pyrewrite replay')
+    parser.add_argument('log', help='Derivation log')
+    parser.add_argument('-s', '--steps', action='store_true',
+                        help='List each step')
+    parser.add_argument('-t', '--terms', action='store_true',
+                        help='List each step with the whole term after it')
+    args = parser.parse_args(argv)
+
+    with open(args.log, 'rb') as fd:
+        if args.steps or args.terms:
+            for i, (rule, path, before, after, term) in enumerate(replay(fd)):
+                print '%d %s @ %s: %s -> %s' % (
+                    i, rule.split(' : ')[0], list(path), before, after)
+                if args.terms:
+                    print '    %s' % term
+            return
+
+        runs, steps, rules = summary(fd)
+    print '%d runs, %d steps' % (runs, steps)
+    for rule, n in sorted(rules.items(), key=lambda (r, n): (-n, r)):
+        print '%10d %5.1f%%  %s' % (n, 100.0 * n / steps, rule)
+
 #------------------------------------------------------------------------
 # Main interpreter loop
 #------------------------------------------------------------------------
 
 def main():
+    if sys.argv[1:2] == ['apply']:
+        return apply_main(sys.argv[2:])
+    if sys.argv[1:2] == ['replay']:
+        return replay_main(sys.argv[2:])
+
     parser = argparse.ArgumentParser()
     parser.add_argument('module', nargs='?', help='Module')
     parser.add_argument('--noprelude', action='store_true', help='Include prelude')
@@ -61,10 +281,11 @@ def main():
     mod = {}
     last = None
     bindings = {}
+    profile = Profile()
 
     if args.module:
         with open(args.module) as fd:
-            mod = module(fd.read())
+            mod = module(fd.read(), profile=profile)
 
     if not args.noprelude:
         mod.update(prelude)
@@ -129,7 +350,7 @@ def main():
 
         #-----------------------------------------------
         elif line.startswith(':let'):
-            env = module(line[4:], _env=mod)
+            env = module(line[4:], _env=mod, profile=profile)
             mod.update(env)
 
         #-----------------------------------------------
@@ -137,7 +358,7 @@ def main():
             fname = line[5:].strip()
             try:
                 contents = open(fname).read()
-                mod.update(module(contents))
+                mod.update(module(contents, profile=profile))
             except IOError:
                 print "No such module", fname
 
@@ -145,6 +366,16 @@ def main():
         elif line.startswith(':browse'):
             pprint.pprint(mod)
 
+        #-----------------------------------------------
+        elif line.startswith(':profile'):
+            order = line[8:].strip() or 'time'
+            if order == 'clear':
+                profile.clear()
+            elif order in ORDERS:
+                print profile.report(order)
+            else:
+                print "No such order '%s'" % order
+
         #-----------------------------------------------
         elif line.startswith(':help'):
             print help
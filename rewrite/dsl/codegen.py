@@ -0,0 +1,810 @@
+"""
+Code generation for rewrite rules.
+
+Rather than interpreting a pattern through ``aterm_zip`` on every match,
+the left hand side of each rule is compiled into a straight line Python
+function which tests the subject directly and returns the bound values
+as a tuple, or ``FAIL`` if the subject does not match. For the rule::
+
+    E : Not(And(x, y)) -> Or(Not(x), Not(y))
+
+the generated matcher is::
+
+    def match(s):
+        if not isinstance(s, AAppl): return FAIL
+        a0 = s.args
+        if len(a0) != 1 or s.spine.term != 'Not': return FAIL
+        s0 = a0[0]
+        if not isinstance(s0, AAppl): return FAIL
+        a1 = s0.args
+        if len(a1) != 2 or s0.spine.term != 'And': return FAIL
+        c0 = a1[0]
+        if not isinstance(c0, TERM): return FAIL
+        c1 = a1[1]
+        if not isinstance(c1, TERM): return FAIL
+        return (c0, c1, )
+
+and the right hand side is built by::
+
+    def build(v):
+        if sharing_table() is not None:
+            return AAppl(canonical(K0), (AAppl(canonical(K1), (v[0], )), ...))
+        return AAppl(K0, (AAppl(K1, (v[0], )), AAppl(K1, (v[1], )), ))
+
+where ``K0`` and ``K1`` are the spines ``Or`` and ``Not``, created once
+when the rule is compiled. Ground subterms of a right hand side are
+hoisted out in the same way and shared by every application of the
+rule, the guarded expression passes them through the intern table
+when maximal sharing is enabled.
+
+Compiled code is cached on its source, so structurally identical
+patterns are compiled once, and functions whose constants are all terms
+are shared on their source and constants. Constants of any other kind,
+rule blocks or strategies, are bound afresh and never held by the
+cache, which keeps the MAXSIZE most recently used entries.
+"""
+
+import re
+from collections import OrderedDict
+
+from rewrite.terms import AAppl, ATerm, AInt, AReal, AString, AList, \
+    ATuple, APlaceholder, canonical, sharing_table
+from rewrite.matching import placeholders, FAIL
+import combinators as comb
+import traverse
+from traverse import CONGRUENT, STCycle, SHORT, rebuild, leaves, \
+    cycle_innermost
+
+#------------------------------------------------------------------------
+# Compilation
+#------------------------------------------------------------------------
+
+# entries kept in the cache
+MAXSIZE = 1024
+
+# source -> code and ( source, constants ) -> function, least recently
+# used first
+_cache = OrderedDict()
+
+# constants compared by value
+VALUES = (AAppl, ATerm, AInt, AReal, AString, AList, ATuple, APlaceholder,
+          str, int, long, float, bool, type(None))
+
+# names available to all generated code
+builtins = {
+    'FAIL'    : FAIL,
+    'AAppl'   : AAppl,
+    'ATerm'   : ATerm,
+    'ATuple'  : ATuple,
+    'AList'   : AList,
+    'LITERAL' : (AInt, AReal, AString),
+
+    'canonical'     : canonical,
+    'sharing_table' : sharing_table,
+    'CONGRUENT'     : CONGRUENT,
+    'rebuild'       : rebuild,
+    'leaves'        : leaves,
+    'STCycle'       : STCycle,
+
+    'cycle_innermost' : cycle_innermost,
+    'traverse'        : traverse,
+}
+
+for ty, classes in placeholders.items():
+    builtins[ty.upper()] = classes
+
+def compile_function(name, source, namespace):
+    """
+    Compile the source of a function called ``name`` referring to the
+    constants of ``namespace``, caching the code on the source and the
+    function on the source and the constants if they are all values.
+    """
+    key = constkey(source, namespace)
+    if key is not None:
+        fn = cached(key)
+        if fn is not None:
+            return fn
+
+    code = cached(source)
+    if code is None:
+        code = remember(source, compile(source, '<%s>' % name, 'exec'))
+
+    env = dict(builtins)
+    env.update(namespace)
+    exec code in env
+    fn = env[name]
+    fn.source = source
+    if key is not None:
+        remember(key, fn)
+    return fn
+
+def constkey(source, namespace):
+    # terms are keyed on repr since term equality ignores annotations,
+    # and anything else is not keyed at all
+    items = []
+    for k, v in namespace.items():
+        if not isinstance(v, VALUES):
+            return None
+        items.append((k, type(v), repr(v)))
+    return (source, tuple(sorted(items)))
+
+def cached(key):
+    value = _cache.pop(key, None)
+    if value is not None:
+        _cache[key] = value
+    return value
+
+def remember(key, value):
+    while len(_cache) >= MAXSIZE:
+        _cache.popitem(last=False)
+    _cache[key] = value
+    return value
+
+class Namer(object):
+
+    def __init__(self):
+        self.counts = {}
+        self.consts = {}
+
+    def fresh(self, prefix):
+        n = self.counts.get(prefix, 0)
+        self.counts[prefix] = n + 1
+        return '%s%d' % (prefix, n)
+
+    def const(self, value):
+        if type(value) in (str, int, long, bool, type(None)):
+            return repr(value)
+        # anything else is passed by name so that any value round trips
+        name = self.fresh('K')
+        self.consts[name] = value
+        return name
+
+#------------------------------------------------------------------------
+# Matchers
+#------------------------------------------------------------------------
+
+def compile_matcher(pattern, lpat, check=True):
+    """
+    Compile a pattern produced by ``freev`` with the capture names
+    ``lpat`` ( in ``free`` order ) into a matcher function. The matcher
+    returns the values bound to each distinct variable, in order of
+    first occurrence, or ``FAIL``.
+
+    Without ``check`` the subject is assumed to have the shape of the
+    pattern and only the captures and non-linear equalities are
+    computed.
+    """
+    names = Namer()
+    body = []
+    captures = []
+
+    emit = Emitter(body, check)
+    match_pattern(pattern, 's', emit, captures, names)
+
+    # non-linear patterns must bind equal values at every occurrence
+    first = {}
+    bound = []
+    for bind, cap in zip(lpat, captures):
+        if bind in first:
+            body.append('if %s != %s: return FAIL' % (cap, first[bind]))
+        else:
+            first[bind] = cap
+            bound.append(cap)
+
+    body.append('return (%s)' % ''.join(c + ', ' for c in bound))
+
+    source = 'def match(s):\n' + ''.join('    %s\n' % l for l in body)
+    return compile_function('match', source, names.consts)
+
+class Emitter(object):
+    """ Collects bindings, and the tests on them if ``check`` is set. """
+
+    def __init__(self, body, check):
+        self.body = body
+        self.check = check
+
+    def bind(self, line):
+        self.body.append(line)
+
+    def test(self, line):
+        if self.check:
+            self.body.append(line)
+
+def match_pattern(p, v, emit, captures, names):
+    """
+    Emit the tests matching pattern ``p`` against the subject held in
+    the local ``v``, mirroring ``aterm_zip``.
+    """
+    if isinstance(p, (AInt, AReal, AString)):
+        k = names.const(p.val)
+        emit.test('if not isinstance(%s, LITERAL) or %s.val != %s: return FAIL'
+                  % (v, v, k))
+
+    elif isinstance(p, ATerm):
+        k = names.const(p.term)
+        ka = names.const(p.annotation)
+        emit.test('if not isinstance(%s, ATerm) or %s.term != %s or '
+                  '%s.annotation != %s: return FAIL' % (v, v, k, v, ka))
+
+    elif isinstance(p, AAppl):
+        a = names.fresh('a')
+        k = names.const(p.spine.term)
+        emit.test('if not isinstance(%s, AAppl): return FAIL' % v)
+        emit.bind('%s = %s.args' % (a, v))
+        emit.test('if len(%s) != %d or %s.spine.term != %s: return FAIL'
+                  % (a, len(p.args), v, k))
+        match_args(p.args, a, emit, captures, names)
+
+    elif isinstance(p, ATuple):
+        a = names.fresh('a')
+        emit.test('if not isinstance(%s, ATuple): return FAIL' % v)
+        emit.bind('%s = %s.args' % (a, v))
+        emit.test('if len(%s) != %d: return FAIL' % (a, len(p.args)))
+        match_args(p.args, a, emit, captures, names)
+
+    elif isinstance(p, APlaceholder):
+        # <appl(...)>
+        if p.args:
+            a = names.fresh('a')
+            c = names.fresh('c')
+            emit.test('if not isinstance(%s, AAppl): return FAIL' % v)
+            emit.bind('%s = %s.args' % (a, v))
+            emit.test('if len(%s) != %d: return FAIL' % (a, len(p.args)))
+            emit.bind('%s = %s.spine' % (c, v))
+            captures.append(c)
+            match_args(p.args, a, emit, captures, names)
+        # <term>
+        else:
+            c = names.fresh('c')
+            emit.test('if not isinstance(%s, %s): return FAIL'
+                      % (v, p.type.upper()))
+            emit.bind('%s = %s' % (c, v))
+            captures.append(c)
+
+    else:
+        # lists never match, as in aterm_zip
+        emit.bind('return FAIL')
+
+def match_args(args, a, emit, captures, names):
+    for i, ai in enumerate(args):
+        if isinstance(ai, APlaceholder) and not ai.args:
+            # bind captures directly rather than through a temporary
+            c = names.fresh('c')
+            emit.bind('%s = %s[%d]' % (c, a, i))
+            emit.test('if not isinstance(%s, %s): return FAIL'
+                      % (c, ai.type.upper()))
+            captures.append(c)
+        else:
+            s = names.fresh('s')
+            emit.bind('%s = %s[%d]' % (s, a, i))
+            match_pattern(ai, s, emit, captures, names)
+
+#------------------------------------------------------------------------
+# Builders
+#------------------------------------------------------------------------
+
+def compile_builder(pattern, rpat, bound):
+    """
+    Compile the right hand side ``pattern`` produced by ``freev``, with
+    the capture names ``rpat`` ( in ``free`` order ), into a function
+    building the result from the tuple of values returned by a matcher
+    binding the variables ``bound``.
+    """
+    names = Namer()
+    slots = iter(['v[%d]' % bound.index(b) for b in rpat])
+
+    consts = {}
+    expr = build_pattern(pattern, slots, names, consts)
+
+    body = []
+    if consts:
+        shared = re.sub(r'\bK\d+\b', r'canonical(\g<0>)', expr)
+        body.append('if sharing_table() is not None:')
+        body.append('    return %s' % shared)
+    body.append('return %s' % expr)
+
+    source = 'def build(v):\n' + ''.join('    %s\n' % l for l in body)
+    return compile_function('build', source, names.consts)
+
+def build_pattern(p, slots, names, consts):
+    """
+    The expression building pattern ``p``, mirroring ``aterm_splice``.
+    Placeholders take their values from ``slots`` in left to right
+    order, ground subterms become constants.
+    """
+    if ground(p):
+        key = (type(p), repr(p))
+        if key not in consts:
+            k = consts[key] = names.fresh('K')
+            names.consts[k] = canonical(p)
+        return consts[key]
+
+    elif isinstance(p, AAppl):
+        spine = build_pattern(p.spine, slots, names, consts)
+        return 'AAppl(%s, %s)' % (spine, build_args(p.args, slots, names, consts))
+
+    elif isinstance(p, ATuple):
+        return 'ATuple(%s)' % build_args(p.args, slots, names, consts)
+
+    elif isinstance(p, AList):
+        return 'AList(%s)' % build_args(p.args, slots, names, consts)
+
+    elif isinstance(p, APlaceholder):
+        # <appl(...)>
+        if p.args:
+            spine = next(slots)
+            return 'AAppl(%s, %s)' % (spine, build_args(p.args, slots, names, consts))
+        # <term>
+        else:
+            return next(slots)
+
+    else:
+        raise NotImplementedError
+
+def build_args(args, slots, names, consts):
+    return '(%s)' % ''.join(build_pattern(a, slots, names, consts) + ', '
+                            for a in args)
+
+def ground(p):
+    if isinstance(p, APlaceholder):
+        return False
+    elif isinstance(p, (AAppl, ATuple, AList)):
+        return all(ground(a) for a in p.args)
+    else:
+        return True
+
+#------------------------------------------------------------------------
+# Strategies
+#------------------------------------------------------------------------
+
+def compile_strategy(s):
+    """
+    Compile the strategy ``s`` into a single function following the
+    ``apply`` protocol, returning the rewritten term or ``FAIL``.
+    Sequencing, choice and repetition are inlined, each traversal
+    becomes one recursive function with its argument inlined into it,
+    and rule blocks are dispatched inline.
+    """
+    sc = StrategyCompiler()
+    name = sc.function(s)
+    if name in sc.names.consts:
+        # called directly, there is nothing to compile
+        return sc.names.consts[name]
+    source = '\n'.join(sc.functions)
+    fn = compile_function(name, source, sc.names.consts)
+    return fn
+
+class StrategyCompiler(object):
+
+    def __init__(self):
+        self.names = Namer()
+        self.functions = []
+        self.defined = {}
+
+    def function(self, s):
+        """ The name of a generated function applying ``s``. """
+        key = id(s)
+        if key in self.defined:
+            return self.defined[key]
+
+        if getattr(s, 'profile', None) is None:
+            s = strip(s)
+        if (not isinstance(s, comb.Combinator) and not hasattr(s, 'dispatch')
+                and s not in (comb.Id, comb.fail)) \
+                or getattr(s, 'memo', None) is not None \
+                or getattr(s, 'annotations', False) \
+                or getattr(s, 'profile', None) is not None \
+                or getattr(s, 'tracer', None) is not None:
+            # other callables, and memoized combinators, those
+            # descending into annotations, traced traversals or profiled
+            # strategies and rule blocks, are called directly
+            name = self.defined[key] = self.names.fresh('S')
+            self.names.consts[name] = comb.lift(s)
+            return name
+
+        name = self.defined[key] = self.names.fresh('f')
+
+        traversal = type(s) in self.traversals
+        if traversal:
+            body = self.traversals[type(s)](self, s, name)
+        else:
+            body = []
+            out = self.emit(s, 't', body)
+            body.append('return %s' % out)
+
+        self.functions.append('def %s(t):\n%s' % (name, indent(body)))
+        return name
+
+    def emit(self, s, v, body):
+        """
+        Append statements applying ``s`` to the term in local ``v`` to
+        ``body``, returning the local holding the result.
+        """
+        if getattr(s, 'profile', None) is None:
+            s = strip(s)
+        out = self.names.fresh('x')
+
+        if getattr(s, 'profile', None) is not None \
+                or getattr(s, 'tracer', None) is not None:
+            # through the profiling or tracing wrapper
+            k = self.names.fresh('S')
+            self.names.consts[k] = comb.lift(s)
+            body.append('%s = %s(%s)' % (out, k, v))
+
+        elif s is comb.Id:
+            body.append('%s = %s' % (out, v))
+
+        elif s is comb.fail:
+            body.append('%s = FAIL' % out)
+
+        elif isinstance(s, comb.Seq):
+            x = self.emit(s.s1, v, body)
+            rest = []
+            y = self.emit(s.s2, x, rest)
+            rest.append('%s = %s' % (out, y))
+            body.append('if %s is FAIL:' % x)
+            body.append(['%s = FAIL' % out])
+            body.append('else:')
+            body.append(rest)
+
+        elif isinstance(s, comb.Choice):
+            x = self.emit(s.left, v, body)
+            rest = []
+            y = self.emit(s.right, v, rest)
+            rest.append('%s = %s' % (x, y))
+            body.append('if %s is FAIL:' % x)
+            body.append(rest)
+            body.append('%s = %s' % (out, x))
+
+        elif isinstance(s, comb.Try):
+            x = self.emit(s.s, v, body)
+            body.append('%s = %s if %s is FAIL else %s' % (out, v, x, x))
+
+        elif isinstance(s, comb.Repeat) and s.memo is None:
+            loop = []
+            x = self.emit(s.p, out, loop)
+            loop.append('if %s is FAIL: break' % x)
+            loop.append('%s = %s' % (out, x))
+            body.append('%s = %s' % (out, v))
+            if s.cycles:
+                # Brent's check, as in Repeat.apply
+                marked, m, k = [self.names.fresh(c) for c in 'xmk']
+                body.append('%s, %s, %s = %s, 0, 0' % (marked, m, k, v))
+                loop.extend([
+                    '%s += 1' % k,
+                    'if %s >= %d and %s == %s: raise STCycle(%s, %s - %s)' % (
+                        m, SHORT, out, marked, out, k, m),
+                    'if %s == 2 * %s + 1: %s, %s = %s, %s' % (
+                        k, m, marked, m, out, k),
+                ])
+            if s.meter is not None:
+                # stopping with the term reached once the budget is spent
+                meter = self.names.fresh('M')
+                self.names.consts[meter] = s.meter
+                loop.append('if %s.exhausted: break' % meter)
+            body.append('while True:')
+            body.append(loop)
+
+        elif isinstance(s, comb.Ternary):
+            x = self.emit(s.s1, v, body)
+            fail, ok = [], []
+            y = self.emit(s.s2, v, fail)
+            fail.append('%s = %s' % (out, y))
+            z = self.emit(s.s3, x, ok)
+            ok.append('%s = %s' % (out, z))
+            body.append('if %s is FAIL:' % x)
+            body.append(fail)
+            body.append('else:')
+            body.append(ok)
+
+        elif isinstance(s, comb.Debug):
+            x = self.emit(s.s, v, body)
+            body.append('print %s' % x)
+            body.append('%s = %s' % (out, x))
+
+        elif isinstance(s, comb.All) and not s.annotations:
+            f = self.function(s.s)
+            body.extend(all_loop(f, v, out, self.names))
+
+        elif isinstance(s, comb.Some) and not s.annotations:
+            f = self.function(s.s)
+            body.extend(some_loop(f, v, out, self.names))
+
+        elif type(s) in self.traversals:
+            body.append('%s = %s(%s)' % (out, self.function(s), v))
+
+        elif hasattr(s, 'dispatch') and not s.automaton:
+            body.extend(block_loop(s, v, out, self.names))
+
+        else:
+            # anything else following the protocol
+            k = self.names.fresh('S')
+            self.names.consts[k] = comb.lift(s)
+            body.append('%s = %s(%s)' % (out, k, v))
+
+        return out
+
+    #--------------------------------------------------------------------
+    # Traversals
+    #--------------------------------------------------------------------
+
+    # Each traversal is the explicit stack loop of traverse.py with its
+    # argument inlined where it is applied, once in the loop and once
+    # in the loop over long lists of leaves. The meter is read where
+    # the engine reads it.
+
+    def meter(self, s):
+        # the name of the meter of s, or None
+        if s.meter is None:
+            return None
+        meter = self.names.fresh('M')
+        self.names.consts[meter] = s.meter
+        return meter
+
+    def topdown(self, s, name):
+        meter = self.meter(s)
+        apply = []
+        y = self.emit(s.s, 'x', apply)
+        batch = []
+        z = self.emit(s.s, 'x', batch)
+        return [
+            'stack = []',
+            'node, kids, args = None, (t,), []',
+            'x = t',
+            'while True:', apply + [
+                'y = %s' % y,
+                'while True:', [
+                    'if y is FAIL:', spent(meter) + [
+                        'return FAIL',
+                    ],
+                    'if isinstance(y, CONGRUENT) and y.args:', [
+                        'stack.append((node, kids, args))',
+                        'node, kids, args = y, y.args, []',
+                        'if type(y) is AList and leaves(y, False):', [
+                            'for x in kids:', batch + [
+                                'if %s is FAIL or isinstance(%s, CONGRUENT) '
+                                'and %s.args: break' % (z, z, z),
+                                'args.append(%s)' % z,
+                            ],
+                            'if len(args) < len(kids):', [
+                                'y = %s' % z,
+                                'continue',
+                            ],
+                        ],
+                        'else:', [
+                            'x = kids[0]',
+                            'break',
+                        ],
+                    ],
+                    'else:', [
+                        'args.append(y)',
+                    ],
+                    'while len(args) == len(kids):', [
+                        'if not stack: return args[0]',
+                        'r = rebuild(node, kids, args)',
+                        'node, kids, args = stack.pop()',
+                        'args.append(r)',
+                    ],
+                    'x = kids[len(args)]',
+                    'break',
+                ],
+            ],
+        ]
+
+    def bottomup(self, s, name):
+        meter = self.meter(s)
+        apply = []
+        y = self.emit(s.s, 'x', apply)
+        batch = []
+        z = self.emit(s.s, 'k', batch)
+        return descend([
+            # the bottomup traversal of a leaf is s itself
+            'stack.append((node, kids, args))',
+            'node, kids, args = x, x.args, []',
+            'for k in kids:', batch + [
+                'if %s is FAIL:' % z, spent(meter) + [
+                    'return FAIL',
+                ],
+                'args.append(%s)' % z,
+            ],
+            'x = rebuild(node, kids, args)',
+            'node, kids, args = stack.pop()',
+        ], apply + [
+            'if %s is FAIL:' % y, spent(meter, 'x') + [
+                'return FAIL',
+            ],
+            'args.append(%s)' % y,
+        ] + ascend())
+
+    def innermost(self, s, name):
+        meter = self.meter(s)
+        if s.cycles:
+            # the engine's loop, keeping the cycle check out of the
+            # inlined one
+            return ['return cycle_innermost(%s, t, False, %s)' % (
+                self.function(s.s), meter)]
+
+        apply = []
+        y = self.emit(s.s, 'x', apply)
+        batch = []
+        z = self.emit(s.s, 'x', batch)
+        # a leaf rewritten once the budget is spent is left to the loop
+        stop = '' if meter is None else ' or %s.exhausted' % meter
+        return descend([
+            'stack.append((node, kids, args))',
+            'node, kids, args = x, x.args, []',
+            'for x in kids:', [
+                'while True:', batch + [
+                    'if %s is FAIL or isinstance(%s, CONGRUENT) '
+                    'and %s.args%s: break' % (z, z, z, stop),
+                    'x = %s' % z,
+                ],
+                'if %s is not FAIL: break' % z,
+                'args.append(x)',
+            ],
+            'if len(args) < len(kids):', [
+                'x = %s' % z,
+                'continue',
+            ],
+            'x = rebuild(node, kids, args)',
+            'node, kids, args = stack.pop()',
+        ], apply + [
+            'if %s is not FAIL:' % y, spent(meter, y) + [
+                'x = %s' % y,
+                'break',
+            ],
+            'args.append(x)',
+        ] + ascend())
+
+    traversals = {
+        comb.Topdown   : topdown,
+        comb.Bottomup  : bottomup,
+        comb.Innermost : innermost,
+    }
+
+def descend(batch, body):
+    # the bottomup and innermost loops, entering the children of x, or
+    # running batch on a list of leaves, before running body on x
+    return [
+        'stack = []',
+        'node, kids, args = None, (t,), []',
+        'x = t',
+        'while True:', [
+            'if isinstance(x, CONGRUENT) and x.args:', [
+                'if type(x) is AList and leaves(x, False):', batch,
+                'else:', [
+                    'stack.append((node, kids, args))',
+                    'node, kids, args = x, x.args, []',
+                    'x = kids[0]',
+                    'continue',
+                ],
+            ],
+            'while True:', body,
+        ],
+    ]
+
+def spent(meter, last=None):
+    # stopping with the term reached once the budget of meter is spent,
+    # last being the term reached in place of the next child
+    if meter is None:
+        return []
+    stop = ['return traverse.unwind(stack, node, kids, args)']
+    if last is not None:
+        stop.insert(0, 'args.append(%s)' % last)
+    return ['if %s.exhausted:' % meter, stop]
+
+def ascend():
+    # moving on to the next argument, or to the rebuilt parent
+    return [
+        'if len(args) < len(kids):', [
+            'x = kids[len(args)]',
+            'break',
+        ],
+        'if not stack: return args[0]',
+        'x = rebuild(node, kids, args)',
+        'node, kids, args = stack.pop()',
+    ]
+
+def strip(s):
+    # named strategies are inlined
+    while hasattr(s, 'combinator'):
+        s = s.combinator
+    return s
+
+def all_loop(f, v, out, names):
+    """ Statements applying ``f`` to every child of ``v``. """
+    a = names.fresh('a')
+    args = names.fresh('args')
+    return [
+        'if isinstance(%s, CONGRUENT):' % v, [
+            '%s = []' % args,
+            'for %s in %s.args:' % (a, v), [
+                '%s = %s(%s)' % (a, f, a),
+                'if %s is FAIL:' % a, [
+                    '%s = FAIL' % out,
+                    'break',
+                ],
+                '%s.append(%s)' % (args, a),
+            ],
+            'else:', [
+                '%s = rebuild(%s, %s.args, %s)' % (out, v, v, args),
+            ],
+        ],
+        'else:', [
+            '%s = %s' % (out, v),
+        ],
+    ]
+
+def block_loop(block, v, out, names):
+    """ Statements rewriting ``v`` with the first matching rule of ``block``. """
+    i, d, k = names.fresh('I'), names.fresh('D'), names.fresh('K')
+    names.consts.update({i: block.index, d: block.dispatch, k: block.key})
+    b, r, m = names.fresh('b'), names.fresh('r'), names.fresh('m')
+
+    # counting against the budget as RuleBlock.metered does
+    rewrite = []
+    if block.meter is not None:
+        c = names.fresh('M')
+        names.consts[c] = block.meter
+        rewrite = [
+            '%s.rewrites -= 1' % c,
+            'if %s.rewrites <= 0: %s.spent()' % (c, c),
+        ]
+
+    loop = [
+        # the key of an application is computed inline
+        'if type(%s) is AAppl:' % v, [
+            "%s = %s.get(('appl', %s.spine.term, len(%s.args)))" % (b, i, v, v),
+        ],
+        'else:', [
+            '%s = %s.get(%s(%s))' % (b, i, k, v),
+        ],
+        'if %s is None: %s = %s(%s)' % (b, b, d, v),
+        '%s = FAIL' % out,
+        'for %s in %s:' % (r, b), [
+            '%s = %s.match(%s)' % (m, r, v),
+            'if %s is not FAIL:' % m, [
+                '%s = %s.build(%s)' % (out, r, m),
+            ] + rewrite + [
+                'break',
+            ],
+        ],
+    ]
+    if block.meter is None:
+        return loop
+
+    return [
+        '%s.fuel -= 1' % c,
+        'if %s.fuel < 0 and %s.check():' % (c, c), [
+            '%s = FAIL' % out,
+        ],
+        'else:', loop,
+    ]
+
+def some_loop(f, v, out, names):
+    """ Statements applying ``f`` to the children of ``v`` it can. """
+    a = names.fresh('a')
+    r = names.fresh('r')
+    args = names.fresh('args')
+    return [
+        'if isinstance(%s, CONGRUENT):' % v, [
+            '%s = []' % args,
+            'for %s in %s.args:' % (a, v), [
+                '%s = %s(%s)' % (r, f, a),
+                '%s.append(%s if %s is FAIL else %s)' % (args, a, r, r),
+            ],
+            '%s = rebuild(%s, %s.args, %s)' % (out, v, v, args),
+        ],
+        'else:', [
+            '%s = FAIL' % out,
+        ],
+    ]
+
+def indent(body, level=1):
+    out = ''
+    for line in body:
+        if isinstance(line, list):
+            out += indent(line, level + 1)
+        else:
+            out += '    ' * level + line + '\n'
+    return out
@@ -1,5 +1,10 @@
 from functools import wraps
-import rewrite.terms as terms
+from rewrite.matching import NoMatch, FAIL
+from memo import MISS
+import traverse
+from cost import CostModel, select
+from profiling import clock
+from traverse import all_args, some_args, STCycle, SHORT
 
 #------------------------------------------------------------------------
 # Exceptions
@@ -8,6 +13,48 @@ import rewrite.terms as terms
 class STFail(Exception):
     pass
 
+#------------------------------------------------------------------------
+# Failure Protocol
+#------------------------------------------------------------------------
+
+# Combinators evaluate through ``apply``, which returns the rewritten
+# term or the shared ``FAIL`` sentinel, so failing and recovering costs
+# a comparison rather than raising and unwinding an exception. Calling
+# a combinator keeps the exception based interface, raising STFail on
+# failure.
+
+def lift(s):
+    """
+    The ``apply`` function of strategy ``s``. Plain callables are
+    adapted by catching the exceptions they fail with.
+    """
+    if s is Id:
+        return Id
+    elif s is fail:
+        return failure
+
+    apply = getattr(s, 'apply', None)
+    if apply is not None:
+        return apply
+
+    def apply(t):
+        try:
+            return s(t)
+        except (STFail, NoMatch):
+            return FAIL
+    return apply
+
+class Combinator(object):
+
+    def apply(self, t):
+        raise NotImplementedError
+
+    def __call__(self, t):
+        res = self.apply(t)
+        if res is FAIL:
+            raise STFail()
+        return res
+
 #------------------------------------------------------------------------
 # Rewrite Combinators
 #------------------------------------------------------------------------
@@ -22,125 +69,234 @@ def fix(f):
     inner = f(Yf)
     return Yf
 
-def fail():
+def fail(t=None):
     raise STFail()
 
-class Choice(object):
+def failure(t):
+    return FAIL
+
+class Choice(Combinator):
     def __init__(self, left=None, right=None):
         self.left = left
         self.right = right
         assert left and right, 'Must provide two arguments to Choice'
+        self._left = lift(left)
+        self._right = lift(right)
 
-    def __call__(self, t):
-        try:
-            return self.left(t)
-        except STFail:
-            return self.right(t)
+    def apply(self, t):
+        res = self._left(t)
+        if res is FAIL:
+            return self._right(t)
+        return res
 
-class Debug(object):
+class Debug(Combinator):
     def __init__(self, s):
         self.s = s
+        self._s = lift(s)
 
-    def __call__(self, t):
-        res = self.s(t)
+    def apply(self, t):
+        res = self._s(t)
         print res
         return res
 
-class Ternary(object):
+class Ternary(Combinator):
     def __init__(self, s1, s2, s3):
         self.s1 = s1
         self.s2 = s2
         self.s3 = s3
-
-    def __call__(self, t):
-        try:
-            val = self.s1(t)
-        except STFail:
-            return self.s2(val)
+        self._s1 = lift(s1)
+        self._s2 = lift(s2)
+        self._s3 = lift(s3)
+
+    def apply(self, t):
+        val = self._s1(t)
+        if val is FAIL:
+            return self._s2(t)
         else:
-            return self.s3(val)
+            return self._s3(val)
 
-class Repeat(object):
+class Repeat(Combinator):
     def __init__(self, p):
         self.p = p
-
-    def __call__(self, s):
+        self._p = lift(p)
+        self.memo = None
+        self.cycles = False
+        self.meter = None
+
+    def apply(self, s):
+        memo = self.memo
+        if memo is not None:
+            key = (self, s)
+            res = memo.get(key)
+            if res is not MISS:
+                return res
+
+        p = self._p
+        meter = self.meter
         val = s
-        while True:
-            try:
-                val = self.p(val)
-            except STFail:
-                break
+        if self.cycles:
+            marked, m, k = s, 0, 0
+            while True:
+                res = p(val)
+                if res is FAIL:
+                    break
+                val = res
+                if meter is not None and meter.exhausted:
+                    return val
+                k += 1
+                if m >= SHORT and val == marked:
+                    raise STCycle(val, k - m)
+                if k == 2 * m + 1:
+                    marked, m = val, k
+        else:
+            while True:
+                res = p(val)
+                if res is FAIL:
+                    break
+                val = res
+                if meter is not None and meter.exhausted:
+                    # the term reached so far, not a normal form
+                    return val
+
+        if memo is not None:
+            memo.put(key, val)
+            if val is not s:
+                memo.put((self, val), val)
         return val
 
-class All(object):
+class All(Combinator):
     def __init__(self, s):
         self.s = s
+        self._s = lift(s)
+        self.annotations = False
+        self.tracer = None
 
-    def __call__(self, o):
-        if isinstance(o, terms.AAppl):
-            return terms.AAppl(o.spine, map(self.s, o.args))
-        else:
-            return o
+    def apply(self, o):
+        if self.tracer is not None:
+            return all_args(self._s, o, self.annotations, self.tracer.views)
+        return all_args(self._s, o, self.annotations)
 
-class Some(object):
+class Some(Combinator):
     def __init__(self, s):
         self.s = s
+        self._s = lift(s)
+        self.annotations = False
+        self.tracer = None
 
-    def __call__(self, o):
-        if isinstance(o, AAppl):
-            largs = []
-            for a in o.args:
-                try:
-                    largs.append(self.s(a))
-                except STFail:
-                    largs.append(a)
-            return AAppl(o.spine, largs)
-        else:
-            raise STFail()
+    def apply(self, o):
+        if self.tracer is not None:
+            return some_args(self._s, o, self.annotations, self.tracer.views)
+        return some_args(self._s, o, self.annotations)
 
-class Seq(object):
+class Seq(Combinator):
     def __init__(self, s1, s2):
         self.s1 = s1
         self.s2 = s2
+        self._s1 = lift(s1)
+        self._s2 = lift(s2)
 
-    def __call__(self, o):
-        return self.s2(self.s1(o))
+    def apply(self, o):
+        res = self._s1(o)
+        if res is FAIL:
+            return FAIL
+        return self._s2(res)
 
-class Try(object):
+class Try(Combinator):
     def __init__(self, s):
         self.s = s
+        self._s = lift(s)
 
-    def __call__(self, o):
-        try:
-            return self.s(o)
-        except STFail:
-            return o
-        except Exception:
+    def apply(self, o):
+        res = self._s(o)
+        if res is FAIL:
             return o
+        return res
+
+# The traversals run on the explicit stack engine of traverse.py and
+# rewrite terms of any depth without recursing. Like all and some they
+# descend into applications, tuples and lists, and into annotated terms
+# once ``annotations`` is set. With a ``tracer`` they keep the position
+# of the term rewritten in its views.
 
-class Topdown(object):
+class Topdown(Combinator):
     def __init__(self, s):
         self.s = s
-
-    def __call__(self, o):
-        val = self.s(o)
-        return All(self)(val)
-
-class Bottomup(object):
+        self._s = lift(s)
+        self.annotations = False
+        self.tracer = None
+        self.meter = None
+
+    def apply(self, o):
+        if self.tracer is not None:
+            return traverse.topdown(self._s, o, self.annotations, self.meter,
+                                    self.tracer.views)
+        return traverse.topdown(self._s, o, self.annotations, self.meter)
+
+class Bottomup(Combinator):
     def __init__(self, s):
         self.s = s
-
-    def __call__(self, o):
-        val = All(self)(o)
-        return self.s(val)
-
-class Innermost(object):
+        self._s = lift(s)
+        self.annotations = False
+        self.tracer = None
+        self.meter = None
+
+    def apply(self, o):
+        if self.tracer is not None:
+            return traverse.bottomup(self._s, o, self.annotations, self.meter,
+                                     self.tracer.views)
+        return traverse.bottomup(self._s, o, self.annotations, self.meter)
+
+class Innermost(Combinator):
+    # bottomup(try(s ; innermost(s)))
     def __init__(self, s):
         self.s = s
-
-    def __call__(self, o):
-        return Bottomup(Try(Seq(self.s, self)))(o)
+        self._s = lift(s)
+        self.memo = None
+        self.cycles = False
+        self.annotations = False
+        self.tracer = None
+        self.meter = None
+
+    def apply(self, o):
+        if self.tracer is not None:
+            # without the memo, so each rewrite is seen
+            return traverse.innermost(self._s, o, None, None,
+                                      self.annotations, self.cycles,
+                                      self.meter, self.tracer.views)
+        return traverse.innermost(self._s, o, self.memo, self,
+                                  self.annotations, self.cycles, self.meter)
+
+class Cheapest(Combinator):
+    # the rewrite by the rule of the block s with the cheapest result
+    def __init__(self, s):
+        if not (hasattr(s, 'dispatch') or s is fail or s is failure):
+            raise ValueError('cheapest takes a rule block, not %r' % (s,))
+        self.s = s
+        self.model = CostModel()
+        self.depth = 0
+
+    def apply(self, o):
+        block = self.s
+        if not hasattr(block, 'dispatch'):
+            return FAIL
+
+        # the rules are matched directly, counting against the budget,
+        # recorded in the profile and reported to the tracer as the
+        # block would
+        if block.meter is not None and not block.charge():
+            return FAIL
+
+        if block.profile is None:
+            best = select(block, o, self.model, self.depth)
+        else:
+            start = clock()
+            best = select(block, o, self.model, self.depth, block.tried)
+            block.record(start, best if best is FAIL else best[2])
+        if best is FAIL:
+            return FAIL
+        rule, values, res = best
+        # the last rule built may be another, or one looked ahead
+        return block.commit(rule, o, res)
 
 class SeqL(object):
     def __init__(self, *sx):
@@ -0,0 +1,126 @@
+"""
+Cost models for choosing between rewrites.
+
+A rule block rewrites with the first of its rules to match. The
+cheapest combinator instead tries every rule of the block matching the
+term and rewrites with the one whose result costs least::
+
+    plan = innermost(cheapest(fuse))
+
+    env = module(source, costs={'map': 10, 'zipwith': 10}, lookahead=1)
+
+The cost of a term is priced bottom-up by a cost function as in
+egraph.py, called with the e-node ( kind, value, args ) of each subterm
+and the costs of its arguments, or by a table of the cost of each
+constructor by name. With a ``lookahead`` of n a result is priced as
+the cheapest of the terms reached from it by up to n more rewrites at
+the same position, so a rule whose result only pays off once rewritten
+again can be chosen. The rest of the term is the same whichever rule
+is chosen, so only the term at the position is priced.
+
+A result shares most of its subterms with the term rewritten, the
+values bound by the match, so costs are memoised on the identity of
+the term: pricing a result only visits the nodes the rule built.
+"""
+
+from rewrite.matching import FAIL
+from egraph import shape, size, weighted
+
+# terms priced before the table is cleared
+MAXSIZE = 1 << 16
+
+class CostModel(object):
+    """
+    The cost of terms under ``cost``, a cost function or a table of
+    the cost of each constructor, by default the number of subterms.
+    ``hits`` and ``misses`` count the subterms found priced and not.
+    """
+
+    def __init__(self, cost=None, maxsize=MAXSIZE):
+        if cost is None:
+            cost = size
+        elif isinstance(cost, dict):
+            cost = weighted(cost)
+        self.cost = cost
+        self.maxsize = maxsize
+        # id(t) -> ( t, cost ), holding on to t so its id is not reused
+        self.table = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, t):
+        table = self.table
+        if len(table) >= self.maxsize:
+            table.clear()
+        cost = self.cost
+
+        # in postorder on an explicit stack
+        out = []
+        stack = [(t, None)]
+        while stack:
+            t, node = stack.pop()
+            if node is None:
+                entry = table.get(id(t))
+                if entry is not None:
+                    self.hits += 1
+                    out.append(entry[1])
+                    continue
+                self.misses += 1
+                node = shape(t)
+                stack.append((t, node))
+                stack.extend((a, None) for a in reversed(node[2]))
+                continue
+            n = len(node[2])
+            if n:
+                costs = out[-n:]
+                del out[-n:]
+            else:
+                costs = []
+            c = cost(node, costs)
+            table[id(t)] = (t, c)
+            out.append(c)
+        return out[0]
+
+    def clear(self):
+        self.table.clear()
+
+def matches(block, t, match=None):
+    """
+    The rules of ``block`` matching ``t``, with their values, matched
+    by ``match`` ( rule, t ) if given.
+    """
+    for rule in block.dispatch(t):
+        if match is None:
+            values = rule.match(t)
+        else:
+            values = match(rule, t)
+        if values is not FAIL:
+            yield rule, values
+
+def estimate(block, t, model, depth):
+    """
+    The least cost of ``t`` and of the terms reached from it by up to
+    ``depth`` rewrites at the top by the rules of ``block``.
+    """
+    best = model(t)
+    if depth > 0:
+        for rule, values in matches(block, t):
+            best = min(best, estimate(block, rule.build(values), model,
+                                      depth - 1))
+    return best
+
+def select(block, t, model, depth=0, match=None):
+    """
+    The rule of ``block`` rewriting ``t`` to the cheapest result, with
+    its values and the result, or FAIL if none matches. Ties go to the
+    first rule in block order. The rules are matched against ``t`` by
+    ``match`` if given, those of the lookahead directly.
+    """
+    best = FAIL
+    lowest = None
+    for rule, values in matches(block, t, match):
+        res = rule.build(values)
+        c = estimate(block, res, model, depth)
+        if lowest is None or c < lowest:
+            best, lowest = (rule, values, res), c
+    return best
@@ -0,0 +1,435 @@
+"""
+Equality saturation.
+
+An e-graph holds a set of terms and the equalities between them found
+by rewriting, without choosing between the two sides of any: a rule
+adds its right hand side to the class of terms equal to the term it
+matched, so every order of applying the rules is explored at once.
+Once no rule adds anything, or a limit is reached, the cheapest term
+equal to the subject is extracted::
+
+    env = module(open('examples/fusion').read())
+    eg = EGraph()
+    root = eg.add(t)
+    eg.saturate(rewrites(env), nodes=10000)
+    best, cost = eg.extract(root)
+
+Terms are stored as e-nodes, ( kind, value, args ) triples whose
+arguments are the ids of e-classes, hash-consed so that each is stored
+once. A union only records the class to repair, and ``rebuild``
+restores the congruence closure for all the unions of an iteration at
+once, as in egg [Willsey et al. 2021]. Annotations are dropped.
+"""
+
+import time
+from collections import defaultdict
+
+from rewrite.terms import AAppl, ATerm, AInt, AReal, AString, AList, \
+    ATuple, APlaceholder, termtype
+
+#------------------------------------------------------------------------
+# E-nodes
+#------------------------------------------------------------------------
+
+LITERALS = {AInt: 'int', AReal: 'real', AString: 'str'}
+
+def shape(t):
+    """ The kind, value and arguments of the e-node of the term ``t``. """
+    cls = termtype(t)
+    while cls is ATerm and not isinstance(t.term, str):
+        # an annotated term is the term annotated
+        t = t.term
+        cls = termtype(t)
+
+    if cls is AAppl:
+        return 'appl', t.spine.term, t.args
+    elif cls is ATerm:
+        return 'term', t.term, ()
+    elif cls is AList:
+        return 'list', None, t.args
+    elif cls is ATuple:
+        return 'tuple', None, t.args
+    elif cls in LITERALS:
+        return LITERALS[cls], t.val, ()
+    raise TypeError('Not a ground term: %r' % (t,))
+
+def build(node, args):
+    """ The term of the e-node ``node`` with the arguments ``args``. """
+    kind, value = node[0], node[1]
+    if kind == 'appl':
+        return AAppl(ATerm(value, None), args)
+    elif kind == 'term':
+        return ATerm(value, None)
+    elif kind == 'list':
+        return AList(args)
+    elif kind == 'tuple':
+        return ATuple(args)
+    elif kind == 'int':
+        return AInt(value)
+    elif kind == 'real':
+        return AReal(value)
+    return AString(value)
+
+#------------------------------------------------------------------------
+# Costs
+#------------------------------------------------------------------------
+
+# A cost function takes an e-node and the costs of its arguments. The
+# cost of a node must exceed those of its arguments.
+
+def size(node, costs):
+    """ The number of subterms. """
+    return 1 + sum(costs)
+
+def weighted(weights, default=1):
+    """
+    The sum of the weights of the constructors, looked up by name in
+    ``weights``.
+    """
+    def cost(node, costs):
+        return weights.get(node[1], default) + sum(costs)
+    return cost
+
+#------------------------------------------------------------------------
+# Rewrites
+#------------------------------------------------------------------------
+
+class Rewrite(object):
+    """
+    The rule ``rule`` of a module matching e-classes. Each side is a
+    pattern of ( kind, value, args ) triples with its variables as the
+    numbers of the values bound by the matcher.
+    """
+
+    def __init__(self, rule, name):
+        self.rule = rule
+        self.name = name
+
+        bound = []
+        for bind in rule.lpat:
+            if bind not in bound:
+                bound.append(bind)
+        self.arity = len(bound)
+        self.left = pattern(rule.left, iter([bound.index(b)
+                                             for b in rule.lpat]))
+        self.right = pattern(rule.right, iter([bound.index(b)
+                                               for b in rule.rpat]))
+
+    def __repr__(self):
+        return '<Rewrite %s>' % self.name
+
+def pattern(p, slots):
+    # the placeholders take their numbers from slots in left to right
+    # order, as the values of a matcher
+    if isinstance(p, APlaceholder):
+        if p.args is not None:
+            raise ValueError('Patterns binding a constructor are not '
+                             'supported: %s' % p)
+        return next(slots)
+    kind, value, args = shape(p)
+    return (kind, value, tuple([pattern(a, slots) for a in args]))
+
+def rewrites(env, labels=None):
+    """
+    The rules of the rule blocks of the module ``env``, of those
+    labelled ``labels`` if given, as Rewrites.
+    """
+    out = []
+    for label, block in sorted(env.items()):
+        if not hasattr(block, 'dispatch'):
+            continue
+        if labels is not None and label not in labels:
+            continue
+        for rule in block.rules:
+            out.append(Rewrite(rule, '%s : %s -> %s' % (label, rule.left,
+                                                       rule.right)))
+    return out
+
+#------------------------------------------------------------------------
+# E-graph
+#------------------------------------------------------------------------
+
+class EClass(object):
+
+    __slots__ = ('nodes', 'parents')
+
+    def __init__(self, nodes):
+        self.nodes = nodes
+        # the e-nodes with an argument in the class, and their classes
+        self.parents = []
+
+class EGraph(object):
+
+    def __init__(self):
+        self.parent = []
+        self.classes = {}
+        self.memo = {}
+        self.pending = []
+
+    def find(self, a):
+        """ The canonical id of the class ``a``. """
+        parent = self.parent
+        while parent[a] != a:
+            parent[a] = parent[parent[a]]
+            a = parent[a]
+        return a
+
+    def canonical(self, node):
+        args = node[2]
+        if not args:
+            return node
+        find = self.find
+        return (node[0], node[1], tuple([find(a) for a in args]))
+
+    def add_node(self, node):
+        """ The class of the e-node ``node``, added if new. """
+        node = self.canonical(node)
+        c = self.memo.get(node)
+        if c is not None:
+            return self.find(c)
+
+        c = len(self.parent)
+        self.parent.append(c)
+        self.classes[c] = EClass([node])
+        self.memo[node] = c
+        for a in set(node[2]):
+            self.classes[a].parents.append((node, c))
+        return c
+
+    def add(self, t):
+        """ The class of the term ``t``, added with its subterms. """
+        # in postorder on an explicit stack, each distinct object once
+        done = {}
+        out = []
+        stack = [(t, False)]
+        while stack:
+            t, ready = stack.pop()
+            c = done.get(id(t))
+            if c is not None:
+                out.append(c)
+                continue
+            kind, value, args = shape(t)
+            if args and not ready:
+                stack.append((t, True))
+                stack.extend((a, False) for a in reversed(args))
+                continue
+            if args:
+                kids = tuple(out[-len(args):])
+                del out[-len(args):]
+            else:
+                kids = ()
+            c = done[id(t)] = self.add_node((kind, value, kids))
+            out.append(c)
+        return out[0]
+
+    def union(self, a, b):
+        """ Merge the classes ``a`` and ``b``, whether they differed. """
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return False
+        ca, cb = self.classes[a], self.classes[b]
+        if len(ca.parents) < len(cb.parents):
+            a, b, ca, cb = b, a, cb, ca
+        self.parent[b] = a
+        ca.nodes.extend(cb.nodes)
+        ca.parents.extend(cb.parents)
+        del self.classes[b]
+        self.pending.append(a)
+        return True
+
+    def rebuild(self):
+        """
+        Restore the congruence closure after unions: e-nodes whose
+        arguments are in the same classes are in the same class.
+        """
+        if not self.pending:
+            return
+        while self.pending:
+            todo = set([self.find(c) for c in self.pending])
+            del self.pending[:]
+            for c in todo:
+                self.repair(c)
+
+        canonical = self.canonical
+        for ec in self.classes.itervalues():
+            ec.nodes = list(set([canonical(n) for n in ec.nodes]))
+
+    def repair(self, c):
+        # a union in an earlier repair may have merged the class away
+        c = self.find(c)
+        ec = self.classes[c]
+        memo = self.memo
+        find = self.find
+        for node, p in ec.parents:
+            memo.pop(node, None)
+            memo[self.canonical(node)] = find(p)
+
+        # congruent parents are merged
+        parents = {}
+        for node, p in ec.parents:
+            node = self.canonical(node)
+            q = parents.get(node)
+            if q is not None:
+                self.union(p, q)
+            parents[node] = find(p)
+        ec.parents = parents.items()
+
+    def equivalent(self, a, b):
+        """ Whether the terms ``a`` and ``b`` are known to be equal. """
+        self.rebuild()
+        return self.find(self.add(a)) == self.find(self.add(b))
+
+    #--------------------------------------------------------------------
+    # Matching
+    #--------------------------------------------------------------------
+
+    def index(self):
+        """ The classes holding an e-node of each kind, value and arity. """
+        index = defaultdict(set)
+        for c, ec in self.classes.iteritems():
+            for node in ec.nodes:
+                index[(node[0], node[1], len(node[2]))].add(c)
+        return index
+
+    def search(self, rw, index):
+        """ The classes matched by the left of ``rw`` and the bindings. """
+        left = rw.left
+        if isinstance(left, int):
+            candidates = list(self.classes)
+        else:
+            candidates = index.get((left[0], left[1], len(left[2])), ())
+        empty = [None] * rw.arity
+        for c in candidates:
+            for binding in self.ematch(left, c, empty):
+                yield c, binding
+
+    def ematch(self, p, c, binding):
+        # the bindings extending binding under which p matches class c
+        if isinstance(p, int):
+            b = binding[p]
+            if b is None:
+                binding = list(binding)
+                binding[p] = c
+                yield binding
+            elif self.find(b) == c:
+                yield binding
+            return
+
+        kind, value, ps = p
+        n = len(ps)
+        for node in self.classes[c].nodes:
+            if node[0] != kind or node[1] != value or len(node[2]) != n:
+                continue
+            bindings = [binding]
+            for q, a in zip(ps, node[2]):
+                bindings = [b2 for b in bindings
+                            for b2 in self.ematch(q, self.find(a), b)]
+                if not bindings:
+                    break
+            for b in bindings:
+                yield b
+
+    def instantiate(self, p, binding):
+        """ The class of the pattern ``p`` under ``binding``. """
+        if isinstance(p, int):
+            return binding[p]
+        kind, value, ps = p
+        return self.add_node((kind, value, tuple([self.instantiate(q, binding)
+                                                 for q in ps])))
+
+    #--------------------------------------------------------------------
+    # Saturation
+    #--------------------------------------------------------------------
+
+    def saturate(self, rewrites, iterations=None, nodes=None, seconds=None):
+        """
+        Apply ``rewrites`` until none adds anything, or a limit on the
+        ``iterations``, the number of e-nodes or the ``seconds`` taken
+        is reached, returning which: 'saturated', 'iterations',
+        'nodes' or 'time'. Each iteration finds the matches of every
+        rewrite before adding any, then rebuilds once.
+        """
+        deadline = None if seconds is None else time.time() + seconds
+        self.rebuild()
+        n = 0
+        while True:
+            if iterations is not None and n >= iterations:
+                return 'iterations'
+            n += 1
+
+            index = self.index()
+            matches = []
+            for rw in rewrites:
+                matches.append((rw, list(self.search(rw, index))))
+                if deadline is not None and time.time() >= deadline:
+                    return 'time'
+
+            changed = False
+            for rw, found in matches:
+                for c, binding in found:
+                    if self.union(c, self.instantiate(rw.right, binding)):
+                        changed = True
+                    if nodes is not None and len(self.memo) > nodes:
+                        self.rebuild()
+                        return 'nodes'
+            self.rebuild()
+
+            if not changed:
+                return 'saturated'
+            if deadline is not None and time.time() >= deadline:
+                return 'time'
+
+    #--------------------------------------------------------------------
+    # Extraction
+    #--------------------------------------------------------------------
+
+    def costs(self, cost=size):
+        """ The cost of the cheapest e-node of each class, and the node. """
+        self.rebuild()
+        best = {}
+        changed = True
+        while changed:
+            changed = False
+            for c, ec in self.classes.iteritems():
+                old = best.get(c)
+                for node in ec.nodes:
+                    try:
+                        costs = [best[a][0] for a in node[2]]
+                    except KeyError:
+                        continue
+                    x = cost(node, costs)
+                    if old is None or x < old[0]:
+                        old = best[c] = (x, node)
+                        changed = True
+        return best
+
+    def extract(self, c, cost=size):
+        """ The cheapest term in the class ``c`` under ``cost``, and its cost. """
+        best = self.costs(cost)
+        root = self.find(c)
+
+        done = {}
+        stack = [(root, False)]
+        while stack:
+            c, ready = stack.pop()
+            if c in done:
+                continue
+            node = best[c][1]
+            if not ready:
+                stack.append((c, True))
+                stack.extend((a, False) for a in node[2] if a not in done)
+                continue
+            done[c] = build(node, [done[a] for a in node[2]])
+        return done[root], best[root][0]
+
+def simplify(env, t, cost=size, labels=None, **limits):
+    """
+    The cheapest term equal to ``t`` under the rules of the module
+    ``env``, its cost and why saturation stopped, with ``limits`` as
+    for EGraph.saturate.
+    """
+    eg = EGraph()
+    root = eg.add(t)
+    reason = eg.saturate(rewrites(env, labels), **limits)
+    term, c = eg.extract(root, cost)
+    return term, c, reason
@@ -0,0 +1,143 @@
+"""
+Memo tables for strategy results.
+
+A memo table maps ( strategy, term ) to the result of applying the
+strategy to the term, or to FAIL, so a traversal meeting a subterm it
+has already normalised returns the earlier result. Terms are keyed by
+their structural hash and equality, so the result of an equal term is
+returned rather than one computed for the same object.
+
+Term equality ignores annotations, so a key found is checked to be the
+same as the one stored, annotations included, and is otherwise a miss:
+the result of a term annotated differently carries its annotations.
+
+Tables hold a bounded number of entries, evicted with the clock ( or
+second chance ) algorithm: the hand sweeps the slots in order, evicting
+the first entry not hit since the hand last passed it.
+"""
+
+from rewrite.terms import ATerm, AAppl, AList, ATuple, plain
+
+class Miss(object):
+    def __repr__(self):
+        return 'MISS'
+
+MISS = Miss()
+
+class MemoTable(object):
+
+    def __init__(self, maxsize=65536):
+        assert maxsize > 0, 'Memo table must hold at least one entry'
+        self.maxsize = maxsize
+        self.index = {}
+        self.keys = []
+        self.values = []
+        self.used = []
+        self.hand = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """ The result stored under ``key``, or MISS. """
+        i = self.index.get(key)
+        if i is None or not same(self.keys[i], key):
+            self.misses += 1
+            return MISS
+        self.hits += 1
+        self.used[i] = True
+        return self.values[i]
+
+    def put(self, key, value):
+        i = self.index.get(key)
+        if i is not None:
+            if not same(self.keys[i], key):
+                # an equal key annotated differently takes the slot
+                del self.index[key]
+                self.index[key] = i
+                self.keys[i] = key
+            self.values[i] = value
+            return
+
+        if len(self.keys) < self.maxsize:
+            self.index[key] = len(self.keys)
+            self.keys.append(key)
+            self.values.append(value)
+            self.used.append(False)
+            return
+
+        used = self.used
+        hand = self.hand
+        while used[hand]:
+            used[hand] = False
+            hand = (hand + 1) % self.maxsize
+
+        del self.index[self.keys[hand]]
+        self.evictions += 1
+
+        self.index[key] = hand
+        self.keys[hand] = key
+        self.values[hand] = value
+        self.hand = (hand + 1) % self.maxsize
+
+    def clear(self):
+        """ Drop every entry and reset the counters. """
+        self.index.clear()
+        del self.keys[:]
+        del self.values[:]
+        del self.used[:]
+        self.hand = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __repr__(self):
+        return '<MemoTable: %d/%d entries, %d hits, %d misses>' % (
+            len(self), self.maxsize, self.hits, self.misses)
+
+def same(a, b):
+    """
+    Whether the equal keys ``a`` and ``b`` are the same, annotations
+    included.
+    """
+    if type(a) is tuple and len(a) == 2 and a[0] is b[0]:
+        # a ( strategy, term ) key
+        x, y = a[1], b[1]
+        if x is y or plain(x) and plain(y):
+            return True
+
+    # pairs of terms known to be equal but for annotations, and pairs
+    # of annotations, which are not
+    stack = [(a, b, True)]
+    while stack:
+        a, b, equal = stack.pop()
+        if a is b:
+            continue
+        ty = type(a)
+        if ty is not type(b):
+            return False
+        if ty is ATerm or ty is AAppl or ty is AList or ty is ATuple:
+            if plain(a) and plain(b) and (equal or a == b):
+                continue
+        if ty is ATerm:
+            stack.append((a.term, b.term, equal))
+            stack.append((a.annotation, b.annotation, False))
+        elif ty is AAppl:
+            if len(a.args) != len(b.args):
+                return False
+            stack.append((a.spine, b.spine, equal))
+            stack.extend((x, y, equal) for x, y in zip(a.args, b.args))
+        elif ty is AList or ty is ATuple or ty is tuple:
+            a = a if ty is tuple else a.args
+            b = b if ty is tuple else b.args
+            if len(a) != len(b):
+                return False
+            stack.extend((x, y, equal) for x, y in zip(a, b))
+        elif a != b:
+            return False
+    return True
@@ -0,0 +1,382 @@
+"""
+Algebraic simplification of strategy expressions.
+
+The optimizer rewrites a combinator tree bottom-up with laws which
+preserve the result of the strategy on every term:
+
+    try(s)                  -> s            ( s cannot fail )
+    try(fail)               -> id
+    repeat(fail)            -> id
+    s <+ fail               -> s
+    fail <+ s               -> s
+    s <+ t                  -> s            ( s cannot fail )
+    R1 <+ R2                -> R1R2         ( rule blocks, merged )
+    id ; s                  -> s
+    s ; id                  -> s
+    fail ; s                -> fail
+    all(s1) ; all(s2)       -> all(s1 ; s2)
+    repeat(s) ; repeat(s)   -> repeat(s)
+    innermost(s) ; innermost(s) -> innermost(s)
+    all(id)                 -> id
+    topdown(id)             -> id
+    topdown(fail)           -> fail
+    bottomup(id)            -> id
+    bottomup(fail)          -> fail
+    innermost(fail)         -> id
+    cheapest(fail)          -> fail
+    fail < s2 + s3          -> s2
+    id < s2 + s3            -> s3
+
+Given the constructor names which may occur in the input, the rules of
+each block which can never fire are pruned. A rule fires only on terms
+containing every constructor of its left hand side, and the terms a
+strategy sees contain only input constructors and the constructors of
+right hand sides of rules which can fire.
+"""
+
+import logging
+
+from rewrite.terms import AAppl, ATerm, ATuple, AList, APlaceholder
+import combinators as comb
+
+log = logging.getLogger(__name__)
+
+#------------------------------------------------------------------------
+# Toplevel
+#------------------------------------------------------------------------
+
+def optimize(s, symbols=None):
+    """
+    Simplify the strategy ``s``. With ``symbols``, the set of
+    constructor names which may occur in the input, rules which can
+    never fire are removed from rule blocks.
+    """
+    return Optimizer(symbols)(s)
+
+def symbols(t, out=None):
+    """ The constructor names occurring in the term ``t``. """
+    if out is None:
+        out = set()
+    stack = [t]
+    while stack:
+        t = stack.pop()
+        if isinstance(t, AAppl):
+            if isinstance(t.spine, ATerm):
+                out.add(t.spine.term)
+            stack.extend(t.args)
+        elif isinstance(t, (ATuple, AList)):
+            stack.extend(t.args)
+        elif isinstance(t, APlaceholder) and t.args:
+            stack.extend(t.args)
+    return out
+
+#------------------------------------------------------------------------
+# Optimizer
+#------------------------------------------------------------------------
+
+# the arguments of each combinator, in constructor order
+arguments = {
+    comb.Choice    : ('left', 'right'),
+    comb.Seq       : ('s1', 's2'),
+    comb.Ternary   : ('s1', 's2', 's3'),
+    comb.Repeat    : ('p',),
+    comb.All       : ('s',),
+    comb.Some      : ('s',),
+    comb.Try       : ('s',),
+    comb.Topdown   : ('s',),
+    comb.Bottomup  : ('s',),
+    comb.Innermost : ('s',),
+    comb.Debug     : ('s',),
+    comb.Cheapest  : ('s',),
+}
+
+class Optimizer(object):
+
+    def __init__(self, symbols=None):
+        self.symbols = symbols
+        self.reachable = None
+        self.pruned = {}
+        self.merged = {}
+        self.applied = []
+
+    def __call__(self, s):
+        s = strip(s)
+        if self.symbols is not None:
+            blocks = []
+            if collect(s, blocks):
+                self.reachable = closure(self.symbols, blocks)
+            else:
+                log.debug('opaque strategy, not pruning %s', show(s))
+        return self.simplify(s)
+
+    def simplify(self, s):
+        s = strip(s)
+
+        if isblock(s):
+            return self.prune(s)
+
+        names = arguments.get(type(s))
+        if names is None:
+            return s
+
+        args = [getattr(s, n) for n in names]
+        new = [self.simplify(a) for a in args]
+        if any(a is not b for a, b in zip(args, new)):
+            s = type(s)(*new)
+
+        res = self.law(s)
+        if res is None:
+            return s
+        name, out = res
+        log.debug('%s: %s => %s', name, show(s), show(out))
+        self.applied.append(name)
+        return self.simplify(out)
+
+    def prune(self, block):
+        if self.reachable is None:
+            return block
+        if id(block) in self.pruned:
+            return self.pruned[id(block)][1]
+
+        rules = [r for r in block.rules if symbols(r.left) <= self.reachable]
+        if len(rules) == len(block.rules):
+            out = block
+        elif not rules:
+            out = comb.fail
+        else:
+            out = block.__class__(rules, block.label, automaton=block.automaton,
+                                  meter=block.meter, profile=block.profile,
+                                  tracer=block.tracer)
+
+        if out is not block:
+            name = 'prune'
+            log.debug('%s: %s, %d of %d rules can fire', name, show(block),
+                      len(rules), len(block.rules))
+            self.applied.append(name)
+        # keep the block alive while its id is a key
+        self.pruned[id(block)] = (block, out)
+        return out
+
+    def law(self, s):
+        """ A law rewriting the top of ``s`` as ( name, result ), or None. """
+        ty = type(s)
+
+        if ty is comb.Try:
+            if isfail(s.s):
+                return 'try(fail) -> id', comb.Id
+            if succeeds(s.s):
+                return 'try(s) -> s', s.s
+
+        elif ty is comb.Repeat:
+            if isfail(s.p):
+                return 'repeat(fail) -> id', comb.Id
+
+        elif ty is comb.Choice:
+            left, right = s.left, s.right
+            if isfail(right):
+                return 's <+ fail -> s', left
+            if isfail(left):
+                return 'fail <+ s -> s', right
+            if succeeds(left):
+                return 's <+ t -> s', left
+            if isblock(left):
+                if mergeable(left, right):
+                    return 'R1 <+ R2 -> R1R2', self.merge(left, right)
+                if type(right) is comb.Choice and mergeable(left, right.left):
+                    return 'R1 <+ R2 -> R1R2', \
+                        comb.Choice(self.merge(left, right.left), right.right)
+
+        elif ty is comb.Seq:
+            s1, s2 = s.s1, s.s2
+            if isfail(s1):
+                return 'fail ; s -> fail', comb.fail
+            if s1 is comb.Id:
+                return 'id ; s -> s', s2
+            if s2 is comb.Id:
+                return 's ; id -> s', s1
+
+            # the head of a right nested sequence
+            if type(s2) is comb.Seq:
+                head, rest = s2.s1, s2.s2
+            else:
+                head, rest = s2, None
+
+            fused = fuse(s1, head)
+            if fused is not None:
+                name, out = fused
+                if rest is not None:
+                    out = comb.Seq(out, rest)
+                return name, out
+
+        elif ty is comb.All:
+            if s.s is comb.Id:
+                return 'all(id) -> id', comb.Id
+
+        elif ty is comb.Topdown or ty is comb.Bottomup:
+            name = ty.__name__.lower()
+            if s.s is comb.Id:
+                return '%s(id) -> id' % name, comb.Id
+            if isfail(s.s):
+                return '%s(fail) -> fail' % name, comb.fail
+
+        elif ty is comb.Innermost:
+            if isfail(s.s):
+                return 'innermost(fail) -> id', comb.Id
+
+        elif ty is comb.Cheapest:
+            if isfail(s.s):
+                return 'cheapest(fail) -> fail', comb.fail
+
+        elif ty is comb.Ternary:
+            if isfail(s.s1):
+                return 'fail < s2 + s3 -> s2', s.s2
+            if s.s1 is comb.Id:
+                return 'id < s2 + s3 -> s3', s.s3
+
+        return None
+
+    def merge(self, b1, b2):
+        """ A rule block trying the rules of ``b1`` then those of ``b2``. """
+        if b1 is b2:
+            return b1
+        # the same blocks merge into the same block, which keeps equal
+        # strategies comparable
+        key = (id(b1), id(b2))
+        if key not in self.merged:
+            block = b1.__class__(b1.rules + b2.rules,
+                                 '%s%s' % (b1.label, b2.label),
+                                 automaton=b1.automaton, meter=b1.meter,
+                                 profile=b1.profile, tracer=b1.tracer)
+            self.merged[key] = (b1, b2, block)
+        return self.merged[key][2]
+
+#------------------------------------------------------------------------
+# Laws
+#------------------------------------------------------------------------
+
+def fuse(s1, s2):
+    """ Fuse the adjacent traversals ``s1 ; s2``, or None. """
+    ty = type(s1)
+    if ty is not type(s2):
+        return None
+
+    if ty is comb.All:
+        return 'all(s1) ; all(s2) -> all(s1 ; s2)', comb.All(comb.Seq(s1.s, s2.s))
+
+    # both leave a term on which their argument fails everywhere ( the
+    # innermost ) or at the top ( the repeat ), where the second pass
+    # does nothing
+    if ty is comb.Innermost and same(s1.s, s2.s):
+        return 'innermost(s) ; innermost(s) -> innermost(s)', s1
+    if ty is comb.Repeat and same(s1.p, s2.p):
+        return 'repeat(s) ; repeat(s) -> repeat(s)', s1
+
+    return None
+
+def mergeable(b1, b2):
+    return (isblock(b2) and type(b1) is type(b2)
+            and b1.automaton == b2.automaton and b1.meter is b2.meter
+            and b1.profile is b2.profile and b1.tracer is b2.tracer)
+
+
+def succeeds(s):
+    """ Whether ``s`` succeeds on every term it terminates on. """
+    ty = type(s)
+    if s is comb.Id:
+        return True
+    elif ty in (comb.Try, comb.Repeat, comb.Innermost):
+        return True
+    elif ty is comb.Choice:
+        return succeeds(s.left) or succeeds(s.right)
+    elif ty is comb.Seq:
+        return succeeds(s.s1) and succeeds(s.s2)
+    elif ty is comb.Ternary:
+        return succeeds(s.s2) and succeeds(s.s3)
+    elif ty in (comb.All, comb.Topdown, comb.Bottomup, comb.Debug):
+        return succeeds(s.s)
+    return False
+
+#------------------------------------------------------------------------
+# Pruning
+#------------------------------------------------------------------------
+
+def collect(s, blocks):
+    """
+    Append the rule blocks of ``s`` to ``blocks``, returning False if
+    ``s`` calls anything other than rule blocks and combinators.
+    """
+    s = strip(s)
+    if isblock(s):
+        blocks.append(s)
+        return True
+    elif s is comb.Id or isfail(s):
+        return True
+    names = arguments.get(type(s))
+    if names is None:
+        return False
+    return all(collect(getattr(s, n), blocks) for n in names)
+
+def closure(names, blocks):
+    """
+    The constructor names which may occur in terms reached from input
+    over ``names`` by the rules of ``blocks``.
+    """
+    reachable = set(names)
+    rules = [(symbols(r.left), symbols(r.right))
+             for b in blocks for r in b.rules]
+    changed = True
+    while changed:
+        changed = False
+        for left, right in rules:
+            if left <= reachable and not right <= reachable:
+                reachable |= right
+                changed = True
+    return reachable
+
+#------------------------------------------------------------------------
+# Utils
+#------------------------------------------------------------------------
+
+def strip(s):
+    # named strategies are inlined
+    while hasattr(s, 'combinator'):
+        s = s.combinator
+    return s
+
+def same(s1, s2):
+    """ Whether the strategies ``s1`` and ``s2`` are the same expression. """
+    s1, s2 = strip(s1), strip(s2)
+    if s1 is s2:
+        return True
+    names = arguments.get(type(s1))
+    if names is None or type(s1) is not type(s2):
+        return False
+    return all(same(getattr(s1, n), getattr(s2, n)) for n in names)
+
+def isblock(s):
+    return hasattr(s, 'dispatch')
+
+def isfail(s):
+    return s is comb.fail or s is comb.failure
+
+def show(s):
+    """ The strategy ``s`` in the syntax of the DSL. """
+    s = strip(s)
+    ty = type(s)
+    if s is comb.Id:
+        return 'id'
+    elif isfail(s):
+        return 'fail'
+    elif isblock(s):
+        return str(s.label)
+    elif ty is comb.Choice:
+        return '(%s <+ %s)' % (show(s.left), show(s.right))
+    elif ty is comb.Seq:
+        return '(%s ; %s)' % (show(s.s1), show(s.s2))
+    elif ty is comb.Ternary:
+        return '(%s < %s + %s)' % (show(s.s1), show(s.s2), show(s.s3))
+    elif ty in arguments:
+        args = [show(getattr(s, n)) for n in arguments[ty]]
+        return '%s(%s)' % (ty.__name__.lower(), ', '.join(args))
+    else:
+        return getattr(s, '__name__', repr(s))
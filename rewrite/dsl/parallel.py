@@ -0,0 +1,380 @@
+"""
+Parallel traversals.
+
+The arguments of a term are independent of one another, so ``all`` and
+``topdown`` can rewrite them in separate processes. A ``Pool`` starts
+its workers with the source of a module, which each worker builds and
+compiles once, and from then on sends them only the name of a strategy
+and the subterms to rewrite::
+
+    pool = Pool(source, workers=4, threshold=10000)
+    s = pool.topdown('eval')
+    res = s(term)
+
+``imap`` and ``rewrite_many`` rewrite a stream of many terms instead,
+sending them to the workers in chunks and yielding the results in
+order, with FAIL for each term the strategy fails on and a WorkerError
+for each term it raises an exception on::
+
+    for res in rewrite_many(source, 'eval', terms, workers=4):
+        ...
+
+Only terms of at least ``threshold`` nodes are split. ``topdown``
+applies the strategy to them in the parent and hands their smaller
+subterms, in chunks of about equal size, to the workers. The results
+come back in the order they were handed out and are spliced into the
+term in place, so the result is the same whatever the number of
+workers.
+"""
+
+import multiprocessing
+from collections import deque
+from itertools import chain, islice
+
+from rewrite import aparse
+from rewrite.matching import FAIL
+import combinators as comb
+from combinators import Combinator, lift
+from codegen import compile_strategy
+from toplevel import module
+import traverse
+
+#------------------------------------------------------------------------
+# Errors
+#------------------------------------------------------------------------
+
+class WorkerError(Exception):
+    """
+    An exception of the class named ``kind`` raised in a worker on the
+    term numbered ``index``, counting from 0, of those sent to it. The
+    exception itself is not sent back, as not every exception survives
+    pickling.
+    """
+
+    def __init__(self, kind, message, index=0):
+        Exception.__init__(self, kind, message, index)
+        self.kind = kind
+        self.message = message
+        self.index = index
+
+    @classmethod
+    def caught(cls, exc, index):
+        return cls(type(exc).__name__, str(exc), index)
+
+    def __reduce__(self):
+        return (WorkerError, (self.kind, self.message, self.index))
+
+    def __str__(self):
+        return '%s on term %d: %s' % (self.kind, self.index, self.message)
+
+#------------------------------------------------------------------------
+# Workers
+#------------------------------------------------------------------------
+
+# the module of a worker process, the options it was built with and
+# the strategies applied so far, by name
+_env = None
+_options = {}
+_strategies = {}
+
+def _start(source, options):
+    global _env, _options
+    _env = module(source, **options)
+    _options = options
+    _strategies.clear()
+
+def _strategy(kind, name):
+    key = (kind, name)
+    if key not in _strategies:
+        s = _env[name]
+        if kind == 'topdown':
+            s = comb.Topdown(s)
+            if _options.get('compiled'):
+                s = compile_strategy(s)
+        _strategies[key] = lift(s)
+    return _strategies[key]
+
+def _run(task):
+    # the results of a chunk, or None if the strategy fails on any of
+    # its terms as FAIL does not survive pickling, or the WorkerError of
+    # the first it raises on
+    kind, name, terms = task
+    s = _strategy(kind, name)
+    out = []
+    for i, t in enumerate(terms):
+        try:
+            res = s(t)
+        except Exception as e:
+            return WorkerError.caught(e, i)
+        if res is FAIL:
+            return None
+        out.append(res)
+    return out
+
+def _batch(task):
+    # the results of a chunk with None for the terms the strategy
+    # fails on and a WorkerError for those it raises on, parsing the
+    # terms given as text and printing the results if ``text`` is set
+    name, terms, text = task
+    s = _strategy('apply', name)
+    out = []
+    for i, t in enumerate(terms):
+        try:
+            if isinstance(t, basestring):
+                t = aparse(t)
+            res = s(t)
+        except Exception as e:
+            out.append(WorkerError.caught(e, i))
+            continue
+        if res is FAIL:
+            res = None
+        elif text:
+            res = str(res)
+        out.append(res)
+    return out
+
+#------------------------------------------------------------------------
+# Pool
+#------------------------------------------------------------------------
+
+class Pool(object):
+    """
+    A pool of ``workers`` processes rewriting with the module built from
+    ``source`` with ``options``, which is built in this process as well
+    as the ``env`` attribute.
+    """
+
+    def __init__(self, source, workers=None, threshold=10000, **options):
+        options.setdefault('compiled', True)
+        self.env = module(source, **options)
+        self.threshold = threshold
+        self.workers = workers or multiprocessing.cpu_count()
+        self.pool = multiprocessing.Pool(self.workers, _start,
+                                         (source, options))
+
+    def all(self, name):
+        """ all(name), rewriting the arguments of large terms in parallel. """
+        return All(self, name)
+
+    def topdown(self, name):
+        """ topdown(name), rewriting the subterms of large terms in parallel. """
+        return Topdown(self, name)
+
+    def map(self, kind, name, terms):
+        """
+        Apply the strategy ``name``, or its ``topdown`` traversal, to
+        each of ``terms`` in the workers. The results in order, or FAIL
+        if any fails. Raises the WorkerError of the first term the
+        strategy raises an exception on.
+        """
+        runs = chunks(terms, self.workers * 4)
+        tasks = [(kind, name, c) for c in runs]
+        results = self.pool.map(_run, tasks, 1)
+        n = 0
+        for run, res in zip(runs, results):
+            if isinstance(res, WorkerError):
+                res.index += n
+                raise res
+            n += len(run)
+        if None in results:
+            return FAIL
+        return list(chain.from_iterable(results))
+
+    def imap(self, name, terms, chunksize=64, text=False):
+        """
+        Apply the strategy ``name`` to each of ``terms``, any iterable,
+        in the workers ``chunksize`` terms at a time. Yields the results
+        in order as they arrive, FAIL for each term it fails on and a
+        WorkerError, numbering the term in ``terms``, for each term it
+        raises an exception on, parsing included.
+
+        Terms given as strings are parsed by the workers, and with
+        ``text`` set the results come back printed, which spares this
+        process the parsing and printing and costs less to send.
+
+        At most two chunks per worker are read ahead of the results
+        yielded, so a long stream of terms is rewritten in bounded
+        memory.
+        """
+        pending = deque()
+        n = 0
+        for c in batches(terms, chunksize):
+            task = (name, c, text)
+            pending.append((n, self.pool.apply_async(_batch, (task,))))
+            n += len(c)
+            if len(pending) < 2 * self.workers:
+                continue
+            for res in results(*pending.popleft()):
+                yield res
+
+        while pending:
+            for res in results(*pending.popleft()):
+                yield res
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def terminate(self):
+        self.pool.terminate()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.terminate()
+
+def rewrite_many(source, name, terms, workers=None, chunksize=64,
+                 **options):
+    """
+    Rewrite each of ``terms`` with the strategy ``name`` of the module
+    built from ``source``, in a pool of ``workers`` processes. Yields
+    the results in order, FAIL for each term the strategy fails on and
+    a WorkerError for each it raises an exception on.
+    """
+    with Pool(source, workers, **options) as pool:
+        for res in pool.imap(name, terms, chunksize):
+            yield res
+
+def results(n, chunk):
+    # the results of the chunk starting with term n, as yielded by imap
+    for res in chunk.get():
+        if res is None:
+            res = FAIL
+        elif isinstance(res, WorkerError):
+            res.index += n
+        yield res
+
+def batches(terms, n):
+    """ ``terms``, any iterable, in lists of ``n``. """
+    terms = iter(terms)
+    while True:
+        run = list(islice(terms, n))
+        if not run:
+            return
+        yield run
+
+def chunks(terms, n):
+    """ ``terms`` split into at most ``n`` runs of about equal size. """
+    target = sum(t.size for t in terms) / n + 1
+    out, run, size = [], [], 0
+    for t in terms:
+        run.append(t)
+        size += t.size
+        if size >= target:
+            out.append(run)
+            run, size = [], 0
+    if run:
+        out.append(run)
+    return out
+
+#------------------------------------------------------------------------
+# Traversals
+#------------------------------------------------------------------------
+
+class All(Combinator):
+    def __init__(self, pool, name):
+        self.pool = pool
+        self.name = name
+        self._s = lift(pool.env[name])
+
+    def apply(self, o):
+        if not isinstance(o, traverse.CONGRUENT) or o.size < self.pool.threshold:
+            return traverse.all_args(self._s, o)
+        args = self.pool.map('apply', self.name, o.args)
+        if args is FAIL:
+            return FAIL
+        return traverse.rebuild(o, o.args, args)
+
+class Topdown(Combinator):
+    def __init__(self, pool, name):
+        self.pool = pool
+        self.name = name
+        self._s = lift(pool.env[name])
+        self._local = lift(comb.Topdown(pool.env[name]))
+
+    def apply(self, o):
+        if o.size < self.pool.threshold:
+            return self._local(o)
+
+        y = self._s(o)
+        if y is FAIL:
+            return FAIL
+        if not (isinstance(y, traverse.CONGRUENT) and y.args) \
+                or y.size < self.pool.threshold:
+            return traverse.all_args(self._local, y)
+
+        plan = self.split(y)
+        if plan is FAIL:
+            return FAIL
+
+        root, tasks = plan
+        results = self.pool.map('topdown', self.name, tasks)
+        if results is FAIL:
+            return FAIL
+        return splice(root, results)
+
+    def split(self, y):
+        """
+        Rewrite the large terms under the large term ``y``, which the
+        strategy has been applied to, in this process. Returns the plan
+        of ``y`` and the subterms left to the workers, or FAIL.
+
+        A plan is a list of the term, its children and the parts making
+        up the rewritten children: the index of a subterm left to the
+        workers, a rewritten term, or the plan of a large term.
+        """
+        s, local, threshold = self._s, self._local, self.pool.threshold
+        tasks = []
+
+        root = [y, y.args, []]
+        stack = [root]
+        while stack:
+            node, kids, parts = stack[-1]
+            if len(parts) == len(kids):
+                stack.pop()
+                continue
+
+            x = kids[len(parts)]
+            if x.size < threshold:
+                parts.append(len(tasks))
+                tasks.append(x)
+                continue
+
+            x = s(x)
+            if x is FAIL:
+                return FAIL
+            if isinstance(x, traverse.CONGRUENT) and x.args \
+                    and x.size >= threshold:
+                plan = [x, x.args, []]
+                parts.append(plan)
+                stack.append(plan)
+            else:
+                x = traverse.all_args(local, x)
+                if x is FAIL:
+                    return FAIL
+                parts.append(x)
+
+        return root, tasks
+
+def splice(root, results):
+    """ The term planned by ``root`` with the subterms ``results``. """
+    stack = [(root, [])]
+    while True:
+        (node, kids, parts), args = stack[-1]
+        if len(args) < len(parts):
+            p = parts[len(args)]
+            if type(p) is int:
+                args.append(results[p])
+            elif type(p) is list:
+                stack.append((p, []))
+            else:
+                args.append(p)
+            continue
+
+        stack.pop()
+        t = traverse.rebuild(node, kids, args)
+        if not stack:
+            return t
+        stack[-1][1].append(t)
@@ -0,0 +1,93 @@
+"""
+Profiles of rules and strategies.
+
+A module built with a ``profile`` records, for each rule, rule block
+and named strategy, the number of times it is tried, how many of these
+fail and the time spent in it::
+
+    profile = Profile()
+    env = module(source, profile=profile)
+    env['dnf'](t)
+    print profile.report()
+
+The rule blocks and strategies of such a module apply through wrappers
+doing the counting, which a module built without a profile does not
+have, so profiling costs nothing unless asked for. The time of a block
+or strategy includes the time of everything it calls. Compiled and
+optimized strategies inline the strategies they name, which are then
+only profiled when called directly.
+"""
+
+from timeit import default_timer as clock
+
+class Stats(object):
+    """ The calls, failures and time in seconds of a rule or strategy. """
+
+    __slots__ = ('kind', 'name', 'calls', 'failures', 'time', 'obj')
+
+    def __init__(self, kind, name, obj):
+        self.kind = kind
+        self.name = name
+        self.obj = obj
+        self.calls = 0
+        self.failures = 0
+        self.time = 0.0
+
+    @property
+    def successes(self):
+        return self.calls - self.failures
+
+    @property
+    def ratio(self):
+        """ The fraction of calls which failed. """
+        return float(self.failures) / self.calls if self.calls else 0.0
+
+    def __repr__(self):
+        return '<Stats %s %s: %d calls, %d failed, %.3f s>' % (
+            self.kind, self.name, self.calls, self.failures, self.time)
+
+# report orders
+ORDERS = {
+    'time'     : lambda s: (-s.time, -s.calls),
+    'failures' : lambda s: (-s.ratio, -s.failures),
+    'calls'    : lambda s: (-s.calls, -s.time),
+}
+
+class Profile(object):
+
+    def __init__(self):
+        self.stats = {}
+
+    def entry(self, obj, kind, name):
+        """ The statistics of ``obj``, a rule, rule block or strategy. """
+        stats = self.stats.get(id(obj))
+        if stats is None:
+            stats = self.stats[id(obj)] = Stats(kind, name, obj)
+        return stats
+
+    def clear(self):
+        """ Reset every count, keeping the entries. """
+        for stats in self.stats.itervalues():
+            stats.calls = stats.failures = 0
+            stats.time = 0.0
+
+    def top(self, order='time', kind=None):
+        """
+        The statistics of everything called, of the given ``kind`` if
+        set, sorted by ``order``: time, failures ( the fraction of calls
+        which fail ) or calls.
+        """
+        key = ORDERS[order]
+        return sorted((s for s in self.stats.itervalues()
+                       if s.calls and (kind is None or s.kind == kind)),
+                      key=key)
+
+    def report(self, order='time', limit=20, kind=None):
+        """ The ``limit`` first of ``top`` as a table. """
+        lines = ['%10s %10s %10s %6s %10s  %-8s %s' % (
+            'calls', 'succeeded', 'failed', 'fail%', 'time ms', 'kind', 'name')]
+        for s in self.top(order, kind)[:limit]:
+            lines.append('%10d %10d %10d %5.1f%% %10.2f  %-8s %s' % (
+                s.calls, s.successes, s.failures, 100 * s.ratio,
+                s.time * 1e3, s.kind, s.name))
+        return '\n'.join(lines)
@@ -1,10 +1,19 @@
-from functools import partial
+import copy
 
-from rewrite.matching import free, freev, fold, unfold, hylo, NoMatch
+from rewrite.matching import free, freev, NoMatch, FAIL
+from rewrite.terms import AAppl, ATerm, AInt, AReal, AString, ATuple, \
+    APlaceholder
 import rewrite.astnodes as ast
 
 from parse import dslparse
 import combinators as comb
+from codegen import compile_matcher, compile_builder, compile_strategy
+from automaton import Automaton
+from optimize import optimize, arguments, strip
+from memo import MemoTable
+from budget import Meter
+from profiling import Profile, clock
+from cost import CostModel
 
 def nameof(o):
     if isinstance(o, RuleBlock):
@@ -26,6 +35,7 @@ combinators = {
     'topdown'   : comb.Topdown,
     'bottomup'  : comb.Bottomup,
     'innermost' : comb.Innermost,
+    'cheapest'  : comb.Cheapest,
     'debug'     : comb.Debug,
 }
 
@@ -45,12 +55,207 @@ class Strategy(object):
                 % str(combinator)
 
         self.label = label or repr(self)
+        self.apply = self._apply = comb.lift(self.combinator)
+        self.compiled = None
+        self.memo = None
+        self.cycles = False
+        self.annotations = False
+        self.meter = None
+        self.profile = None
+        self.tracer = None
+        self.costs = None
+        self.lookahead = 0
+
+    def compile(self):
+        """
+        Compile the strategy into a single function and evaluate
+        through it from now on.
+        """
+        if self.compiled is None:
+            self.compiled = compile_strategy(self.combinator)
+            self.implement(self.compiled)
+        return self.compiled
+
+    def optimize(self, symbols=None):
+        """
+        Simplify the strategy expression and evaluate through the
+        result from now on, returning the strategy. With ``symbols``,
+        the constructor names which may occur in the input, the
+        strategy is left as it is and a copy is returned with the rules
+        which can never fire on such input pruned.
+        """
+        if symbols is None:
+            self._simplify()
+            return self
+        st = copy.copy(self)
+        st._simplify(symbols)
+        if st.profile is not None:
+            st.profiled(st.profile)
+        return st
+
+    def _simplify(self, symbols=None):
+        # a compiled strategy is compiled again once simplified
+        compiled = self.compiled is not None
+        self.combinator = optimize(self.combinator, symbols)
+        self.implement(comb.lift(self.combinator))
+        self.compiled = None
+        if self.memo is not None:
+            self.memoize(self.memo)
+        if self.cycles:
+            self.detect_cycles()
+        if self.annotations:
+            self.annotate()
+        if self.tracer is not None:
+            self.trace(self.tracer)
+        if self.costs is not None:
+            self.price(self.costs, self.lookahead)
+        if self.meter is not None:
+            self.measure(self.meter)
+        if compiled:
+            self.compile()
+
+    def memoize(self, table):
+        """
+        Record the results of the innermost and repeat combinators of
+        the strategy in the memo table ``table``.
+        """
+        self.memo = table
+        for s in walk(self.combinator):
+            if isinstance(s, (comb.Innermost, comb.Repeat)):
+                s.memo = table
+        if self.compiled is not None:
+            self.compiled = None
+            self.compile()
+        return table
+
+    def detect_cycles(self, cycles=True):
+        """
+        Let the innermost and repeat combinators of the strategy raise
+        STCycle on a term rewritten back to itself rather than loop
+        forever.
+        """
+        self.cycles = cycles
+        for s in walk(self.combinator):
+            if isinstance(s, (comb.Innermost, comb.Repeat)):
+                s.cycles = cycles
+        if self.compiled is not None:
+            self.compiled = None
+            self.compile()
+
+    def annotate(self, annotations=True):
+        """
+        Let the traversals of the strategy descend into annotated terms,
+        rewriting the term annotated and the terms of its annotation.
+        """
+        self.annotations = annotations
+        for s in walk(self.combinator):
+            if isinstance(s, TRAVERSALS):
+                s.annotations = annotations
+        if self.compiled is not None:
+            self.compiled = None
+            self.compile()
+
+    def trace(self, tracer):
+        """
+        Let the traversals of the strategy keep the position of the term
+        rewritten in ``tracer``, for the rule blocks reporting to it.
+        """
+        self.tracer = tracer
+        for s in walk(self.combinator):
+            if isinstance(s, TRAVERSALS):
+                s.tracer = tracer
+        if self.compiled is not None:
+            self.compiled = None
+            self.compile()
+
+    def price(self, model, lookahead=0):
+        """
+        Let the cheapest combinators of the strategy choose between
+        rules by the CostModel ``model``, pricing each result as the
+        cheapest term reached from it by up to ``lookahead`` rewrites.
+        """
+        self.costs = model
+        self.lookahead = lookahead
+        for s in walk(self.combinator):
+            if isinstance(s, comb.Cheapest):
+                s.model = model
+                s.depth = lookahead
+
+    def measure(self, meter):
+        """
+        Count the runs of the strategy against the budgets of ``meter``,
+        its repeat, innermost and traversal loops stopping once one is
+        spent.
+        """
+        self.meter = meter
+        for s in walk(self.combinator):
+            if isinstance(s, LOOPS):
+                s.meter = meter
+        if self.compiled is not None:
+            self.compiled = None
+            self.compile()
+
+    def implement(self, apply):
+        # the function applying the strategy, called through profiled
+        # when profiling as other strategies hold on to that
+        self._apply = apply
+        if self.profile is None:
+            self.apply = apply
+
+    def profiled(self, profile):
+        """
+        Record the calls, failures and time of the strategy in
+        ``profile`` from now on.
+        """
+        self.profile = profile
+        self._stats = profile.entry(self, 'strategy', self.label)
+        self.apply = self._profiled
+
+    def _profiled(self, o):
+        stats = self._stats
+        start = clock()
+        res = self._apply(o)
+        stats.time += clock() - start
+        stats.calls += 1
+        if res is FAIL:
+            stats.failures += 1
+        return res
 
     def __call__(self, o):
-        return self.combinator(o)
+        res = self.apply(o)
+        if res is FAIL:
+            raise comb.STFail()
+        return res
 
     rewrite = __call__
 
+    def run(self, o, budget):
+        """
+        Apply the strategy to ``o`` within ``budget``, returning the
+        result and whether the budget ran out, in which case the result
+        is the term reached so far. Takes a module built with
+        ``budgets`` set.
+        """
+        meter = self.meter
+        if meter is None:
+            raise ValueError("Strategy '%s' has no budgets, build its "
+                             "module with budgets set" % self.label)
+
+        meter.start(budget)
+        try:
+            res = self.apply(o)
+        finally:
+            meter.stop()
+
+        if budget.exhausted:
+            # the normal forms found once the rules fail are not
+            if self.memo is not None:
+                self.memo.clear()
+            return (o if res is FAIL else res), True
+        if res is FAIL:
+            raise comb.STFail()
+        return res, False
+
     def __repr__(self):
         return '%s(%s)' % (
             nameof(self.combinator),
@@ -58,37 +263,246 @@ class Strategy(object):
         )
 
 class Rule(object):
-    def __init__(self, lpat, rpat, left, right, rr):
+    def __init__(self, lpat, rpat, left, right, rr, match=None, build=None):
         self.lpat = lpat
         self.rpat = rpat
         self.left = left
         self.right = right
         self.rr = rr
+        self.match = match
+        self.build = build
 
     def rewrite(self, subject):
         return self.rr(subject)
 
     __call__ = rewrite
 
+    def apply(self, subject):
+        values = self.match(subject)
+        if values is FAIL:
+            return FAIL
+        return self.build(values)
+
     def __repr__(self):
         return '%r => %r ::\n\t %r -> %r' % \
             (self.left, self.right, self.lpat, self.rpat)
 
 class RuleBlock(object):
-    def __init__(self, rules=None, label=None):
+    """
+    An ordered block of rules sharing a label. Rules are indexed on the
+    constructor kind, name and arity of their left hand side and only
+    the rules which can match a subject are tried, in block order.
+
+    With ``automaton`` set the block instead matches all its rules at
+    once with a single left-to-right matching automaton.
+
+    With a ``meter`` each term tried and each rewrite made is counted
+    against the budget of the run in progress, and the block fails once
+    it is spent. With a ``profile`` the calls, failures and time of the
+    block and of each of its rules are recorded. With a ``tracer`` each
+    rewrite is reported to it.
+    """
+
+    def __init__(self, rules=None, label=None, automaton=False, meter=None,
+                 profile=None, tracer=None):
         self.rules = rules or []
         self.label = label
+        self.index = {}
+        self.automaton = automaton
+        self._automaton = None
+        self._keys = None
+        self.key = subject_key
+        self.meter = meter
+        if meter is not None:
+            self.apply = self.metered
+        self.profile = profile
+        if profile is not None:
+            self._stats = profile.entry(self, 'block', label)
+            self.apply = self.profiled
+        self.tracer = tracer
+        if tracer is not None:
+            for rule in self.rules:
+                tracer.watch(rule, rulename(self, rule))
+            self._untraced = self.apply
+            self.apply = self.traced
 
     def add(self, rule):
+        if self.tracer is not None:
+            self.tracer.watch(rule, rulename(self, rule))
         self.rules.append(rule)
+        self.index.clear()
+        self._automaton = None
+        self._keys = None
+
+    def dispatch(self, subject):
+        """ The rules which may match ``subject``, in block order. """
+        key = subject_key(subject)
+        bucket = self.index.get(key)
+        if bucket is None:
+            bucket = self._bucket(key)
+        return bucket
+
+    def _bucket(self, key):
+        if self._keys is None:
+            self._keys = [pattern_key(rule.left) for rule in self.rules]
+            self._names = set(k[1] for k in self._keys if k)
+        keys = self._keys
+
+        # names no rule mentions share a single bucket, which is also
+        # entered under the name itself while the index is small
+        kind, name, arity = key
+        if name not in self._names:
+            shared = (kind, None, arity)
+        else:
+            shared = key
+
+        bucket = self.index.get(shared)
+        if bucket is None:
+            bucket = self.index[shared] = tuple(
+                rule for rule, k in zip(self.rules, keys) if accepts(k, shared)
+            )
+        if len(self.index) < MAXINDEX:
+            self.index[key] = bucket
+        return bucket
+
+    def matcher(self):
+        """ The matching automaton for the block. """
+        if self._automaton is None:
+            self._automaton = Automaton([(r.left, r.lpat) for r in self.rules])
+        return self._automaton
+
+    def apply(self, pattern):
+        """ Rewrite with the first matching rule, or return FAIL. """
+        if self.automaton:
+            res = self.matcher().match(pattern)
+            if res is FAIL:
+                return FAIL
+            i, values = res
+            return self.rules[i].build(values)
+
+        for rule in self.dispatch(pattern):
+            values = rule.match(pattern)
+            if values is not FAIL:
+                return rule.build(values)
+        return FAIL
+
+    def metered(self, pattern):
+        """ apply, counting against the budget of the meter. """
+        # charge and spend inlined, this runs on every visit
+        meter = self.meter
+        meter.fuel -= 1
+        if meter.fuel < 0 and meter.check():
+            return FAIL
+
+        if self.automaton:
+            res = self.matcher().match(pattern)
+            if res is FAIL:
+                return FAIL
+            i, values = res
+            res = self.rules[i].build(values)
+        else:
+            for rule in self.dispatch(pattern):
+                values = rule.match(pattern)
+                if values is not FAIL:
+                    res = rule.build(values)
+                    break
+            else:
+                return FAIL
+
+        meter.rewrites -= 1
+        if meter.rewrites <= 0:
+            meter.spent()
+        return res
+
+    def profiled(self, pattern):
+        """ apply, or metered, recording the block and each rule tried. """
+        meter = self.meter
+        if meter is not None and not self.charge():
+            return FAIL
+
+        start = clock()
+        res = FAIL
+        if self.automaton:
+            # the rules are matched at once, only the one firing is
+            # recorded
+            match = self.matcher().match(pattern)
+            if match is not FAIL:
+                i, values = match
+                rule = self.rules[i]
+                res = rule.build(values)
+                stats = self.profile.entry(rule, 'rule', rulename(self, rule))
+                stats.calls += 1
+        else:
+            for rule in self.dispatch(pattern):
+                values = self.tried(rule, pattern)
+                if values is not FAIL:
+                    res = rule.build(values)
+                    break
+
+        self.record(start, res)
+        if res is not FAIL and meter is not None:
+            self.spend()
+        return res
+
+    def charge(self):
+        """ Count a visit against the budget, False once it is spent. """
+        meter = self.meter
+        meter.fuel -= 1
+        return meter.fuel >= 0 or not meter.check()
+
+    def spend(self):
+        """ Count a rewrite against the budget. """
+        meter = self.meter
+        meter.rewrites -= 1
+        if meter.rewrites <= 0:
+            meter.spent()
+
+    def commit(self, rule, pattern, res):
+        """
+        ``res``, the rewrite of ``pattern`` by ``rule`` chosen other
+        than by apply, counted against the budget and reported to the
+        tracer.
+        """
+        if self.meter is not None:
+            self.spend()
+        if self.tracer is not None:
+            self.tracer.fired(rule, pattern, res)
+        return res
+
+    def tried(self, rule, pattern):
+        """
+        The values of ``rule`` matching ``pattern``, or FAIL, recorded
+        in the profile as an attempt of the rule.
+        """
+        stats = self.profile.entry(rule, 'rule', rulename(self, rule))
+        start = clock()
+        values = rule.match(pattern)
+        stats.time += clock() - start
+        stats.calls += 1
+        if values is FAIL:
+            stats.failures += 1
+        return values
+
+    def record(self, start, res):
+        """ Record a call of the block from ``start`` giving ``res``. """
+        stats = self._stats
+        stats.time += clock() - start
+        stats.calls += 1
+        if res is FAIL:
+            stats.failures += 1
+
+    def traced(self, pattern):
+        """ apply, metered or profiled, reporting a rewrite. """
+        res = self._untraced(pattern)
+        if res is not FAIL:
+            self.tracer.fire(pattern, res)
+        return res
 
     def rewrite(self, pattern):
-        for rule in self.rules:
-            try:
-                return rule.rewrite(pattern)
-            except NoMatch:
-                continue
-        raise NoMatch()
+        res = self.apply(pattern)
+        if res is FAIL:
+            raise NoMatch()
+        return res
 
     def __call__(self, pattern):
         return self.rewrite(pattern)
@@ -100,6 +514,58 @@ class RuleBlock(object):
         out += ']\n'
         return out
 
+#------------------------------------------------------------------------
+# Dispatch
+#------------------------------------------------------------------------
+
+# entries in a dispatch index before unknown names stop being added
+MAXINDEX = 4096
+
+# Keys are ( kind, name, arity ) triples. A pattern key of None matches
+# any subject, a name of None any name.
+
+def rulename(block, rule):
+    return '%s : %s -> %s' % (block.label, rule.left, rule.right)
+
+def subject_key(t):
+    if isinstance(t, AAppl):
+        return ('appl', t.spine.term, len(t.args))
+    elif isinstance(t, (AInt, AReal, AString)):
+        return ('literal', None, None)
+    elif isinstance(t, ATerm):
+        return ('term', t.term, None)
+    elif isinstance(t, ATuple):
+        return ('tuple', None, len(t.args))
+    else:
+        return ('other', None, None)
+
+def pattern_key(p):
+    if isinstance(p, AAppl):
+        return ('appl', p.spine.term, len(p.args))
+    elif isinstance(p, (AInt, AReal, AString)):
+        return ('literal', None, None)
+    elif isinstance(p, ATerm):
+        return ('term', p.term, None)
+    elif isinstance(p, ATuple):
+        return ('tuple', None, len(p.args))
+    elif isinstance(p, APlaceholder):
+        # <appl(...)>
+        if p.args:
+            return ('appl', None, len(p.args))
+        # <term>
+        else:
+            return None
+    else:
+        # list patterns never match
+        return ('never', None, None)
+
+def accepts(pkey, skey):
+    if pkey is None:
+        return True
+    kind, name, arity = pkey
+    return (kind == skey[0] and arity == skey[2] and
+            (name is None or name == skey[1]))
+
 #------------------------------------------------------------------------
 # Buld Automata
 #------------------------------------------------------------------------
@@ -130,6 +596,21 @@ def build_strategy(label, env, comb, args):
 
     return Strategy(comb, sargs, label)
 
+TRAVERSALS = (comb.All, comb.Some, comb.Topdown, comb.Bottomup,
+              comb.Innermost)
+
+# the combinators looping over terms or rewrites
+LOOPS = (comb.Repeat, comb.Topdown, comb.Bottomup, comb.Innermost)
+
+def walk(s):
+    """ The combinators of the strategy ``s``, named strategies inlined. """
+    stack = [s]
+    while stack:
+        s = strip(stack.pop())
+        yield s
+        names = arguments.get(type(s), ())
+        stack.extend(getattr(s, n) for n in names)
+
 def build_rule(l, r, cons=None):
     lpat = []
     rpat = []
@@ -153,23 +634,87 @@ def build_rule(l, r, cons=None):
     left  = freev(l)
     right = freev(r)
 
-    ana  = partial(unfold, lpat, left)
-    cata = partial(fold, rpat, right)
+    # the distinct variables, in the order the matcher binds them
+    bound = []
+    for bind in lpat:
+        if bind not in bound:
+            bound.append(bind)
 
-    rr = partial(hylo, ana, cata)
-    return Rule(lpat, rpat, left, right, rr)
+    match = compile_matcher(left, lpat)
+    build = compile_builder(right, rpat, bound)
+
+    def rr(subject):
+        values = match(subject)
+        if values is FAIL:
+            raise NoMatch()
+        return build(values)
+
+    return Rule(lpat, rpat, left, right, rr, match, build)
 
 #------------------------------------------------------------------------
 # Module Constructions
 #------------------------------------------------------------------------
 
-def module(s, sorts=None, cons=None, _env=None):
+def module(s, sorts=None, cons=None, _env=None, automaton=False,
+           compiled=False, optimized=False, memo=None, annotations=False,
+           cycles=False, budgets=False, profile=None, trace=None,
+           costs=None, lookahead=0):
+    """
+    Build the rules and strategies defined by the source ``s``. With
+    ``automaton`` set each rule block matches through a left-to-right
+    matching automaton rather than trying its rules in turn. With
+    ``optimized`` set each strategy is algebraically simplified, and
+    with ``compiled`` set compiled into a single function.
+
+    With ``memo`` set to a size the strategies of the module share a
+    memo table of that many entries, recording the normal forms found
+    by innermost and repeat. The table is the ``memo`` attribute of
+    each strategy; clearing it clears the module.
+
+    The traversals descend into applications, tuples and lists, and
+    with ``annotations`` set into annotated terms as well.
+
+    With ``cycles`` set innermost and repeat raise STCycle on a term
+    rewritten back to itself, with the length of the cycle, rather than
+    looping forever.
+
+    With ``budgets`` set the rule blocks of the module share a Meter,
+    and each strategy can be run within a Budget with ``run``, one run
+    of the module at a time.
+
+    With a ``profile``, a Profile or True for a new one, the calls,
+    failures and time of each rule, rule block and named strategy are
+    recorded in it. The profile is the ``profile`` attribute of each
+    strategy.
+
+    With a ``trace``, a Tracer, each rewrite made by a rule is reported
+    to it with the position of the term rewritten. Every rewrite is
+    made and reported, so a traced module cannot be memoized.
+
+    The cheapest combinators rewrite with the rule of their block whose
+    result costs least, by default the smallest. With ``costs``, a
+    table of the cost of each constructor by name, a cost function as
+    for egraph.py or a CostModel, they share a CostModel pricing by it,
+    and with ``lookahead`` each result is priced as the cheapest term
+    reached from it by up to that many rewrites.
+    """
+    if memo and trace is not None:
+        raise ValueError('A traced module cannot be memoized')
     defs = dslparse(s)
 
     if _env:
         env = _env.copy()
     else:
         env = {}
+    strategies = []
+    meter = Meter() if budgets else None
+    if profile is True:
+        profile = Profile()
+    model = None
+    if isinstance(costs, CostModel):
+        model = costs
+    elif costs is not None or lookahead:
+        model = CostModel(costs)
 
     for df in defs:
 
@@ -181,7 +726,9 @@ def module(s, sorts=None, cons=None, _env=None):
             if label in env:
                 env[label].add(rr)
             else:
-                env[label] = RuleBlock([rr], label=label)
+                env[label] = RuleBlock([rr], label=label, automaton=automaton,
+                                       meter=meter, profile=profile,
+                                       tracer=trace)
 
         elif isinstance(df, ast.StrategyNode):
             label, comb, args = df
@@ -190,9 +737,34 @@ def module(s, sorts=None, cons=None, _env=None):
                 raise Exception, "Strategy definition '%s' already defined" % label
 
             st = build_strategy(label, env, comb, args)
+            if profile is not None:
+                st.profiled(profile)
+            strategies.append(st)
             env[label] = st
 
         else:
             raise NotImplementedError
 
+    if memo:
+        table = MemoTable(memo)
+
+    # after every rule is added to its block
+    for st in strategies:
+        if optimized:
+            st.optimize()
+        if memo:
+            st.memoize(table)
+        if annotations:
+            st.annotate()
+        if cycles:
+            st.detect_cycles()
+        if trace is not None:
+            st.trace(trace)
+        if model is not None:
+            st.price(model, lookahead)
+        if meter is not None:
+            st.measure(meter)
+        if compiled:
+            st.compile()
+
     return env
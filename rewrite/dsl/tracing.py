@@ -0,0 +1,409 @@
+"""
+Traces of rule firings.
+
+A module built with a ``trace`` reports every rewrite made by one of
+its rules to the hooks of a Tracer, as the name of the rule, the
+position of the term rewritten, the term itself and its reduct::
+
+    def hook(rule, path, before, after):
+        print rule, path
+
+    tracer = Tracer(hook)
+    env = module(source, trace=tracer)
+    tracer.run(env['dnf'], t)
+
+The position is the path of argument numbers from the subject of the
+run, kept by the traversals of the module as they descend. Hooks with
+``begin`` and ``end`` methods are also told the subject and the result
+of each run made through ``run``.
+
+DerivationLog is a hook writing the trace to a file in a compact
+binary format, buffered as the binary term format is, and ``replay``
+reads it back, rebuilding the whole term after each step.
+"""
+
+from collections import defaultdict
+
+from rewrite import binary
+from rewrite.binary import SYM, APPL, REF, BinaryFormatError
+from rewrite.terms import AAppl
+from rewrite.matching import FAIL
+from traverse import CONGRUENT, annotated, children, rebuild
+
+#------------------------------------------------------------------------
+# Tracer
+#------------------------------------------------------------------------
+
+class Tracer(object):
+    """
+    Calls each of ``hooks`` as ``hook(rule, path, before, after)`` on
+    every rule firing.
+    """
+
+    def __init__(self, *hooks):
+        self.hooks = list(hooks)
+        # the views of the traversals in progress, outermost first, each
+        # the path to the term it applies its argument to
+        self.views = []
+        self.rule = None
+        # id(rule) -> ( rule, name ), holding on to the rule so its id
+        # is not reused
+        self.names = {}
+
+    def add(self, hook):
+        self.hooks.append(hook)
+
+    def remove(self, hook):
+        self.hooks.remove(hook)
+
+    def watch(self, rule, name):
+        """
+        Report the firings of ``rule`` as ``name``, by noting it as the
+        rule fired whenever it builds a term.
+        """
+        entry = self.names.get(id(rule))
+        if entry is not None and entry[0] is rule:
+            return
+        self.names[id(rule)] = (rule, name)
+        build = rule.build
+
+        def traced(values):
+            self.rule = name
+            return build(values)
+        rule.build = traced
+
+    def path(self):
+        """ The position of the term being rewritten. """
+        views = self.views
+        if len(views) == 1:
+            return views[0]()
+        path = ()
+        for where in views:
+            path += where()
+        return path
+
+    def fire(self, before, after):
+        """ Called by a rule block rewriting ``before`` to ``after``. """
+        path = self.path()
+        for hook in self.hooks:
+            hook(self.rule, path, before, after)
+
+    def fired(self, rule, before, after):
+        """ Report the watched ``rule`` rewriting ``before`` to ``after``. """
+        self.rule = self.names[id(rule)][1]
+        self.fire(before, after)
+
+    def run(self, strategy, t):
+        """
+        Apply ``strategy`` to ``t``, telling the hooks the subject and
+        the result, None if the strategy fails. Returns the result or
+        FAIL.
+        """
+        self.notify('begin', t)
+        res = FAIL
+        try:
+            res = strategy.apply(t)
+        finally:
+            self.notify('end', None if res is FAIL else res)
+        return res
+
+    def notify(self, event, t):
+        for hook in self.hooks:
+            method = getattr(hook, event, None)
+            if method is not None:
+                method(t)
+
+#------------------------------------------------------------------------
+# Derivation Logs
+#------------------------------------------------------------------------
+
+# A log is a stream of records in the manner of the binary term format,
+# whose term encoding it shares:
+#
+#     log    : MAGIC VERSION record*
+#     record : SYM len bytes               -- define the next symbol id
+#            | RULE len bytes              -- define the next rule id
+#            | BEGIN term                  -- a run on its subject
+#            | STEP rule n index* term term -- a rewrite at a path
+#            | END term | FAILED           -- the result of the run
+#            | RESET                       -- restart the numbering
+#
+# Unlike the binary format the numbering of terms carries on from one
+# record to the next, so a term logged once, typically the reduct of a
+# step being rewritten again by the next, is written as a reference
+# from then on. The numbering restarts once LIMIT terms are numbered,
+# which keeps the memory of writers and readers bounded.
+
+MAGIC   = 'PBDL'
+VERSION = 1
+
+RULE    = 0x10
+BEGIN   = 0x11
+STEP    = 0x12
+END     = 0x13
+FAILED  = 0x14
+RESET   = 0x15
+
+LIMIT = 1 << 18
+
+# the number of steps written at a time
+PENDING = 1024
+
+class Table(dict):
+    """
+    The numbers of the symbols or rules of a log, each defined in it
+    with a ``tag`` record on its first use.
+    """
+
+    def __init__(self, log, tag):
+        dict.__init__(self)
+        self.log = log
+        self.tag = tag
+
+    def __missing__(self, name):
+        n = self[name] = len(self)
+        self.log.define(self.tag, name)
+        return n
+
+class DerivationLog(binary.Writer):
+    """
+    A hook writing the trace to the file ``fd``, opened in binary mode,
+    in writes of about ``binary.BUFSIZE`` bytes. The steps are encoded
+    PENDING at a time.
+    """
+
+    magic = MAGIC
+    version = VERSION
+
+    def __init__(self, fd):
+        binary.Writer.__init__(self, fd)
+        # each record is written to buf and then to out, after the
+        # definitions of the symbols and rules first used in it
+        self.out = self.buf
+        self.buf = bytearray()
+        self.symbols = Table(self, SYM)
+        self.rules = Table(self, RULE)
+        self._refs = {}
+        self._keep = []
+        # the steps not yet written, held on to with their terms
+        self.pending = []
+
+    def begin(self, subject):
+        self.record(BEGIN, subject)
+
+    def end(self, result):
+        if result is None:
+            if self.pending:
+                self._steps()
+            self.out.append(FAILED)
+        else:
+            self.record(END, result)
+
+    def step(self, rule, path, before, after):
+        pending = self.pending
+        pending.append((rule, path, before, after))
+        if len(pending) >= PENDING:
+            self._steps()
+            if len(self.out) >= binary.BUFSIZE:
+                self.flush()
+
+    __call__ = step
+
+    def _steps(self):
+        # write the pending steps
+        buf = self.buf
+        out = self.out
+        varint = self._varint
+        keep = self._keep
+        refs = self._refs
+        rules = self.rules
+        symbols = self.symbols
+        for rule, path, before, after in self.pending:
+            if len(keep) >= LIMIT:
+                self.reset()
+            buf.append(STEP)
+            varint(rules[rule])
+            varint(len(path))
+            if path and max(path) >= 0x80:
+                for i in path:
+                    varint(i)
+            else:
+                # indices below 0x80 are their own varints
+                buf.extend(path)
+
+            # most often each term is the reduct of an earlier step, or a
+            # term rebuilt around such reducts, which are written here
+            # rather than through the walk of _term
+            for t in (before, after):
+                ref = refs.get(id(t))
+                if ref is not None:
+                    ids = (ref,)
+                elif type(t) is AAppl and t.spine.annotation is None \
+                        and isinstance(t.spine.term, str):
+                    ids = [refs.get(id(a)) for a in t.args]
+                    if None in ids:
+                        self._term(t)
+                        continue
+                    buf.append(APPL)
+                    varint(symbols[t.spine.term])
+                    varint(len(ids))
+                    refs[id(t)] = len(keep)
+                    keep.append(t)
+                else:
+                    self._term(t)
+                    continue
+                for n in ids:
+                    buf.append(REF)
+                    varint(n)
+
+            out.extend(buf)
+            del buf[:]
+        del self.pending[:]
+
+    def record(self, tag, t):
+        if self.pending:
+            self._steps()
+        if len(self._keep) >= LIMIT:
+            self.reset()
+        self.buf.append(tag)
+        self._term(t)
+        self.out.extend(self.buf)
+        del self.buf[:]
+
+    def define(self, tag, name):
+        buf, self.buf = self.buf, self.out
+        self.buf.append(tag)
+        self._bytes(name)
+        self.buf = buf
+
+    def reset(self):
+        self.out.append(RESET)
+        self._refs.clear()
+        del self._keep[:]
+
+    def flush(self):
+        if self.pending:
+            self._steps()
+        self.fd.write(self.out)
+        del self.out[:]
+
+class LogReader(binary.Reader):
+    """
+    Iterating a log reader yields its records as tuples, ``('begin',
+    subject)``, ``('step', rule, path, before, after)`` and ``('end',
+    result)`` with a result of None for a failed run.
+    """
+
+    magic = MAGIC
+    version = VERSION
+
+    def __init__(self, fd):
+        binary.Reader.__init__(self, fd)
+        self.rules = []
+        self._refs = []
+
+    def __iter__(self):
+        varint = self._varint
+        while self._fill(1):
+            tag = self._byte()
+            if tag == SYM:
+                self.symbols.append(str(self._read(varint())))
+            elif tag == RULE:
+                self.rules.append(str(self._read(varint())))
+            elif tag == STEP:
+                rule = self.rules[varint()]
+                path = tuple([varint() for i in xrange(varint())])
+                before = self._term()
+                yield ('step', rule, path, before, self._term())
+            elif tag == BEGIN:
+                yield ('begin', self._term())
+            elif tag == END:
+                yield ('end', self._term())
+            elif tag == FAILED:
+                yield ('end', None)
+            elif tag == RESET:
+                self._refs = []
+            else:
+                raise BinaryFormatError('Unknown record 0x%02x' % tag)
+
+#------------------------------------------------------------------------
+# Replay
+#------------------------------------------------------------------------
+
+def arguments(t):
+    return t.args if isinstance(t, CONGRUENT) else children(t)
+
+def subterm(t, path):
+    """ The subterm of ``t`` at ``path``, or None. """
+    for i in path:
+        if not (isinstance(t, CONGRUENT) or annotated(t)):
+            return None
+        kids = arguments(t)
+        if i >= len(kids):
+            return None
+        t = kids[i]
+    return t
+
+def replace(t, path, new):
+    """ The term ``t`` with the subterm at ``path`` replaced by ``new``. """
+    spine = []
+    for i in path:
+        spine.append((t, i))
+        t = arguments(t)[i]
+    for node, i in reversed(spine):
+        kids = arguments(node)
+        args = list(kids)
+        args[i] = new
+        new = rebuild(node, kids, args)
+    return new
+
+# the terms kept to replay steps following a failure on
+HISTORY = 4096
+
+def replay(fd):
+    """
+    The steps of the log read from ``fd``, as ``( rule, path, before,
+    after, term )`` tuples where ``term`` is the whole term after the
+    step, or None outside of a run begun through Tracer.run.
+
+    Rewrites undone by a strategy failing after them are logged all the
+    same; a step rewriting a term not found at its position is taken to
+    follow such a failure, and is replayed on the latest of the last
+    HISTORY terms it applies to.
+    """
+    history = None
+    for record in LogReader(fd):
+        kind = record[0]
+        if kind == 'begin':
+            history = [record[1]]
+        elif kind == 'end':
+            history = None
+        else:
+            rule, path, before, after = record[1:]
+            term = None
+            if history is not None:
+                for n in xrange(len(history) - 1, -1, -1):
+                    t = subterm(history[n], path)
+                    if t is before or t is not None and t == before:
+                        del history[n+1:]
+                        term = replace(history[n], path, after)
+                        history.append(term)
+                        break
+                if len(history) > 2 * HISTORY:
+                    del history[:-HISTORY]
+            yield rule, path, before, after, term
+
+def summary(fd):
+    """
+    The number of runs and of steps in the log read from ``fd``, and
+    the number of times each rule fired.
+    """
+    runs = steps = 0
+    rules = defaultdict(int)
+    for record in LogReader(fd):
+        if record[0] == 'step':
+            rules[record[1]] += 1
+            steps += 1
+        elif record[0] == 'begin':
+            runs += 1
+    return runs, steps, dict(rules)
@@ -0,0 +1,554 @@
+"""
+Traversal engine.
+
+Each traversal walks the term with an explicit stack of frames rather
+than recursing through Python frames, so the depth of the term it can
+rewrite is bounded by memory alone. A frame holds the term being
+rebuilt, its children and the children rewritten so far. The subject
+sits in a root frame of its own, which makes applying the strategy to
+the subject the same step as applying it to any child.
+
+The children of an application are its arguments, and tuples and lists
+are traversed in the same way as applications. An annotated term is a
+leaf unless ``annotations`` is set, in which case its children are the
+term annotated followed by the terms of its annotation.
+
+The results agree with the recursive definitions:
+
+    all(s)       = f(t1 .. tn) -> f(s(t1) .. s(tn))
+    some(s)      = f(t1 .. tn) -> f(t1' .. tn'), ti' = s(ti) or ti
+    topdown(s)   = s ; all(topdown(s))
+    bottomup(s)  = all(bottomup(s)) ; s
+    innermost(s) = bottomup(try(s ; innermost(s)))
+
+with the strategy applied to subterms in the same order.
+
+Given a budget ``meter`` the traversals stop once the budget is spent,
+rebuilding the term from their frames with the children not yet reached
+left as they are. As every rule fails once it is spent, the meter is
+read only where that tells: topdown and bottomup read it as the strategy
+fails, which would otherwise fail the traversal, and innermost as the
+strategy succeeds, which could otherwise go on forever. A strategy
+succeeding on a spent budget leaves the term as it is, so topdown and
+bottomup then finish their pass with the term unchanged.
+
+Given a list ``views`` the traversals keep their place in it while they
+run, as a function returning the path of argument numbers from their
+subject to the term the strategy is applied to. The frames already hold
+the path, the number of children done at each level, so the view is
+computed only when it is asked for.
+"""
+
+from itertools import izip, imap
+from operator import attrgetter
+
+from rewrite.terms import AAppl, ATerm, AInt, AReal, AString, AList, ATuple, \
+    termtype
+from rewrite.matching import FAIL
+from memo import MISS
+
+# the terms whose children are their arguments
+CONGRUENT = (AAppl, ATuple, AList)
+
+#------------------------------------------------------------------------
+# Cycles
+#------------------------------------------------------------------------
+
+# Repeat and innermost optionally check for rewriting in a cycle with
+# Brent's algorithm: each term of the sequence is compared with a
+# single marked term, moved on to the terms numbered 1, 3, 7, 15, ...,
+# so that a cycle is found within about twice its length of entering
+# it. As the terms are compared for equality a cycle is never reported
+# falsely. Comparisons start from the mark at term SHORT, so the short
+# sequences of terminating rules cost no more than counting; as each
+# window after the mark is compared in full, the first match still
+# gives the length of the cycle.
+
+SHORT = 7
+
+class STCycle(Exception):
+    """ A term rewritten back to itself in ``length`` steps. """
+
+    def __init__(self, term, length):
+        Exception.__init__(self, 'Cycle of length %d at %s' % (length, term))
+        self.term = term
+        self.length = length
+
+def mark(k):
+    """ The number of the marked term compared with term ``k`` > 0. """
+    return (1 << (k.bit_length() - 1)) - 1
+
+#------------------------------------------------------------------------
+# Allocation
+#------------------------------------------------------------------------
+
+# A term whose children all come back unchanged is returned itself
+# rather than rebuilt, and a rebuilt term shares its unchanged children,
+# so a pass which rewrites nothing allocates nothing.
+
+class Allocations(object):
+    """ The number of terms built by the traversals. """
+
+    def __init__(self):
+        self.count = 0
+
+    def reset(self):
+        self.count = 0
+
+    def __repr__(self):
+        return '<Allocations: %d>' % self.count
+
+allocations = Allocations()
+
+def rebuild(t, kids, args):
+    """ The term ``t`` with its children ``kids`` replaced by ``args``. """
+    for a, b in izip(args, kids):
+        if a is not b:
+            break
+    else:
+        return t
+
+    allocations.count += 1
+    if isinstance(t, AAppl):
+        return AAppl(t.spine, args)
+    elif isinstance(t, ATerm):
+        args = iter(args)
+        term = next(args) if isinstance(t.term, TERMS) else t.term
+        return ATerm(term, splice(t.annotation, args))
+    else:
+        return termtype(t)(args)
+
+def unwind(stack, node, kids, args):
+    """
+    The term rebuilt from the frames of a traversal stopped early, with
+    the children not yet reached left as they are.
+    """
+    while True:
+        args.extend(kids[len(args):])
+        if not stack:
+            return args[0]
+        y = rebuild(node, kids, args)
+        frame = stack.pop()
+        node, kids, args = frame[0], frame[1], frame[2]
+        args.append(y)
+
+#------------------------------------------------------------------------
+# Annotations
+#------------------------------------------------------------------------
+
+TERMS = (ATerm, AAppl, AInt, AReal, AString, AList, ATuple)
+
+def annotated(t):
+    """ Whether ``t`` is a term with a non-empty annotation. """
+    return type(t) is ATerm and bool(t.annotation)
+
+def children(t):
+    """ The term annotated by ``t`` and the terms of its annotation. """
+    out = [t.term] if isinstance(t.term, TERMS) else []
+    stack = [t.annotation]
+    while stack:
+        a = stack.pop()
+        if isinstance(a, tuple):
+            stack.extend(reversed(a))
+        else:
+            out.append(a)
+    return out
+
+def splice(a, args):
+    # the annotation ``a`` with its terms taken in order from ``args``
+    if isinstance(a, tuple):
+        return tuple([splice(b, args) for b in a])
+    return next(args)
+
+#------------------------------------------------------------------------
+# Lists
+#------------------------------------------------------------------------
+
+# Long lists of leaves of one type, numbers, strings, names or
+# constructors without arguments, are rewritten in a single loop over
+# their elements rather than a step of the traversal each.
+
+BATCH = 64
+LEAVES = (AInt, AReal, AString, ATerm, AAppl)
+
+arguments = attrgetter('args')
+
+def leaves(t, annotations):
+    """ Whether ``t`` is a long list of leaves of a single type. """
+    kids = t.args
+    if type(t) is not AList or len(kids) < BATCH:
+        return False
+    ty = type(kids[0])
+    if ty not in LEAVES or (annotations and ty is ATerm):
+        return False
+    if len(set(map(type, kids))) != 1:
+        return False
+    return ty is not AAppl or not any(imap(arguments, kids))
+
+def bottomup_leaves(s, kids, args):
+    # the results of s on the leaves kids are appended to args up to the
+    # first it fails on, FAIL being returned
+    for x in kids:
+        y = s(x)
+        if y is FAIL:
+            return FAIL
+        args.append(y)
+    return None
+
+def descends(t, annotations):
+    """ Whether a traversal enters the term ``t``. """
+    if isinstance(t, CONGRUENT):
+        return len(t.args) > 0
+    return annotations and annotated(t)
+
+#------------------------------------------------------------------------
+# Views
+#------------------------------------------------------------------------
+
+def position(stack, args):
+    """ The path below the subject, the root frame being the first. """
+    if not stack:
+        return ()
+    return tuple([len(f[2]) for f in stack[1:]]) + (len(args),)
+
+#------------------------------------------------------------------------
+# One Level
+#------------------------------------------------------------------------
+
+def all_args(s, o, annotations=False, views=None):
+    """ Apply ``s`` to every child of ``o``, or FAIL. """
+    if isinstance(o, CONGRUENT):
+        kids = o.args
+    elif annotations and annotated(o):
+        kids = children(o)
+    else:
+        return o
+
+    args = []
+    if views is not None:
+        views.append(lambda: (len(args),))
+    try:
+        for a in kids:
+            a = s(a)
+            if a is FAIL:
+                return FAIL
+            args.append(a)
+    finally:
+        if views is not None:
+            views.pop()
+    return rebuild(o, kids, args)
+
+def some_args(s, o, annotations=False, views=None):
+    """ Apply ``s`` to the children of ``o`` it succeeds on, or FAIL. """
+    if isinstance(o, CONGRUENT):
+        kids = o.args
+    elif annotations and annotated(o):
+        kids = children(o)
+    else:
+        return FAIL
+
+    args = []
+    if views is not None:
+        views.append(lambda: (len(args),))
+    try:
+        for a in kids:
+            res = s(a)
+            args.append(a if res is FAIL else res)
+    finally:
+        if views is not None:
+            views.pop()
+    return rebuild(o, kids, args)
+
+#------------------------------------------------------------------------
+# Traversals
+#------------------------------------------------------------------------
+
+def topdown(s, t, annotations=False, meter=None, views=None):
+    stack = []
+    node, kids, args = None, (t,), []
+    if views is not None:
+        views.append(lambda: position(stack, args))
+    try:
+        y = s(t)
+        while True:
+            if y is FAIL:
+                if meter is not None and meter.exhausted:
+                    return unwind(stack, node, kids, args)
+                return FAIL
+            if isinstance(y, CONGRUENT) and y.args:
+                stack.append((node, kids, args))
+                node, kids, args = y, y.args, []
+                if type(y) is AList and leaves(y, annotations):
+                    y = topdown_leaves(s, kids, args, annotations)
+                    if y is not None:
+                        continue
+                else:
+                    y = s(kids[0])
+                    continue
+            elif annotations and annotated(y):
+                stack.append((node, kids, args))
+                node, kids, args = y, children(y), []
+                y = s(kids[0])
+                continue
+            else:
+                args.append(y)
+
+            while len(args) == len(kids):
+                if not stack:
+                    return args[0]
+                y = rebuild(node, kids, args)
+                node, kids, args = stack.pop()
+                args.append(y)
+            y = s(kids[len(args)])
+    finally:
+        if views is not None:
+            views.pop()
+
+def topdown_leaves(s, kids, args, annotations):
+    # the results of s on the leaves kids are appended to args up to the
+    # first the traversal enters, or fails on, which is returned
+    for x in kids:
+        y = s(x)
+        if y is FAIL or isinstance(y, CONGRUENT) and y.args \
+                or annotations and annotated(y):
+            return y
+        args.append(y)
+    return None
+
+def bottomup(s, t, annotations=False, meter=None, views=None):
+    stack = []
+    node, kids, args = None, (t,), []
+    if views is not None:
+        views.append(lambda: position(stack, args))
+    try:
+        x = t
+        while True:
+            if isinstance(x, CONGRUENT) and x.args:
+                stack.append((node, kids, args))
+                node, kids, args = x, x.args, []
+                if type(x) is AList and leaves(x, annotations):
+                    # the bottomup traversal of a leaf is s itself
+                    if bottomup_leaves(s, kids, args) is FAIL:
+                        if meter is not None and meter.exhausted:
+                            return unwind(stack, node, kids, args)
+                        return FAIL
+                    x = rebuild(node, kids, args)
+                    node, kids, args = stack.pop()
+                else:
+                    x = kids[0]
+                    continue
+            elif annotations and annotated(x):
+                stack.append((node, kids, args))
+                node, kids, args = x, children(x), []
+                x = kids[0]
+                continue
+
+            # x has its children rewritten
+            while True:
+                y = s(x)
+                if y is FAIL:
+                    if meter is not None and meter.exhausted:
+                        args.append(x)
+                        return unwind(stack, node, kids, args)
+                    return FAIL
+                args.append(y)
+                if len(args) < len(kids):
+                    x = kids[len(args)]
+                    break
+                if not stack:
+                    return args[0]
+                x = rebuild(node, kids, args)
+                node, kids, args = stack.pop()
+    finally:
+        if views is not None:
+            views.pop()
+
+def innermost(s, t, memo=None, tag=None, annotations=False, cycles=False,
+              meter=None, views=None):
+    """
+    Normalise ``t`` with ``s``. With ``memo`` the normal form of each
+    term is looked up and recorded in the memo table under ``( tag,
+    term )``. With ``cycles`` set STCycle is raised on a term rewritten
+    back to itself in its place.
+    """
+    if memo is not None:
+        return memo_innermost(s, t, memo, tag, annotations, cycles, meter,
+                              views)
+    elif cycles:
+        return cycle_innermost(s, t, annotations, meter, views)
+
+    stack = []
+    node, kids, args = None, (t,), []
+    if views is not None:
+        views.append(lambda: position(stack, args))
+    try:
+        x = t
+        while True:
+            if isinstance(x, CONGRUENT) and x.args:
+                stack.append((node, kids, args))
+                node, kids, args = x, x.args, []
+                if type(x) is AList and leaves(x, annotations):
+                    x = innermost_leaves(s, kids, args, annotations, meter)
+                    if x is not FAIL:
+                        continue
+                    x = rebuild(node, kids, args)
+                    node, kids, args = stack.pop()
+                else:
+                    x = kids[0]
+                    continue
+            elif annotations and annotated(x):
+                stack.append((node, kids, args))
+                node, kids, args = x, children(x), []
+                x = kids[0]
+                continue
+
+            # x has normal children, it is normal once s fails on it and
+            # the result of s is normalised in its place
+            while True:
+                y = s(x)
+                if y is not FAIL:
+                    if meter is not None and meter.exhausted:
+                        args.append(y)
+                        return unwind(stack, node, kids, args)
+                    x = y
+                    break
+                args.append(x)
+                if len(args) < len(kids):
+                    x = kids[len(args)]
+                    break
+                if not stack:
+                    return args[0]
+                x = rebuild(node, kids, args)
+                node, kids, args = stack.pop()
+    finally:
+        if views is not None:
+            views.pop()
+
+def innermost_leaves(s, kids, args, annotations, meter=None):
+    # the normal forms of the leaves kids are appended to args up to the
+    # first rewritten into a term the traversal enters, or rewritten
+    # once the budget is spent, which is returned
+    for x in kids:
+        y = s(x)
+        while y is not FAIL:
+            if isinstance(y, CONGRUENT) and y.args \
+                    or annotations and annotated(y) \
+                    or meter is not None and meter.exhausted:
+                return y
+            x = y
+            y = s(x)
+        args.append(x)
+    return FAIL
+
+def cycle_innermost(s, t, annotations=False, meter=None, views=None):
+    # innermost with the terms rewritten in each place checked for
+    # cycles, c holding the marked term, its number and the number of
+    # the last term, or None until s first succeeds in the place; the
+    # term entered in the place is the first, kids[len(args)]
+    stack = []
+    node, kids, args, c = None, (t,), [], None
+    if views is not None:
+        views.append(lambda: position(stack, args))
+    try:
+        x = t
+        while True:
+            if isinstance(x, CONGRUENT) and x.args:
+                stack.append((node, kids, args, c))
+                node, kids, args, c = x, x.args, [], None
+                x = kids[0]
+                continue
+            elif annotations and annotated(x):
+                stack.append((node, kids, args, c))
+                node, kids, args, c = x, children(x), [], None
+                x = kids[0]
+                continue
+
+            while True:
+                y = s(x)
+                if y is not FAIL:
+                    if meter is not None and meter.exhausted:
+                        args.append(y)
+                        return unwind(stack, node, kids, args)
+                    if c is None:
+                        marked, m, k = kids[len(args)], 0, 1
+                    else:
+                        marked, m, k = c
+                        k += 1
+                    if m >= SHORT and y == marked:
+                        raise STCycle(y, k - m)
+                    if k == 2 * m + 1:
+                        marked, m = y, k
+                    c = (marked, m, k)
+                    x = y
+                    break
+                args.append(x)
+                c = None
+                if len(args) < len(kids):
+                    x = kids[len(args)]
+                    break
+                if not stack:
+                    return args[0]
+                x = rebuild(node, kids, args)
+                node, kids, args, c = stack.pop()
+    finally:
+        if views is not None:
+            views.pop()
+
+def memo_innermost(s, t, memo, tag, annotations, cycles=False, meter=None,
+                   views=None):
+    # xs holds the terms sharing the normal form of x, the term entered
+    # in the slot and each result of s normalised in its place, which
+    # are the sequence checked for cycles
+    stack = []
+    node, kids, args = None, (t,), []
+    if views is not None:
+        views.append(lambda: position(stack, args))
+    try:
+        x, xs = t, [t]
+        while True:
+            r = MISS if memo is None else memo.get((tag, x))
+            if r is MISS and descends(x, annotations):
+                stack.append((node, kids, args, xs))
+                node, kids, args = x, x.args if isinstance(x, CONGRUENT) \
+                    else children(x), []
+                x = kids[0]
+                xs = [x]
+                continue
+
+            while True:
+                if r is MISS:
+                    y = s(x)
+                    if y is not FAIL:
+                        if meter is not None and meter.exhausted:
+                            # y is not known to be normal, nothing is
+                            # recorded
+                            args.append(y)
+                            return unwind(stack, node, kids, args)
+                        x = y
+                        xs.append(y)
+                        if cycles and len(xs) > SHORT + 1:
+                            k = len(xs) - 1
+                            m = mark(k)
+                            if y == xs[m]:
+                                raise STCycle(y, k - m)
+                        break
+                    r = x
+
+                if memo is not None:
+                    for k in xs:
+                        memo.put((tag, k), r)
+                    memo.put((tag, r), r)
+
+                args.append(r)
+                if len(args) < len(kids):
+                    x = kids[len(args)]
+                    xs = [x]
+                    break
+                if not stack:
+                    return args[0]
+                x = rebuild(node, kids, args)
+                node, kids, args, xs = stack.pop()
+                r = MISS
+    finally:
+        if views is not None:
+            views.pop()
@@ -0,0 +1,329 @@
+"""
+Memory-mapped term files.
+
+A random access counterpart to ``rewrite.binary`` for large term
+corpora. The file is the column layout of a ``TermArena`` written as
+fixed width node records, so any node can be located from its id
+without reading the nodes before it::
+
+    header
+    symbols   : ( len bytes )*
+    nodes     : ( kind sym first arity payload depth size hash )*
+    kids      : int32*
+    literals  : encoded ints, reals and strings
+    notes     : binary encoded annotations
+
+Loading a file maps it and returns a lazy view of the root term. Views
+are subclasses of the term classes and implement the same attribute
+protocol ( ``spine``, ``args``, ``term``, ``val`` ), but only read the
+nodes of their children when those are first accessed. A strategy that
+inspects only the upper levels of a term only touches the pages that
+hold them.
+"""
+
+import sys
+import mmap
+import struct
+from array import array
+
+from rewrite.terms import AAppl, ATerm, AInt, AReal, AString, AList, \
+    ATuple, APlaceholder
+from rewrite.arena import TermArena, TERM, ANNOT, APPL, INT, REAL, STR, \
+    LIST, TUPLE, PLACEHOLDER
+from rewrite import binary
+
+MAGIC   = 'PTAM'
+VERSION = 1
+
+header = struct.Struct('<4sBxxxiiiiqqqqqq')
+record = struct.Struct('<bxxxiiiiiqq')
+int32  = struct.Struct('<i')
+double = struct.Struct('<d')
+
+class MappedFormatError(Exception):
+    pass
+
+#------------------------------------------------------------------------
+# Writer
+#------------------------------------------------------------------------
+
+def varint(n):
+    out = bytearray()
+    while n > 0x7F:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+    return out
+
+def dump(term, fd):
+    """ Write ``term`` to the file object ``fd`` in the mapped layout. """
+    arena = TermArena()
+    root = arena.add(term)
+
+    symbols = bytearray()
+    for name in arena.symbols:
+        symbols += varint(len(name))
+        symbols += name
+
+    # literal and annotation payloads become byte offsets into their
+    # sections
+    literals = bytearray()
+    lits = []
+    for val in arena.literals:
+        lits.append(len(literals))
+        if isinstance(val, float):
+            literals += double.pack(val)
+        else:
+            s = str(val)
+            literals += varint(len(s))
+            literals += s
+
+    notes = bytearray()
+    anns = []
+    for annotation in arena.annotations:
+        anns.append(len(notes))
+        data = binary.dumps(ATerm('', annotation))
+        notes += varint(len(data))
+        notes += data
+
+    # size, depth and hash of the term object behind each node
+    meta = {}
+    stack = [(term, root)]
+    while stack:
+        t, nid = stack.pop()
+        if nid in meta:
+            continue
+        meta[nid] = (t.depth, t.size, hash(t))
+        stack.extend(zip(arena._subterms(t), arena.children(nid)))
+        if arena.kind[nid] == APPL and arena.payload[nid] >= 0:
+            stack.append((t.spine, arena.payload[nid]))
+
+    nodes = bytearray(record.size * len(arena))
+    for nid in xrange(len(arena)):
+        kind = arena.kind[nid]
+        payload = arena.payload[nid]
+        if kind in (INT, REAL, STR):
+            payload = lits[payload]
+        elif kind == ANNOT:
+            payload = anns[payload]
+        record.pack_into(nodes, nid * record.size, kind, arena.sym[nid],
+            arena.first[nid], arena.arity[nid], payload, *meta[nid])
+
+    kids = arena.kids
+    if sys.byteorder == 'big':
+        kids = array('i', kids)
+        kids.byteswap()
+    kids = kids.tostring()
+
+    offset = header.size
+    sections = []
+    for section in (symbols, nodes, kids, literals, notes):
+        sections.append(offset)
+        offset += len(section)
+
+    fd.write(header.pack(MAGIC, VERSION, len(arena.symbols), len(arena),
+        len(arena.kids), root, hash(MAGIC), *sections))
+    for section in (symbols, nodes, kids, literals, notes):
+        fd.write(section)
+
+#------------------------------------------------------------------------
+# Mapped Files
+#------------------------------------------------------------------------
+
+class MappedTerms(object):
+    """
+    A memory-mapped term file. Only the header and the symbol table
+    are read when opening, nodes are decoded on demand.
+    """
+
+    def __init__(self, fd):
+        self.fd = fd
+        self.map = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self.map) < header.size:
+            raise MappedFormatError('Not a mapped term file')
+
+        (magic, version, nsyms, self.nnodes, self.nkids, self.rootid, probe,
+         syms, self.nodes, self.kids, self.literals, self.notes) = \
+            header.unpack_from(self.map, 0)
+
+        # stored hashes are only valid if strings hash the same here
+        self.hashes = probe == hash(MAGIC)
+
+        if magic != MAGIC:
+            raise MappedFormatError('Not a mapped term file')
+        if version != VERSION:
+            raise MappedFormatError('Unsupported version %d' % version)
+
+        self.symbols = []
+        pos = syms
+        for i in xrange(nsyms):
+            n, pos = self._varint(pos)
+            self.symbols.append(self.map[pos:pos+n])
+            pos += n
+
+        # one spine object per symbol
+        self.spines = {}
+
+    def close(self):
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.nnodes
+
+    @property
+    def root(self):
+        return self.view(self.rootid)
+
+    #--------------------------------------------------------------------
+
+    def _varint(self, pos):
+        n = shift = 0
+        while True:
+            b = ord(self.map[pos])
+            pos += 1
+            n |= (b & 0x7F) << shift
+            if b < 0x80:
+                return n, pos
+            shift += 7
+
+    def node(self, nid):
+        if not 0 <= nid < self.nnodes:
+            raise IndexError(nid)
+        return record.unpack_from(self.map, self.nodes + nid * record.size)
+
+    def children(self, first, arity):
+        pos = self.kids + first * int32.size
+        return struct.unpack_from('<%di' % arity, self.map, pos)
+
+    def spine(self, sym):
+        try:
+            return self.spines[sym]
+        except KeyError:
+            spine = self.spines[sym] = ATerm(self.symbols[sym], None)
+            return spine
+
+    def view(self, nid):
+        """ The term for node ``nid``, compound nodes as lazy views. """
+        kind, sym, first, arity, payload, depth, size, h = self.node(nid)
+        if not self.hashes:
+            h = None
+
+        if kind == APPL:
+            return MappedAppl.view(self, first, arity, size, depth, h,
+                                   sym, payload)
+        elif kind == LIST:
+            return MappedList.view(self, first, arity, size, depth, h)
+        elif kind == TUPLE:
+            return MappedTuple.view(self, first, arity, size, depth, h)
+        elif kind == TERM:
+            return self.spine(sym)
+        elif kind == ANNOT:
+            annotation = self.annotation(payload)
+            if arity:
+                return ATerm(self.view(self.children(first, arity)[0]), annotation)
+            return ATerm(self.symbols[sym], annotation)
+        elif kind == INT:
+            n, pos = self._varint(self.literals + payload)
+            return AInt(int(self.map[pos:pos+n]))
+        elif kind == REAL:
+            return AReal(double.unpack_from(self.map, self.literals + payload)[0])
+        elif kind == STR:
+            n, pos = self._varint(self.literals + payload)
+            return AString(self.map[pos:pos+n])
+        elif kind == PLACEHOLDER:
+            args = map(self.view, self.children(first, arity)) if payload else None
+            return APlaceholder(self.symbols[sym], args)
+        else:
+            raise MappedFormatError('Unknown node kind %d' % kind)
+
+    def annotation(self, offset):
+        n, pos = self._varint(self.notes + offset)
+        return binary.loads(self.map[pos:pos+n]).annotation
+
+#------------------------------------------------------------------------
+# Views
+#------------------------------------------------------------------------
+
+# The views shadow the ``spine`` and ``args`` slots of the term classes
+# they extend with lazy properties. Size, depth and structural hash are
+# stored with each node so that building new terms over views does not
+# force their subterms. Hashes are only reused if the writing process
+# hashed strings the same way, otherwise they are computed on demand.
+
+class LazyArgs(object):
+    __slots__ = ()
+
+    @classmethod
+    def view(cls, f, first, arity, size, depth, h):
+        self = object.__new__(cls)
+        self._bind(f, first, arity, size, depth, h)
+        return self
+
+    def _bind(self, f, first, arity, size, depth, h):
+        self._file = f
+        self._first = first
+        self._arity = arity
+        self._args = None
+        self._h = h
+        self.size = size
+        self.depth = depth
+
+    @property
+    def args(self):
+        if self._args is None:
+            f = self._file
+            self._args = tuple(map(f.view, f.children(self._first, self._arity)))
+        return self._args
+
+    @property
+    def _hash(self):
+        if self._h is None:
+            self._h = hash(self.args)
+        return self._h
+
+class MappedAppl(LazyArgs, AAppl):
+    __slots__ = ('_file', '_first', '_arity', '_args', '_h', '_sym', '_spine')
+
+    @classmethod
+    def view(cls, f, first, arity, size, depth, h, sym, spine):
+        self = object.__new__(cls)
+        self._bind(f, first, arity, size, depth, h)
+        self._sym = sym
+        self._spine = spine
+        return self
+
+    @property
+    def spine(self):
+        if self._spine >= 0:
+            return self._file.view(self._spine)
+        return self._file.spine(self._sym)
+
+    @property
+    def _hash(self):
+        if self._h is None:
+            self._h = hash((self.spine, self.args))
+        return self._h
+
+class MappedList(LazyArgs, AList):
+    __slots__ = ('_file', '_first', '_arity', '_args', '_h')
+
+class MappedTuple(LazyArgs, ATuple):
+    __slots__ = ('_file', '_first', '_arity', '_args', '_h')
+
+#------------------------------------------------------------------------
+# Toplevel
+#------------------------------------------------------------------------
+
+def load(path):
+    """
+    Map the term file at ``path`` and return its root term as a lazy
+    view. The mapping stays open for the lifetime of the views.
+    """
+    return MappedTerms(open(path, 'rb')).root
@@ -14,6 +14,17 @@ placeholders = {
 class NoMatch(Exception):
     pass
 
+class Failure(object):
+    """ Sentinel returned in place of a result when matching fails. """
+
+    def __repr__(self):
+        return 'FAIL'
+
+    def __nonzero__(self):
+        return False
+
+FAIL = Failure()
+
 #------------------------------------------------------------------------
 # Traversal
 #------------------------------------------------------------------------
@@ -68,13 +79,13 @@ def aterm_zip(a, b):
 def aterm_splice(a, elts):
 
     if isinstance(a, aterm):
-        yield a
+        yield canonical(a)
 
     elif isinstance(a, (aint, areal, astr)):
-        yield a
+        yield canonical(a)
 
     elif isinstance(a, aappl):
-        yield aappl(a.spine, [init(aterm_splice(ai,elts)) for ai in a.args])
+        yield aappl(canonical(a.spine), [init(aterm_splice(ai,elts)) for ai in a.args])
 
     elif isinstance(a, atupl):
         yield atupl([init(aterm_splice(ai,elts)) for ai in a.args])
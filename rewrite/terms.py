@@ -1,13 +1,167 @@
+from weakref import WeakValueDictionary
+from contextlib import contextmanager
+
+#------------------------------------------------------------------------
+# Maximal Sharing
+#------------------------------------------------------------------------
+
+# When sharing is enabled every term constructor is routed through an
+# intern table so that structurally identical terms built from shared
+# children are the same object. The table holds its terms weakly, so
+# sharing never extends the lifetime of a term.
+
+class TermTable(object):
+    """
+    Weak-valued intern table keyed on constructor and the identities
+    of the constructor arguments.
+    """
+
+    def __init__(self):
+        self.table = WeakValueDictionary()
+
+    def intern(self, cls, args, kwargs):
+        key = (cls, cls.sharekey(*args, **kwargs))
+        term = self.table.get(key)
+        if term is None:
+            term = type.__call__(cls, *args, **kwargs)
+            self.table[key] = term
+        return term
+
+    def clear(self):
+        self.table.clear()
+
+    def __len__(self):
+        return len(self.table)
+
+    def __repr__(self):
+        return '<TermTable: %d terms>' % len(self)
+
+class TermMeta(type):
+    """
+    Metaclass of all term classes. Construction goes straight through
+    ``type.__call__`` unless sharing is enabled, in which case
+    ``__call__`` is swapped for one that consults the intern table.
+    """
+
+def _shared_call(cls, *args, **kwargs):
+    return _table.intern(cls, args, kwargs)
+
+_table = None
+
+def enable_sharing(table=None):
+    """ Intern all subsequently constructed terms in ``table``. """
+    global _table
+    _table = table if table is not None else TermTable()
+    TermMeta.__call__ = _shared_call
+    return _table
+
+def disable_sharing():
+    global _table
+    _table = None
+    if '__call__' in TermMeta.__dict__:
+        del TermMeta.__call__
+
+def sharing_table():
+    """ The active intern table or None if sharing is disabled. """
+    return _table
+
+@contextmanager
+def sharing(table=None):
+    """
+    Build terms with maximal sharing for the duration of the block::
+
+        with sharing():
+            a = parse('f(g(x), g(x))')
+        assert a.args[0] is a.args[1]
+    """
+    prev = _table
+    try:
+        yield enable_sharing(table)
+    finally:
+        if prev is None:
+            disable_sharing()
+        else:
+            enable_sharing(prev)
+
+def canonical(term):
+    """
+    Rebuild ``term`` through the active intern table, returning its
+    canonical instance. A no-op when sharing is disabled.
+    """
+    if _table is None:
+        return term
+    elif isinstance(term, AAppl):
+        return AAppl(canonical(term.spine), map(canonical, term.args))
+    elif isinstance(term, ATerm):
+        return ATerm(canonical(term.term), canonical(term.annotation))
+    elif isinstance(term, (AList, ATuple)):
+        return type(term)(map(canonical, term.args))
+    elif isinstance(term, (AInt, AReal, AString)):
+        return type(term)(term.val)
+    elif isinstance(term, APlaceholder):
+        return APlaceholder(term.type, canonical(term.args))
+    elif isinstance(term, tuple):
+        return tuple(map(canonical, term))
+    elif isinstance(term, list):
+        return map(canonical, term)
+    else:
+        return term
+
+def ident(x):
+    """
+    Intern key for a constructor argument. Terms are keyed on their
+    identity, everything else on its type and value.
+    """
+    if isinstance(type(x), TermMeta):
+        return id(x)
+    elif isinstance(x, (list, tuple)):
+        return tuple(map(ident, x))
+    else:
+        return (type(x), x)
+
 #------------------------------------------------------------------------
 # Terms
 #------------------------------------------------------------------------
 
+# Terms are immutable once constructed. Each node uses __slots__ and
+# stores its arguments as a tuple, and caches its structural hash and
+# the size and depth of the subterm it roots, so terms can be used as
+# dict keys and set members at the cost of an O(arity) computation at
+# construction.
+
+def measure(args):
+    """ Subterm size and depth of a node with the given children. """
+    size = depth = 0
+    for a in args:
+        # DSL patterns may embed non-term nodes such as as-patterns,
+        # which count as leaves
+        asize = getattr(a, 'size', 1)
+        adepth = getattr(a, 'depth', 1)
+        size += asize
+        if adepth > depth:
+            depth = adepth
+    return size + 1, depth + 1
+
 class ATerm(object):
+    __metaclass__ = TermMeta
+    __slots__ = ('term', 'annotation', 'size', 'depth', '_hash', '_plain',
+                 '__weakref__')
 
     def __init__(self, term, annotation=None):
         self.term = term
         self.annotation = annotation
 
+        # annotations do not take part in equality
+        self._hash = hash(term)
+        if isinstance(type(term), TermMeta):
+            self.size, self.depth = measure((term,))
+        else:
+            self.size = self.depth = 1
+
+    @staticmethod
+    def sharekey(term, annotation=None):
+        return (ident(term), ident(annotation))
+
     def __str__(self):
         if self.annotation is not None:
             return str(self.term) + arepr([self.annotation], '{', '}')
@@ -15,14 +169,22 @@ class ATerm(object):
             return str(self.term)
 
     def __eq__(self, other):
-        if isinstance(other, ATerm):
-            return self.term == other.term
+        if self is other:
+            return True
+        elif isinstance(other, ATerm):
+            return self._hash == other._hash and self.term == other.term
         else:
             return False
 
     def __ne__(self, other):
         return not self == other
 
+    def __hash__(self):
+        return self._hash
+
+    def __reduce__(self):
+        return (ATerm, (self.term, self.annotation))
+
     def __repr__(self):
         return str(self)
 
@@ -30,21 +192,40 @@ class ATerm(object):
         pass
 
 class AAppl(object):
+    __metaclass__ = TermMeta
+    __slots__ = ('spine', 'args', 'size', 'depth', '_hash', '_plain',
+                 '__weakref__')
 
     def __init__(self, spine, args):
         assert isinstance(spine, ATerm)
         self.spine = spine
-        self.args = args
+        self.args = args = tuple(args)
+        self.size, self.depth = measure(args)
+        self._hash = hash((spine, args))
+
+    @staticmethod
+    def sharekey(spine, args):
+        return (id(spine), tuple(map(id, args)))
 
     def __eq__(self, other):
-        if isinstance(other, AAppl):
-            return self.spine == other.spine and self.args == other.args
+        if self is other:
+            return True
+        elif isinstance(other, AAppl):
+            return (self._hash == other._hash and
+                    self.spine == other.spine and
+                    self.args == other.args)
         else:
             return False
 
     def __ne__(self, other):
         return not self == other
 
+    def __hash__(self):
+        return self._hash
+
+    def __reduce__(self):
+        return (AAppl, (self.spine, self.args))
+
     def __str__(self):
         return str(self.spine) + arepr(self.args, '(', ')')
 
@@ -55,25 +236,62 @@ class AAppl(object):
         pass
 
 class AString(object):
+    __metaclass__ = TermMeta
+    __slots__ = ('val', 'size', 'depth', '_hash', '__weakref__')
+
     def __init__(self, val):
         assert isinstance(val, str)
         self.val = val
+        self.size = self.depth = 1
+        self._hash = hash(val)
+
+    @staticmethod
+    def sharekey(val):
+        return val
 
     def __str__(self):
         return '"%s"' % (self.val)
 
+    def __eq__(self, other):
+        if self is other:
+            return True
+        elif isinstance(other, AString):
+            return self.val == other.val
+        else:
+            return False
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return self._hash
+
+    def __reduce__(self):
+        return (AString, (self.val,))
+
     def __repr__(self):
         return str(self)
 
 class AInt(object):
+    __metaclass__ = TermMeta
+    __slots__ = ('val', 'size', 'depth', '_hash', '__weakref__')
+
     def __init__(self, val):
         self.val = val
+        self.size = self.depth = 1
+        self._hash = hash(val)
+
+    @staticmethod
+    def sharekey(val):
+        return ident(val)
 
     def __str__(self):
         return str(self.val)
 
     def __eq__(self, other):
-        if isinstance(other, AInt):
+        if self is other:
+            return True
+        elif isinstance(other, AInt):
             return self.val == other.val
         else:
             return False
@@ -81,18 +299,36 @@ class AInt(object):
     def __ne__(self, other):
         return not self == other
 
+    def __hash__(self):
+        return self._hash
+
+    def __reduce__(self):
+        return (AInt, (self.val,))
+
     def __repr__(self):
         return str(self)
 
 class AReal(object):
+    __metaclass__ = TermMeta
+    __slots__ = ('val', 'size', 'depth', '_hash', '__weakref__')
+
     def __init__(self, val):
         self.val = val
+        self.size = self.depth = 1
+        self._hash = hash(val)
+
+    @staticmethod
+    def sharekey(val):
+        # repr distinguishes 0.0 from -0.0
+        return repr(val)
 
     def __str__(self):
         return str(self.val)
 
     def __eq__(self, other):
-        if isinstance(other, AReal):
+        if self is other:
+            return True
+        elif isinstance(other, AReal):
             return self.val == other.val
         else:
             return False
@@ -100,43 +336,83 @@ class AReal(object):
     def __ne__(self, other):
         return not self == other
 
+    def __hash__(self):
+        return self._hash
+
+    def __reduce__(self):
+        return (AReal, (self.val,))
+
     def __repr__(self):
         return str(self)
 
 class AList(object):
+    __metaclass__ = TermMeta
+    __slots__ = ('args', 'size', 'depth', '_hash', '_plain', '__weakref__')
+
     def __init__(self, args):
-        assert isinstance(args, list)
-        self.args = args or []
+        assert isinstance(args, (list, tuple))
+        self.args = args = tuple(args)
+        self.size, self.depth = measure(args)
+        self._hash = hash(args)
+
+    @staticmethod
+    def sharekey(args):
+        return tuple(map(id, args))
 
     def __str__(self):
         return arepr(self.args, '[', ']')
 
     def __eq__(self, other):
-        if isinstance(other, AList):
-            return self.args == other.args
+        if self is other:
+            return True
+        elif isinstance(other, AList):
+            return self._hash == other._hash and self.args == other.args
         else:
             return False
 
     def __ne__(self, other):
         return not self == other
 
+    def __hash__(self):
+        return self._hash
+
+    def __reduce__(self):
+        return (AList, (self.args,))
+
     def __repr__(self):
         return str(self)
 
 class ATuple(object):
+    __metaclass__ = TermMeta
+    __slots__ = ('args', 'size', 'depth', '_hash', '_plain', '__weakref__')
+
     def __init__(self, args):
-        assert isinstance(args, list)
-        self.args = args or []
+        assert isinstance(args, (list, tuple))
+        self.args = args = tuple(args)
+        self.size, self.depth = measure(args)
+        self._hash = hash(args)
+
+    @staticmethod
+    def sharekey(args):
+        return tuple(map(id, args))
 
     def __eq__(self, other):
-        if isinstance(other, ATuple):
-            return self.args == other.args
+        if self is other:
+            return True
+        elif isinstance(other, ATuple):
+            return self._hash == other._hash and self.args == other.args
         else:
             return False
 
     def __ne__(self, other):
         return not self == other
 
+    def __hash__(self):
+        return self._hash
+
+    def __reduce__(self):
+        return (ATuple, (self.args,))
+
     def __str__(self):
         return arepr(self.args, '(', ')')
 
@@ -144,20 +420,127 @@ class ATuple(object):
         return str(self)
 
 class APlaceholder(object):
+    __metaclass__ = TermMeta
+    __slots__ = ('type', 'args', 'size', 'depth', '_hash', '__weakref__')
 
     def __init__(self, type, args):
         self.type = type
-        self.args = args
+        if args is not None:
+            self.args = args = tuple(args)
+            self.size, self.depth = measure(args)
+        else:
+            self.args = None
+            self.size = self.depth = 1
+        self._hash = hash((type, args))
+
+    @staticmethod
+    def sharekey(type, args):
+        return (type, ident(args))
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        elif isinstance(other, APlaceholder):
+            return self.type == other.type and self.args == other.args
+        else:
+            return False
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return self._hash
+
+    def __reduce__(self):
+        return (APlaceholder, (self.type, self.args))
 
     def __str__(self):
         if self.args is not None:
-            return '<%s(%r)>' % (self.type, self.args)
+            return '<%s%s>' % (self.type, arepr(self.args, '(', ')'))
         else:
             return arepr([self.type], '<', '>')
 
     def __repr__(self):
         return str(self)
 
+termtypes = frozenset([ATerm, AAppl, AString, AInt, AReal, AList, ATuple,
+                       APlaceholder])
+
+def termtype(term):
+    """
+    The term class of ``term``. Subclasses of the term classes, such as
+    the lazy views of ``rewrite.mapped``, map to the class they extend.
+    """
+    cls = type(term)
+    if cls in termtypes:
+        return cls
+    for base in cls.__mro__:
+        if base in termtypes:
+            return base
+    return cls
+
+#------------------------------------------------------------------------
+# Annotations
+#------------------------------------------------------------------------
+
+# Whether annotations occur in a term, which equality ignores, is found
+# on demand and cached in the ``_plain`` slot of each node visited. The
+# slot is left unset at construction, so terms never asked cost nothing
+# more to build.
+
+LITERALS = frozenset([AInt, AReal, AString])
+NODES = frozenset([ATerm, AAppl, AList, ATuple])
+
+def plain(t):
+    """ Whether no annotation occurs in the term ``t``. """
+    try:
+        return t._plain
+    except AttributeError:
+        ty = type(t)
+        if ty in LITERALS:
+            return True
+        elif ty not in NODES:
+            # anything else, such as a placeholder or a lazy view, is
+            # taken to carry annotations
+            return False
+
+    # each node is decided once its children are, those not yet known
+    # pushed above it
+    stack = [t]
+    while stack:
+        u = stack[-1]
+        ty = type(u)
+        res = True
+        if ty is AAppl:
+            kids = (u.spine,) + u.args
+        elif ty is ATerm:
+            res = u.annotation is None
+            kids = (u.term,) if res and type(u.term) is not str else ()
+        else:
+            kids = u.args
+
+        todo = []
+        for a in kids:
+            ty = type(a)
+            if ty in LITERALS:
+                continue
+            elif ty not in NODES:
+                res = False
+                break
+            try:
+                if not a._plain:
+                    res = False
+                    break
+            except AttributeError:
+                todo.append(a)
+
+        if res and todo:
+            stack.extend(todo)
+        else:
+            u._plain = res
+            stack.pop()
+    return t._plain
+
 #------------------------------------------------------------------------
 # Pretty Printing
 #------------------------------------------------------------------------
@@ -0,0 +1,90 @@
+from rewrite import aparse
+from rewrite.arena import TermArena, APPL
+from rewrite.terms import aappl, aterm
+from rewrite.dsl import module
+from rewrite.dsl.arena import translate
+
+terms = [
+    'f',
+    'f(x, g(y, 1), 2.5, "s")',
+    '[1, [2, 3], (a, b)]',
+    '()',
+    'f(x){a}',
+    'f(x{b}, [])',
+    'f(<term>, <appl(1, 2)>)',
+]
+
+def test_roundtrip():
+    arena = TermArena()
+    for s in terms:
+        a = aparse(s)
+        b = arena.term(arena.add(a))
+        assert b == a
+        assert str(b) == str(a)
+
+def test_sharing():
+    arena = TermArena()
+    g = aparse('g(x, y)')
+    nid = arena.add(aappl(aterm('f', None), [g, g]))
+
+    kids = arena.children(nid)
+    assert kids[0] == kids[1]
+    assert arena.kind[nid] == APPL
+    assert len(arena.symbols) == 4
+
+def test_rewrite():
+    mod = module("""
+    E : Not(Not(x)) -> x
+    E : Not(And(x, y)) -> Or(Not(x), Not(y))
+    E : f(x, x) -> x
+
+    t = topdown(try(E))
+    b = bottomup(try(E))
+    i = innermost(E)
+    """)
+
+    subject = aparse('And(Not(Not(p)), Not(And(q, Not(Not(r)))), f(1, 1), f(1, 2))')
+    arena = TermArena()
+    nid = arena.add(subject)
+
+    for name in ('t', 'b', 'i'):
+        res = translate(arena, mod[name])(nid)
+        assert arena.term(res) == mod[name](subject)
+
+def test_unchanged():
+    mod = module("""
+    E : Not(Not(x)) -> x
+    t = topdown(try(E))
+    """)
+
+    arena = TermArena()
+    nid = arena.add(aparse('And(p, Or(q, r))'))
+    size = len(arena)
+
+    assert translate(arena, mod['t'])(nid) == nid
+    assert len(arena) == size
+
+def test_deep():
+    mod = module("""
+    E : Not(Not(x)) -> x
+    E : A() -> B()
+
+    t = topdown(try(E))
+    b = bottomup(try(E))
+    i = innermost(E)
+    """)
+
+    # deeper than the recursion limit
+    subject = aparse('A()')
+    for i in range(5000):
+        subject = aappl(aterm('f', None), [subject, aparse('Not(Not(A()))')])
+
+    arena = TermArena()
+    nid = arena.add(subject)
+    # topdown does not go on to rewrite the A() it leaves
+    for name, leaf in [('t', 'A()'), ('b', 'B()'), ('i', 'B()')]:
+        res = arena.term(translate(arena, mod[name])(nid))
+        for i in range(5000):
+            assert res.args[1] == aparse(leaf)
+            res = res.args[0]
+        assert res == aparse('B()')
@@ -0,0 +1,73 @@
+import random
+
+from rewrite import aparse
+from rewrite.dsl import module
+from rewrite.matching import FAIL, NoMatch
+
+rules = """
+E : f(x, 1) -> A()
+E : f(g(x), x) -> B()
+E : x -> C()
+E : @g(x, y) -> D(x, y)
+E : f(x, y) -> E(y, x)
+E : (x, 2.5) -> F(x)
+E : g(h(x, y), 1) -> G()
+"""
+
+subjects = [
+    'f(2, 1)',
+    'f(2, 1.0)',
+    'f(g(3), 3)',
+    'f(g(3), 4)',
+    'f([1], 1)',
+    'k(1, 2)',
+    'g(h(1, 2), 1)',
+    'g(h(1, 2), 2)',
+    '(a, 2.5)',
+    '(a, 2.5, 3)',
+    '[1, 2]',
+    'a',
+]
+
+def apply(block, t):
+    try:
+        return block(t)
+    except NoMatch:
+        return None
+
+def test_matches_block_order():
+    seq = module(rules)
+    dfa = module(rules, automaton=True)
+
+    for s in subjects:
+        t = aparse(s)
+        assert apply(seq['E'], t) == apply(dfa['E'], t)
+
+def test_candidates():
+    mod = module(rules, automaton=True)
+    dfa = mod['E'].matcher()
+
+    assert dfa.candidates(aparse('f(g(3), 4)')) == (1, 2, 3, 4)
+    assert dfa.match(aparse('f(g(3), 4)'))[0] == 2
+    assert dfa.candidates(aparse('(a, 2.5, 3)')) == ()
+    assert dfa.match(aparse('[1, 2]')) is FAIL
+
+def test_random():
+    rng = random.Random(0)
+    names = [('f', 2), ('g', 1), ('h', 0)]
+
+    def term(depth, var):
+        if depth == 0 or rng.random() < 0.3:
+            if var and rng.random() < 0.5:
+                return 'x%d' % rng.randint(0, 2)
+            return rng.choice(['h()', '1', '2'])
+        name, n = rng.choice(names)
+        return '%s(%s)' % (name, ', '.join(term(depth - 1, var) for i in range(n)))
+
+    source = '\n'.join('E : %s -> R%d()' % (term(3, True), i) for i in range(50))
+    seq = module(source)
+    dfa = module(source, automaton=True)
+
+    for i in range(500):
+        t = aparse(term(4, False))
+        assert apply(seq['E'], t) == apply(dfa['E'], t)
@@ -0,0 +1,71 @@
+from cStringIO import StringIO
+
+from rewrite import aparse
+from rewrite.terms import aappl, aterm, aint
+from rewrite.binary import Writer, Reader, dumps, loads, BinaryFormatError
+
+from nose.tools import assert_raises
+
+terms = [
+    'f',
+    'f(x, g(y, 1), -2, 2.5, "s")',
+    '[1, [2, 3], (a, b), []]',
+    '()',
+    'f(x){a}',
+    'f{x}',
+    'f(x{b}, 123456789012345678901234567890)',
+    'f(<term>, <appl(1, 2)>, <list>)',
+    'Add(2{dshape("int")},3.0{dshape("double")})',
+]
+
+def test_roundtrip():
+    for s in terms:
+        a = aparse(s)
+        b = loads(dumps(a))
+        assert b == a
+        assert str(b) == str(a)
+
+def test_sharing():
+    g = aparse('g(x, [1, 2])')
+    a = aappl(aterm('f', None), [g, g, g])
+
+    data = dumps(a)
+    b = loads(data)
+
+    assert b == a
+    assert b.args[0] is b.args[1] is b.args[2]
+    assert len(data) < len(dumps(aparse(str(a))))
+
+def test_stream():
+    fd = StringIO()
+    w = Writer(fd)
+    for s in terms:
+        w.write(aparse(s))
+    w.close()
+
+    fd.seek(0)
+    res = list(Reader(fd))
+    assert map(str, res) == map(str, map(aparse, terms))
+
+def test_errors():
+    with assert_raises(BinaryFormatError):
+        loads('nonsense')
+    with assert_raises(BinaryFormatError):
+        loads(dumps(aparse('f(x, y)'))[:-1])
+
+    r = Reader(StringIO(dumps(aint(1))))
+    assert r.read() == aint(1)
+    with assert_raises(EOFError):
+        r.read()
+
+def test_deep():
+    # deeper than the recursion limit
+    t = aparse('[]')
+    for i in range(5000):
+        t = aappl(aterm('Cons', None), [aint(i), t])
+
+    t = loads(dumps(t))
+    for i in reversed(range(5000)):
+        assert t.spine.term == 'Cons' and t.args[0] == aint(i)
+        t = t.args[1]
+    assert t == aparse('[]')
@@ -0,0 +1,161 @@
+import os
+import time
+
+from rewrite import aparse
+from rewrite.dsl import module
+from rewrite.dsl.budget import Budget
+
+from nose.tools import assert_raises
+
+examples = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        '..', '..', 'examples')
+
+source = open(os.path.join(examples, 'eval')).read() + """
+loop : A() -> B()
+loop : B() -> A()
+
+spin = repeat(loop)
+
+grow : F(x) -> F(G(x))
+
+sprout = repeat(topdown(try(grow)))
+wither = repeat(bottomup(try(grow)))
+
+norm = innermost(Eval)
+"""
+
+subject = aparse('And(Or(Not(True()), Eq(False(), Impl(True(), False()))), '
+                 'Not(And(Not(False()), Or(False(), True()))))')
+
+#------------------------------------------------------------------------
+
+def test_within_budget():
+    expected = module(source)['eval'](subject)
+    mod = module(source, budgets=True)
+
+    budget = Budget(visits=1000, rewrites=100, seconds=10)
+    assert mod['eval'].run(subject, budget) == (expected, False)
+    assert not budget.exhausted
+    assert 0 < budget.rewritten < 100 and budget.visited < 1000
+
+def test_within_budget_compiled():
+    expected = module(source)['eval'](subject)
+    mod = module(source, budgets=True, automaton=True, compiled=True)
+
+    budget = Budget(visits=1000, rewrites=100, seconds=10)
+    assert mod['eval'].run(subject, budget) == (expected, False)
+    assert not budget.exhausted
+    assert 0 < budget.rewritten < 100 and budget.visited < 1000
+
+def test_within_budget_memo():
+    expected = module(source)['eval'](subject)
+    mod = module(source, budgets=True, optimized=True, memo=64)
+
+    budget = Budget(visits=1000, rewrites=100, seconds=10)
+    assert mod['eval'].run(subject, budget) == (expected, False)
+    assert not budget.exhausted
+    assert 0 < budget.rewritten < 100 and budget.visited < 1000
+
+#------------------------------------------------------------------------
+
+def exhaust(s, n):
+    # the term s reaches in n rewrites, checking the budget ran out
+    budget = Budget(rewrites=n)
+    res, exhausted = s.run(subject, budget)
+    assert exhausted and budget.rewritten == n
+    return res
+
+def test_exhausted():
+    plain = module(source)['eval']
+    s = module(source, budgets=True)['eval']
+
+    # the term reached so far normalises as the subject does
+    for n in range(1, 8):
+        res = exhaust(s, n)
+        assert res != plain(subject)
+        assert plain(res) == plain(subject)
+
+    budget = Budget(visits=5)
+    res, exhausted = s.run(subject, budget)
+    assert exhausted and budget.visited == 5
+
+def test_exhausted_compiled():
+    plain = module(source)['eval']
+    compiled = module(source, budgets=True, compiled=True)['eval']
+    automaton = module(source, budgets=True, automaton=True,
+                       compiled=True)['eval']
+    for s in (compiled, automaton):
+        for n in range(1, 8):
+            res = exhaust(s, n)
+            assert res != plain(subject)
+            assert plain(res) == plain(subject)
+
+        budget = Budget(visits=5)
+        res, exhausted = s.run(subject, budget)
+        assert exhausted and budget.visited == 5
+
+def test_exhausted_memo():
+    plain = module(source)['eval']
+    s = module(source, budgets=True, optimized=True, memo=64)['eval']
+    for n in range(1, 8):
+        res = exhaust(s, n)
+        assert res != plain(subject)
+        assert plain(res) == plain(subject)
+
+    budget = Budget(visits=5)
+    res, exhausted = s.run(subject, budget)
+    assert exhausted and budget.visited == 5
+
+def test_exhausted_innermost():
+    plain = module(source)['norm']
+    mod = module(source, budgets=True)
+    compiled = module(source, budgets=True, compiled=True)
+    memo = module(source, budgets=True, optimized=True, memo=64)
+    for s in (mod['norm'], compiled['norm'], memo['norm']):
+        for n in range(1, 8):
+            res = exhaust(s, n)
+            assert res != plain(subject)
+            assert plain(res) == plain(subject)
+
+#------------------------------------------------------------------------
+
+def test_deadline():
+    mod = module(source, budgets=True)
+    compiled = module(source, budgets=True, compiled=True)
+    memo = module(source, budgets=True, optimized=True, memo=64)
+    for s in (mod['spin'], compiled['spin'], memo['spin']):
+        budget = Budget(seconds=0.01)
+        res, exhausted = s.run(aparse('A()'), budget)
+        assert exhausted and res in (aparse('A()'), aparse('B()'))
+
+def test_deadline_loops():
+    # try(grow) succeeds once the budget is spent, the loops have to
+    # stop of their own accord
+    mod = module(source, budgets=True)
+    compiled = module(source, budgets=True, compiled=True)
+    memo = module(source, budgets=True, optimized=True, memo=64)
+    for s in (mod['sprout'], mod['wither'], compiled['sprout'],
+              compiled['wither'], memo['sprout'], memo['wither']):
+        budget = Budget(seconds=0.05)
+        start = time.time()
+        res, exhausted = s.run(aparse('F(A())'), budget)
+        assert exhausted and time.time() - start < 1
+        assert res.args[0] != aparse('A()')
+        assert res.size == res.depth
+
+def test_one_run_at_a_time():
+    mod = module(source, budgets=True)
+    meter = mod['eval'].meter
+
+    # a run in progress, as seen by another run of the module
+    meter.start(Budget())
+    assert_raises(RuntimeError, mod['spin'].run, aparse('A()'), Budget())
+    meter.stop()
+
+    budget = Budget(rewrites=3)
+    assert mod['spin'].run(aparse('A()'), budget) == (aparse('B()'), True)
+    assert mod['eval'].run(subject, Budget())[1] is False
+
+def test_no_budgets():
+    mod = module(source)
+    assert_raises(ValueError, mod['eval'].run, subject, Budget())
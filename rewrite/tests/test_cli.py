@@ -0,0 +1,64 @@
+from cStringIO import StringIO
+
+from rewrite import aparse
+from rewrite.binary import Writer, Reader
+from rewrite.dsl.cli import apply
+from rewrite.dsl.tracing import summary
+
+source = """
+E : Not(Not(x)) -> x
+E : A() -> B()
+
+t = topdown(try(E))
+"""
+
+terms = ['Not(Not(A()))', 'C()', 'f(Not(Not(x)), [A()])']
+
+def test_apply_lines():
+    # the terms failed on are reported by file and line
+    for workers in (0, 2):
+        fd = StringIO('\n'.join(terms) + '\n\n')
+        out, err = StringIO(), StringIO()
+        res = apply(source, 'E', [fd], out, err, workers=workers)
+        assert res == (3, 2, 0)
+        assert out.getvalue() == 'A()\n'
+        assert err.getvalue() == '<input>:2: failed\n<input>:3: failed\n'
+
+def test_apply_malformed():
+    # the lines which do not parse are reported and skipped
+    lines = ['Not(Not(A()))', 'f(', '', 'A()', 'g(x']
+    for workers in (0, 2):
+        fd = StringIO('\n'.join(lines) + '\n')
+        out, err = StringIO(), StringIO()
+        res = apply(source, 't', [fd], out, err, workers=workers,
+                    chunksize=2)
+        assert res == (4, 0, 2)
+        assert out.getvalue() == 'A()\nB()\n'
+        assert err.getvalue() == (
+            '<input>:2: SyntaxError: Syntax error at EOF\n'
+            '<input>:5: SyntaxError: Syntax error at EOF\n')
+
+def test_apply_binary():
+    fd = StringIO()
+    with Writer(fd) as w:
+        for t in terms:
+            w.write(aparse(t))
+
+    # binary in, binary out, across files and workers
+    for workers in (0, 2):
+        out, err = StringIO(), StringIO()
+        fds = [StringIO(fd.getvalue()), StringIO('A()\n')]
+        res = apply(source, 't', fds, out, err, binary_out=True,
+                    workers=workers, chunksize=2)
+        assert res == (4, 0, 0)
+        assert list(Reader(StringIO(out.getvalue()))) == map(aparse, [
+            'A()', 'C()', 'f(x, [B()])', 'B()'])
+
+def test_apply_trace():
+    fd = StringIO('\n'.join(terms) + '\n')
+    out, err, log = StringIO(), StringIO(), StringIO()
+    assert apply(source, 't', [fd], out, err, trace=log) == (3, 0, 0)
+    assert summary(StringIO(log.getvalue())) == (3, 3, {
+        'E : Not(Not(<term>)) -> <term>': 2,
+        'E : A() -> B()': 1,
+    })
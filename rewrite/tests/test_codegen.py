@@ -0,0 +1,128 @@
+from rewrite import aparse
+from rewrite.dsl import module
+from rewrite.matching import unfold, NoMatch, FAIL
+
+rules = """
+E : Not(And(x, y)) -> Or(Not(x), Not(y))
+E : f(x, x) -> x
+E : g(True(), (x, "a"), 2) -> x
+E : @h(x, 1) -> x
+"""
+
+subjects = [
+    'Not(And(p, q))',
+    'Not(Or(p, q))',
+    'Not(And(p, q, r))',
+    'f(g(1), g(1))',
+    'f(g(1), g(2))',
+    'g(True(), (b, "a"), 2)',
+    'g(True(), (b, "b"), 2)',
+    'g(True(), (b, "a"), 2.0)',
+    'g(False(), (b, "a"), 2)',
+    'h(y, 1)',
+    'k(y, 1)',
+    'k(y, 2)',
+    '[1, 2]',
+    '1',
+]
+
+def interpret(rule, s):
+    # bindings are returned once for each distinct variable
+    try:
+        bound = []
+        for k, v in unfold(rule.lpat, rule.left, s):
+            if k not in [b for b, _ in bound]:
+                bound.append((k, v))
+        return tuple(v for _, v in bound)
+    except NoMatch:
+        return FAIL
+
+def test_agrees_with_unfold():
+    mod = module(rules)
+    # as-patterns are left out, unfold matches them on any arity
+    for rule in mod['E'].rules[:-1]:
+        for s in subjects:
+            t = aparse(s)
+            assert rule.match(t) == interpret(rule, t)
+
+def test_bindings():
+    mod = module(rules)
+    not_, eq, lit, asp = mod['E'].rules
+
+    assert not_.match(aparse('Not(And(p, q))')) == (aparse('p'), aparse('q'))
+    assert eq.match(aparse('f(1, 1)')) == (aparse('1'),)
+    assert asp.match(aparse('k(y, 1)')) == (aparse('k'), aparse('y'))
+    assert asp.match(aparse('k(y, 1, 2)')) is FAIL
+
+def test_rewrite():
+    mod = module(rules)
+    assert mod['E'](aparse('g(True(), (b, "a"), 2)')) == aparse('b')
+    assert mod['E'](aparse('k(y, 1)')) == aparse('y')
+
+def test_shared_source():
+    mod = module("""
+    A : f(x, 1) -> x
+    B : f(y, 1) -> y
+    """)
+    assert mod['A'].rules[0].match is mod['B'].rules[0].match
+
+def test_cache():
+    import gc, weakref
+    from rewrite.dsl import codegen
+
+    # the cache holds on to no strategy compiled
+    mod = module("""
+    A : f(x, 1) -> x
+    s = repeat(A) ; innermost(A)
+    """, compiled=True)
+    ref = weakref.ref(mod['A'])
+    assert mod['s'](aparse('f(f(a, 1), 1)')) == aparse('a')
+    del mod
+    gc.collect()
+    assert ref() is None
+
+    size = codegen.MAXSIZE
+    try:
+        codegen.MAXSIZE = 4
+        for i in range(10):
+            module('A : f(x, %d) -> x' % i)
+        assert len(codegen._cache) == 4
+    finally:
+        codegen.MAXSIZE = size
+
+def test_builder():
+    mod = module("""
+    E : Eq(x, y) -> And(Impl(x, y), Impl(y, x), g(1, "a"), [x, 2.5])
+    E : @f(x, y) -> f(y, x)
+    """)
+    eq, asp = mod['E'].rules
+
+    a = eq(aparse('Eq(p, q)'))
+    b = eq(aparse('Eq(r, s)'))
+    assert a == aparse('And(Impl(p, q), Impl(q, p), g(1, "a"), [p, 2.5])')
+
+    # ground subterms are shared between applications
+    assert a.args[2] is b.args[2]
+
+    assert asp(aparse('k(1, 2)')) == aparse('f(2, 1)')
+
+def test_compiled_strategies():
+    source = """
+    E : Not(Not(x)) -> x
+    E : Not(And(x, y)) -> Or(Not(x), Not(y))
+    D : Or(x, x) -> x
+
+    t = topdown(try(E))
+    b = bottomup(try(E <+ D))
+    i = innermost(E <+ D)
+    r = repeat(all(E) ; some(D)) <+ fail
+    """
+    interpreted = module(source)
+    compiled = module(source, compiled=True)
+
+    subject = aparse('Or(Not(Not(And(p, q))), Not(And(Not(Not(p)), Or(q, q))))')
+    for name in ('t', 'b', 'i', 'r'):
+        assert compiled[name].compiled is not None
+        assert compiled[name](subject) == interpreted[name](subject)
+
+    assert compiled['r'].apply(aparse('p')) == aparse('p')
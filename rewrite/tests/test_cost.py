@@ -0,0 +1,113 @@
+from nose.tools import assert_raises
+
+from rewrite import aparse
+from rewrite.dsl import module
+from rewrite.dsl.cost import CostModel
+from rewrite.dsl.budget import Budget
+from rewrite.dsl.tracing import Tracer
+
+# the first rule to match is the dearest, and the second only pays off
+# once rewritten again
+source = """
+plan: join(a, b) -> loop(a, b)
+plan: join(a, b) -> hash(a, b)
+plan: join(a, b) -> sort(a, b)
+plan: sort(a, b) -> merge(a, b)
+
+first = innermost(plan)
+best = innermost(cheapest(plan))
+"""
+
+costs = dict(loop=20, hash=10, sort=15, merge=5)
+
+subject = aparse('join(join(a, b), c)')
+
+def test_first_match():
+    env = module(source, costs=costs)
+    assert env['first'](subject) == aparse('loop(loop(a, b), c)')
+    assert env['best'](subject) == aparse('hash(hash(a, b), c)')
+
+def test_lookahead():
+    env = module(source, costs=costs, lookahead=1)
+    # sort costs more than hash but rewrites to merge, which costs less
+    assert env['best'](subject) == aparse('merge(merge(a, b), c)')
+    for opts in (dict(compiled=True), dict(optimized=True)):
+        env = module(source, costs=costs, lookahead=1, **opts)
+        assert env['best'](subject) == aparse('merge(merge(a, b), c)')
+
+def test_default_size():
+    env = module("""
+        R: f(x) -> g(x, x)
+        R: f(x) -> h(x)
+        s = cheapest(R)
+    """)
+    assert env['s'](aparse('f(a)')) == aparse('h(a)')
+    assert_raises(ValueError, module, """
+        R: f(x) -> h(x)
+        t = try(R)
+        s = cheapest(t)
+    """)
+
+def test_memo():
+    calls = []
+    def cost(node, costs):
+        calls.append(node[1])
+        return 1 + sum(costs)
+
+    model = CostModel(cost)
+    t = aparse('f(g(a, b), k(1, 2))')
+    assert model(t) == 7
+    assert model(t) == 7
+    assert len(calls) == 7
+    assert model.hits == 1
+
+    # a rewrite only prices what the rule built
+    env = module('R: f(x, y) -> h(y, x)\ns = cheapest(R)', costs=model)
+    env['s'](t)
+    assert calls[7:] == ['h']
+
+    model.maxsize = 2
+    model(aparse('f(a)'))
+    assert len(model.table) == 2
+
+def test_budget_trace():
+    env = module(source, costs=costs, budgets=True)
+    res, exhausted = env['best'].run(subject, Budget(rewrites=1))
+    assert exhausted
+    assert res == aparse('join(hash(a, b), c)')
+
+    fired = []
+    hash = 'plan : join(<term>, <term>) -> hash(<term>, <term>)'
+    tracer = Tracer(lambda rule, path, before, after:
+                    fired.append((rule, path, after)))
+    env = module(source, costs=costs, trace=tracer)
+    env['best'](subject)
+    assert fired == [
+        (hash, (0,), aparse('hash(a, b)')),
+        (hash, (), aparse('hash(hash(a, b), c)')),
+    ]
+
+    # each rule matching is built once, the chosen result reported
+    builds = []
+    def counted(build):
+        def apply(values):
+            builds.append(values)
+            return build(values)
+        return apply
+    for rule in env['plan'].rules:
+        rule.build = counted(rule.build)
+    del fired[:]
+    env['best'](aparse('join(a, b)'))
+    assert len(builds) == 3
+    assert fired == [(hash, (), aparse('hash(a, b)'))]
+
+def test_profile():
+    for opts in (dict(), dict(compiled=True)):
+        env = module(source, costs=costs, profile=True, **opts)
+        assert env['best'](subject) == aparse('hash(hash(a, b), c)')
+        profile = env['best'].profile
+        plan, = profile.top(kind='block')
+        assert (plan.calls, plan.failures) == (13, 11)
+        # every rule matching is tried
+        rules = [(r.calls, r.failures) for r in profile.top(kind='rule')]
+        assert rules == [(2, 0)] * 3
@@ -0,0 +1,76 @@
+from rewrite import aparse
+from rewrite.dsl import module
+from rewrite.dsl.combinators import STCycle
+
+from nose.tools import assert_raises
+
+source = """
+foo : A() -> B()
+foo : B() -> A()
+foo : C() -> D()
+
+bar : Succ(Succ(Succ(x))) -> x
+bar : Succ(x) -> Succ(x)
+
+swap : Pair(x, y) -> Pair(y, x)
+
+r = repeat(foo)
+s = repeat(bar)
+i = innermost(foo)
+j = innermost(swap)
+"""
+
+def cycle(s, subject):
+    # the length of the cycle the strategy runs into, or None
+    try:
+        s(aparse(subject))
+    except STCycle as e:
+        return e.length
+
+def test_cycle_length():
+    mod = module(source, cycles=True)
+    assert cycle(mod['r'], 'A()') == 2
+    assert cycle(mod['s'], 'Succ(Succ(Succ(Succ(Z()))))') == 1
+    assert cycle(mod['i'], 'f([B()], g(C()))') == 2
+    assert cycle(mod['j'], 'Pair(A(), f(Pair(1, 2)))') == 2
+
+def test_cycle_length_compiled():
+    mod = module(source, cycles=True, compiled=True)
+    assert cycle(mod['r'], 'A()') == 2
+    assert cycle(mod['s'], 'Succ(Succ(Succ(Succ(Z()))))') == 1
+    assert cycle(mod['i'], 'f([B()], g(C()))') == 2
+    assert cycle(mod['j'], 'Pair(A(), f(Pair(1, 2)))') == 2
+
+def test_cycle_length_memo():
+    mod = module(source, cycles=True, memo=64)
+    assert cycle(mod['r'], 'A()') == 2
+    assert cycle(mod['s'], 'Succ(Succ(Succ(Succ(Z()))))') == 1
+    assert cycle(mod['i'], 'f([B()], g(C()))') == 2
+    assert cycle(mod['j'], 'Pair(A(), f(Pair(1, 2)))') == 2
+
+def test_cycle_length_memo_compiled():
+    mod = module(source, cycles=True, memo=64, compiled=True)
+    assert cycle(mod['r'], 'A()') == 2
+    assert cycle(mod['s'], 'Succ(Succ(Succ(Succ(Z()))))') == 1
+    assert cycle(mod['i'], 'f([B()], g(C()))') == 2
+    assert cycle(mod['j'], 'Pair(A(), f(Pair(1, 2)))') == 2
+
+def test_terminating():
+    plain = module(source)
+    mod = module(source, cycles=True)
+    compiled = module(source, cycles=True, compiled=True)
+    memo = module(source, cycles=True, memo=64, compiled=True)
+
+    t = aparse('C()')
+    assert mod['r'](t) == compiled['r'](t) == memo['r'](t) == plain['r'](t)
+    t = aparse('f([C()], g(D()))')
+    assert mod['i'](t) == compiled['i'](t) == memo['i'](t) == plain['i'](t)
+    t = aparse('Succ(Succ(Succ(Z())))')
+    assert mod['s'](t) == compiled['s'](t) == memo['s'](t) == plain['s'](t)
+
+def test_detect_cycles():
+    mod = module(source)
+    mod['r'].detect_cycles()
+    assert_raises(STCycle, mod['r'], aparse('B()'))
+    mod['r'].detect_cycles(False)
+    assert mod['r'].apply(aparse('D()')) == aparse('D()')
@@ -1,5 +1,9 @@
 from rewrite import aparse
 from rewrite.dsl import dslparse, module
+from rewrite.dsl.combinators import STFail
+from rewrite.dsl.toplevel import MAXINDEX
+from rewrite.matching import FAIL
+from nose.tools import assert_raises
 
 #------------------------------------------------------------------------
 
@@ -95,6 +99,71 @@ def test_rewrite_simple3():
 
 #------------------------------------------------------------------------
 
+dispatch_rr = """
+E : f(x, 1) -> A()
+E : x -> B()
+E : @g(x, y) -> C()
+E : f(x, y) -> D()
+E : 1 -> E()
+"""
+
+def test_dispatch():
+    mod = module(dispatch_rr)
+    block = mod['E']
+    f1, wild, asp, f2, lit = block.rules
+
+    assert block.dispatch(aparse('f(2, 1)')) == (f1, wild, asp, f2)
+    assert block.dispatch(aparse('h(2, 1)')) == (wild, asp)
+    assert block.dispatch(aparse('h(2)')) == (wild,)
+    assert block.dispatch(aparse('1.0')) == (wild, lit)
+
+    # rules are tried in order within a bucket
+    assert block(aparse('f(2, 1)')) == aparse('A()')
+    assert block(aparse('f(2, 2)')) == aparse('B()')
+
+def test_dispatch_unknown():
+    mod = module(dispatch_rr)
+    block = mod['E']
+
+    # names no rule mentions share a bucket, entered under each name
+    bucket = block.dispatch(aparse('h(2, 1)'))
+    assert block.dispatch(aparse('k(1, 2)')) is bucket
+    assert block.index[('appl', 'h', 2)] is bucket
+    assert block.index[('appl', None, 2)] is bucket
+
+    # the pattern keys are computed once, the index stays bounded
+    keys = block._keys
+    for i in range(MAXINDEX + 10):
+        block.dispatch(aparse('n%d(1)' % i))
+    assert block._keys is keys
+    assert len(block.index) == MAXINDEX
+
+#------------------------------------------------------------------------
+
+choice_rr = """
+foo : A() -> B()
+bar : B() -> C()
+
+c = foo <+ bar
+s = foo ; bar
+r = repeat(foo <+ bar)
+"""
+
+def test_failure_protocol():
+    mod = module(choice_rr)
+    a, b, c = aparse('A()'), aparse('B()'), aparse('C()')
+
+    assert mod['c'].apply(b) == c
+    assert mod['c'].apply(c) is FAIL
+    assert mod['s'].apply(a) == c
+    assert mod['s'].apply(b) is FAIL
+    assert mod['r'].apply(a) == c
+
+    # calling keeps raising on failure
+    assert_raises(STFail, mod['c'], c)
+
+#------------------------------------------------------------------------
+
 #simple_bool = """
 #Eval : Not(True)      -> False
 #Eval : Not(False)     -> True
@@ -0,0 +1,107 @@
+import os
+
+from rewrite import aparse
+from rewrite.terms import AAppl, ATerm
+from rewrite.dsl import module
+from rewrite.dsl.egraph import EGraph, rewrites, simplify, weighted
+
+examples = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        '..', '..', 'examples')
+
+source = open(os.path.join(examples, 'fusion')).read() + """
+fusion = innermost(fuse)
+"""
+
+passes = weighted(dict(map=10, filter=10, zipwith=10, concat=10))
+
+def chain(n):
+    s = 'xs'
+    for i in range(n):
+        s = 'map(f%d, %s)' % (i, s)
+    return aparse(s)
+
+def test_hashcons():
+    eg = EGraph()
+    a = eg.add(aparse('f(g(x), g(x), [1, 2.5, "s"])'))
+    assert eg.add(aparse('f(g(x), g(x), [1, 2.5, "s"])')) == a
+    # f, g, x, the list and its three elements
+    assert len(eg.memo) == len(eg.classes) == 7
+    assert eg.extract(a) == (aparse('f(g(x), g(x), [1, 2.5, "s"])'), 9)
+
+def test_congruence():
+    eg = EGraph()
+    fa, fb = eg.add(aparse('f(a)')), eg.add(aparse('f(b)'))
+    gfa, gfb = eg.add(aparse('g(f(a))')), eg.add(aparse('g(f(b))'))
+    assert eg.find(gfa) != eg.find(gfb)
+
+    eg.union(eg.add(aparse('a')), eg.add(aparse('b')))
+    eg.rebuild()
+    assert eg.find(fa) == eg.find(fb)
+    assert eg.find(gfa) == eg.find(gfb)
+    assert eg.equivalent(aparse('g(f(a))'), aparse('g(f(b))'))
+    assert not eg.equivalent(aparse('f(a)'), aparse('g(a)'))
+
+def test_unions():
+    # the repair of one class merges another due for repair
+    eg = EGraph()
+    a, b, e = eg.add(aparse('a')), eg.add(aparse('b')), eg.add(aparse('e'))
+    fa, fb = eg.add(aparse('f(a)')), eg.add(aparse('f(b)'))
+    eg.union(a, b)
+    eg.union(fa, e)
+    eg.rebuild()
+    assert eg.find(fb) == eg.find(e)
+
+    env = module('E : A() -> B()\nE : F(A()) -> C()\n')
+    t = aparse('T(F(A()), F(B()), G(F(B())), H(F(B())))')
+    term, cost, reason = simplify(env, t)
+    assert term == aparse('T(C(), C(), G(C()), H(C()))')
+
+def test_phase_order():
+    env = module(source)
+    # innermost fuses the inner maps first, which keeps the zipwith
+    # from fusing with them
+    t = aparse('map(k, zipwith(f, map(g, map(h, xs)), map(g, ys)))')
+    fused = env['fusion'](t)
+    assert fused == aparse('zipwith(compose(k, f), map(compose(g, h), xs), '
+                           'map(g, ys))')
+
+    best, cost, reason = simplify(env, t, passes)
+    assert reason == 'saturated'
+    assert best == aparse('zipwith(compose(k, compose(f, g)), map(h, xs), ys)')
+    assert cost == 28 < passes_of(fused)
+
+def test_nonlinear():
+    env = module(source)
+    best, cost, reason = simplify(env, aparse('zipwith(f, map(g, a), map(h, b))'),
+                                  passes)
+    assert best == aparse('zipwith(f, map(g, a), map(h, b))')
+
+def test_limits():
+    env = module(source)
+    t = chain(9)
+    for limits, stop in [(dict(nodes=500), 'nodes'),
+                         (dict(iterations=2), 'iterations'),
+                         (dict(seconds=0), 'time')]:
+        eg = EGraph()
+        root = eg.add(t)
+        assert eg.saturate(rewrites(env), **limits) == stop
+        best, cost = eg.extract(root, passes)
+        # whatever is extracted is equal to the subject
+        assert eg.equivalent(best, t)
+        assert cost <= passes_of(t)
+
+    best, cost, reason = simplify(env, chain(6), passes)
+    assert reason == 'saturated' and cost == 10 + 6 + 5 + 1
+
+def passes_of(t):
+    eg = EGraph()
+    return eg.extract(eg.add(t), passes)[1]
+
+def test_deep():
+    t = aparse('z')
+    for i in range(5000):
+        t = AAppl(ATerm('s', None), (t,))
+    eg = EGraph()
+    root = eg.add(t)
+    assert len(eg.classes) == 5001
+    assert eg.extract(root)[1] == 5001
@@ -0,0 +1,69 @@
+import os
+import tempfile
+
+from rewrite import aparse
+from rewrite.terms import AAppl
+from rewrite.mapped import dump, load, MappedAppl
+from rewrite.dsl import module
+
+terms = [
+    'f',
+    'f(x, g(y, 1), 2.5, "s", 123456789012345678901234567890)',
+    '[1, [2, 3], (a, b), []]',
+    'f(x){a}',
+    'f(x{b}, [])',
+    'f(<term>, <appl(1, 2)>)',
+]
+
+def roundtrip(term):
+    fd, path = tempfile.mkstemp()
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            dump(term, f)
+        return load(path)
+    finally:
+        os.unlink(path)
+
+def test_roundtrip():
+    for s in terms:
+        a = aparse(s)
+        b = roundtrip(a)
+        assert b == a
+        assert str(b) == str(a)
+        assert hash(b) == hash(a)
+
+def test_lazy():
+    a = roundtrip(aparse('f(g(h(1)), k(2))'))
+
+    assert isinstance(a, AAppl)
+    assert isinstance(a, MappedAppl)
+    assert a._args is None
+
+    g = a.args[0]
+    assert g._args is None
+    assert g.spine.term == 'g'
+    assert a.size == 6
+
+def test_rewrite():
+    mod = module("""
+    E : f(x, y) -> F(y, x)
+    t = topdown(try(E))
+    """)
+
+    subject = aparse('f(f(1, 2), g(f(3, 4)))')
+    assert mod['t'](roundtrip(subject)) == mod['t'](subject)
+
+def test_rewrite_views():
+    # lists and tuples are rebuilt as plain terms
+    mod = module("""
+    E : A() -> C()
+    t = topdown(try(E))
+    b = bottomup(try(E))
+    """)
+
+    subject = aparse('f([A(), B()], (A(), 1))')
+    expected = aparse('f([C(), B()], (C(), 1))')
+    for name in ('t', 'b'):
+        assert mod[name](roundtrip(subject)) == expected
+    assert mod['t'](roundtrip(aparse('[A(), [B(), A()]]'))) == \
+        aparse('[C(), [B(), C()]]')
@@ -0,0 +1,92 @@
+from rewrite import aparse
+from rewrite.dsl import module
+from rewrite.dsl.memo import MemoTable, MISS
+from rewrite.matching import FAIL
+
+source = """
+E : Dnf(Atom(x))    -> Atom(x)
+E : Dnf(Not(x))     -> DnfR(Not(Dnf(x)))
+E : Dnf(And(x, y))  -> DnfR(And(Dnf(x), Dnf(y)))
+E : Dnf(Or(x, y))   -> Or(Dnf(x), Dnf(y))
+E : Dnf(Impl(x, y)) -> Dnf(Or(Not(x), y))
+E : Dnf(Eq(x, y))   -> Dnf(And(Impl(x, y), Impl(y, x)))
+
+E : DnfR(Not(Not(x)))      -> x
+E : DnfR(Not(And(x, y)))   -> Or(Dnf(Not(x)), Dnf(Not(y)))
+E : DnfR(Not(Or(x, y)))    -> Dnf(And(Not(x), Not(y)))
+D : DnfR(Not(x))           -> Not(x)
+
+E : DnfR(And(Or(x, y), z)) -> Or(Dnf(And(x, z)), Dnf(And(y, z)))
+E : DnfR(And(z, Or(x, y))) -> Or(Dnf(And(z, x)), Dnf(And(z, y)))
+D : DnfR(And(x, y))        -> And(x, y)
+
+dnf = innermost(E <+ D)
+r = repeat(E <+ D)
+"""
+
+def test_clock_eviction():
+    table = MemoTable(3)
+    for k in 'abc':
+        table.put(k, k.upper())
+
+    assert table.get('a') == 'A'
+    assert table.get('z') is MISS
+    assert (table.hits, table.misses) == (1, 1)
+
+    # a was hit since the hand passed and gets a second chance
+    table.put('d', 'D')
+    assert 'a' in table and 'b' not in table
+    assert table.evictions == 1
+
+    table.put('e', FAIL)
+    assert table.get('e') is FAIL
+    assert len(table) == 3
+
+    table.clear()
+    assert len(table) == 0 and table.get('a') is MISS
+
+def test_memoized_module():
+    plain = module(source)
+    memoized = module(source, memo=64)
+    compiled = module(source, memo=64, compiled=True)
+
+    # the strategies of a module share one table
+    table = memoized['dnf'].memo
+    assert memoized['r'].memo is table
+
+    subject = aparse('Dnf(Eq(Impl(Atom(p), Atom(q)), Atom(r)))')
+    for name in ('dnf', 'r'):
+        assert memoized[name](subject) == plain[name](subject)
+        assert compiled[name](subject) == plain[name](subject)
+
+    assert table.hits > 0 and len(table) <= 64
+
+    # a second run is a single hit on the subject
+    hits = table.hits
+    memoized['dnf'](subject)
+    assert table.hits == hits + 1
+
+    table.clear()
+    assert table.hits == 0 and len(table) == 0
+
+def test_annotations():
+    # equal terms annotated differently do not share results
+    source = """
+    E : H(x) -> x
+    s = innermost(E)
+    r = repeat(E)
+    """
+    a, b = aparse('k(g(1){a})'), aparse('k(g(1){b})')
+    for opts in (dict(), dict(annotations=True), dict(compiled=True)):
+        mod = module(source, memo=64, **opts)
+        for name in ('s', 'r'):
+            assert str(mod[name](a)) == str(a)
+            assert str(mod[name](b)) == str(b)
+            assert str(mod[name](a)) == str(a)
+
+    table = MemoTable(4)
+    table.put(a, 1)
+    assert table.get(b) is MISS
+    table.put(b, 2)
+    assert table.get(b) == 2 and table.get(a) is MISS
+    assert len(table) == 1
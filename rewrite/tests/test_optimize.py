@@ -0,0 +1,87 @@
+from rewrite import aparse
+from rewrite.dsl import module
+from rewrite.dsl.optimize import Optimizer, show, symbols
+import rewrite.dsl.combinators as comb
+
+source = """
+E : Not(Not(x)) -> x
+E : Not(And(x, y)) -> Or(Not(x), Not(y))
+D : Or(x, x) -> x
+D : Impl(x, y) -> Or(Not(x), y)
+
+t0 = try(try(E))
+t1 = repeat(repeat(E))
+t2 = E <+ fail
+t3 = id ; E ; id
+t4 = all(E) ; all(D)
+t5 = innermost(E <+ D) ; innermost(E <+ D)
+t6 = topdown(try(E <+ D))
+t7 = repeat(all(E) ; some(D)) <+ fail
+"""
+
+subjects = [
+    'Not(Not(And(p, q)))',
+    'Or(Not(Not(p)), Not(Not(p)))',
+    'Impl(Not(And(p, q)), Or(q, q))',
+    'p',
+]
+
+def test_laws():
+    mod = module(source)
+    expected = {
+        't0': 'try(E)',
+        't1': 'repeat(repeat(E))',
+        't2': 'E',
+        't3': 'E',
+        't4': 'all((E ; D))',
+        't5': 'innermost(ED)',
+    }
+    for name, out in expected.items():
+        assert show(mod[name].optimize()) == out, name
+
+def test_agrees_with_interpreter():
+    interpreted = module(source)
+    optimized = module(source, optimized=True)
+    compiled = module(source, optimized=True, compiled=True)
+
+    for name in ('t0', 't2', 't3', 't4', 't5', 't6', 't7'):
+        for s in subjects:
+            s = aparse(s)
+            expected = interpreted[name].apply(s)
+            assert optimized[name].apply(s) == expected, name
+            assert compiled[name].apply(s) == expected, name
+
+def test_prune():
+    mod = module(source)
+
+    # no rule can fire on terms over p, q and And
+    opt = Optimizer(symbols(aparse('And(And(p, q), q)')))
+    assert opt(mod['t6']) is comb.Id
+    assert opt.applied[0] == 'prune'
+
+    # Impl rewrites to Not, and Not(Not(x)) may then fire
+    opt = Optimizer(symbols(aparse('Impl(p, Not(q))')))
+    block = opt(mod['t2'])
+    assert [r.left for r in block.rules] == [mod['E'].rules[0].left]
+
+def test_specialize():
+    mod = module(source)
+    t6 = mod['t6']
+    s = aparse('Impl(Not(Not(p)), q)')
+
+    # the pruned copy is for the input given, the strategy is kept
+    pruned = t6.optimize(symbols(aparse('And(p, q)')))
+    assert pruned is not t6 and pruned.combinator is comb.Id
+    assert t6(s) == aparse('Or(Not(p), q)')
+    assert t6.optimize(symbols(s))(s) == t6(s)
+
+def test_specialize_compiled():
+    mod = module(source, compiled=True)
+    t6 = mod['t6']
+    s = aparse('Impl(Not(Not(p)), q)')
+
+    # the pruned copy is compiled as the strategy is
+    pruned = t6.optimize(symbols(s))
+    assert pruned.compiled is not None
+    assert pruned.compiled is not t6.compiled
+    assert pruned(s) == t6(s)
@@ -0,0 +1,76 @@
+from nose.tools import assert_raises
+
+from rewrite import aparse
+from rewrite.terms import AAppl, ATerm, AList
+from rewrite.matching import FAIL
+from rewrite.dsl import module
+from rewrite.dsl.combinators import All, Topdown
+from rewrite.dsl.parallel import (Pool, WorkerError, chunks, batches,
+                                  rewrite_many)
+
+source = """
+E : Not(Not(x)) -> x
+E : A() -> B()
+
+t = try(E)
+s = E <+ E
+"""
+
+cycle = """
+L : A() -> B()
+L : B() -> A()
+
+spin = repeat(L)
+"""
+
+def table(n):
+    col = aparse('Col(Not(Not(A())), [A(), C()], (Not(Not(Not(A()))), 1))')
+    return AAppl(ATerm('Table'), [col] * n)
+
+def test_chunks():
+    terms = [aparse('f(x)'), aparse('y'), aparse('f(g(x))'), aparse('z')]
+    runs = chunks(terms, 2)
+    assert sum(runs, []) == terms and len(runs) == 2
+
+def test_batches():
+    runs = list(batches(iter(range(7)), 3))
+    assert runs == [[0, 1, 2], [3, 4, 5], [6]]
+
+def test_rewrite_many():
+    terms = [aparse('Not(Not(A()))'), aparse('C()'), aparse('A()')] * 10
+    res = list(rewrite_many(source, 'E', iter(terms), workers=2,
+                            chunksize=4))
+
+    # in order, with the failures on C() reported in place
+    assert res == [aparse('A()'), FAIL, aparse('B()')] * 10
+
+def test_worker_errors():
+    terms = ['C()', 'A()', 'f(', 'C()'] * 3
+    res = list(rewrite_many(cycle, 'spin', iter(terms), workers=2,
+                            chunksize=4, cycles=True))
+
+    # the terms raising are reported in place, the rest still rewritten
+    errors = [(r.index, r.kind) for r in res if isinstance(r, WorkerError)]
+    assert errors == [(1, 'STCycle'), (2, 'SyntaxError'),
+                      (5, 'STCycle'), (6, 'SyntaxError'),
+                      (9, 'STCycle'), (10, 'SyntaxError')]
+    assert res[::4] == res[3::4] == [aparse('C()')] * 3
+
+    subjects = [aparse('C()')] * 30 + [aparse('A()')]
+    with Pool(cycle, workers=2, threshold=20, cycles=True) as pool:
+        with assert_raises(WorkerError) as cm:
+            pool.map('apply', 'spin', subjects)
+        assert cm.exception.index == 30
+
+def test_parallel_traversals():
+    t = module(source)['t']
+    with Pool(source, workers=2, threshold=20) as pool:
+        for subject in [table(100), AList([table(10)] * 5),
+                        aparse('Not(Not(f(A())))')]:
+            # the same as in a single process
+            assert pool.topdown('t')(subject) == Topdown(t)(subject)
+            assert pool.all('t')(subject) == All(t)(subject)
+
+        # a failure on any subterm fails the traversal
+        assert pool.all('s').apply(table(100)) is FAIL
+        assert pool.topdown('s').apply(table(100)) is FAIL
@@ -0,0 +1,79 @@
+import os
+
+from rewrite import aparse
+from rewrite.dsl import module
+from rewrite.dsl.toplevel import RuleBlock
+from rewrite.dsl.profiling import Profile
+
+examples = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        '..', '..', 'examples')
+
+source = open(os.path.join(examples, 'dnff')).read()
+
+subject = aparse('Dnf(Eq(Atom(p), Not(Atom(q))))')
+
+def counts(profile, kind):
+    return dict((s.name, (s.calls, s.failures))
+                for s in profile.top('calls', kind))
+
+def test_counts():
+    profile = Profile()
+    mod = module(source, profile=profile)
+    expected = module(source)['dnf'](subject)
+    assert mod['dnf'](subject) == expected
+
+    dnf, = profile.top(kind='strategy')
+    assert (dnf.name, dnf.calls, dnf.failures) == ('dnf', 1, 0)
+
+    blocks = counts(profile, 'block')
+    rules = profile.top(kind='rule')
+    for label in ('D', 'E'):
+        calls, failures = blocks[label]
+        assert calls > failures > 0
+        # a block succeeds exactly when one of its rules does
+        assert calls - failures == sum(s.successes for s in rules
+                                       if s.name.startswith(label))
+    assert all(s.time >= 0 for s in profile.top())
+
+def test_compiled_counts():
+    plain = module(source, profile=True)
+    compiled = module(source, profile=True, compiled=True)
+    assert plain['dnf'](subject) == compiled['dnf'](subject)
+    assert counts(plain['dnf'].profile, 'block') == \
+        counts(compiled['dnf'].profile, 'block')
+    assert counts(plain['dnf'].profile, 'rule') == \
+        counts(compiled['dnf'].profile, 'rule')
+
+def test_automaton():
+    profile = Profile()
+    mod = module(source, profile=profile, automaton=True)
+    assert mod['dnf'](subject) == module(source)['dnf'](subject)
+    # only the rule firing is recorded
+    assert all(s.failures == 0 for s in profile.top(kind='rule'))
+    plain = module(source, profile=True)
+    plain['dnf'](subject)
+    assert counts(profile, 'block') == counts(plain['dnf'].profile, 'block')
+
+def test_orders():
+    profile = Profile()
+    module(source, profile=profile)['dnf'](subject)
+
+    by_time = profile.top('time')
+    assert [s.time for s in by_time] == sorted([s.time for s in by_time],
+                                               reverse=True)
+    by_failures = profile.top('failures')
+    ratios = [s.ratio for s in by_failures]
+    assert ratios == sorted(ratios, reverse=True)
+
+    report = profile.report('failures', limit=3).splitlines()
+    assert len(report) == 4 and 'fail%' in report[0]
+
+    profile.clear()
+    assert profile.top() == []
+
+def test_disabled():
+    mod = module(source)
+    assert mod['dnf'].profile is None
+    # no wrappers are installed without a profile
+    assert mod['E'].apply.__func__ is RuleBlock.apply.__func__
+    assert '_profiled' not in repr(mod['dnf'].apply)
@@ -0,0 +1,91 @@
+from rewrite import aparse
+from rewrite import terms as ast
+from rewrite.dsl import module
+
+def test_sharing_parse():
+    with ast.sharing() as table:
+        a = aparse('f(g(x), g(x), [1, 2], [1, 2])')
+        b = aparse('f(g(x), g(x), [1, 2], [1, 2])')
+
+        assert a is b
+        assert a.args[0] is a.args[1]
+        assert a.args[2] is a.args[3]
+        assert len(table) > 0
+
+    assert ast.sharing_table() is None
+    assert aparse('f(x)') is not aparse('f(x)')
+
+def test_sharing_literals():
+    with ast.sharing():
+        assert ast.aint(1) is ast.aint(1)
+        assert ast.aint(1) is not ast.areal(1.0)
+        assert ast.areal(0.0) is not ast.areal(-0.0)
+        assert ast.astr('a') is ast.astr('a')
+
+def test_sharing_annotations():
+    with ast.sharing():
+        a = aparse('f(x){a}')
+        b = aparse('f(x){b}')
+        c = aparse('f(x){a}')
+
+        assert a is c
+        assert a is not b
+        assert a.term is b.term
+
+def test_sharing_rewrite():
+    mod = module("""
+    E : Eq(x, y) -> And(Impl(x, y), Impl(y, x))
+    """)
+
+    with ast.sharing():
+        res = mod['E'](aparse('Eq(p, q)'))
+        expected = aparse('And(Impl(p, q), Impl(q, p))')
+        assert res is expected
+
+def test_sharing_weak():
+    with ast.sharing() as table:
+        a = ast.aappl(ast.aterm('f', None), [ast.aint(1)])
+        assert len(table) == 3
+        del a
+        assert len(table) == 0
+
+def test_hash():
+    a = aparse('f(g(x), [1, 2], (3, "s"), 1.5)')
+    b = aparse('f(g(x), [1, 2], (3, "s"), 1.5)')
+    c = aparse('f(g(y), [1, 2], (3, "s"), 1.5)')
+
+    assert a is not b
+    assert hash(a) == hash(b)
+    assert len(set([a, b, c])) == 2
+    assert {a: 1}[b] == 1
+
+def test_size_depth():
+    a = aparse('f(g(x), [1, 2], y)')
+
+    assert a.size == 7
+    assert a.depth == 3
+    assert aparse('x').size == 1
+    assert aparse('[]').depth == 1
+
+def test_immutable_args():
+    a = aparse('f(x, y)')
+    assert isinstance(a.args, tuple)
+    assert not hasattr(a, '__dict__')
+
+def test_pickle():
+    import pickle
+
+    a = aparse('f(g(x){a}, [1, 2.5], ("s", <term>))')
+    for proto in (0, 2):
+        b = pickle.loads(pickle.dumps(a, proto))
+        assert b == a
+        assert hash(b) == hash(a)
+        assert str(b) == str(a)
+
+def test_plain():
+    a = aparse('f(g(1), [x, "s"], (2.5, y))')
+    assert ast.plain(a) and ast.plain(a.args[0])
+    b = aparse('f(g(1), [x{a}, "s"], (2.5, y))')
+    assert not ast.plain(b)
+    assert ast.plain(b.args[0]) and not ast.plain(b.args[1])
+    assert ast.plain(ast.aint(1))
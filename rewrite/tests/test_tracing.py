@@ -0,0 +1,123 @@
+import os
+from cStringIO import StringIO
+
+from rewrite import aparse
+from rewrite.matching import FAIL
+from rewrite.dsl import module
+from rewrite.dsl import tracing
+from rewrite.dsl.toplevel import RuleBlock
+from rewrite.dsl.tracing import Tracer, DerivationLog, LogReader, replay, \
+    summary, subterm
+
+from nose.tools import assert_raises
+
+examples = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        '..', '..', 'examples')
+
+source = open(os.path.join(examples, 'dnff')).read()
+
+subject = aparse('Dnf(Eq(Atom(p), Not(Atom(q))))')
+
+def traced(mod, tracer, t):
+    fd = StringIO()
+    log = DerivationLog(fd)
+    tracer.hooks.append(log)
+    res = tracer.run(mod['dnf'], t)
+    tracer.hooks.remove(log)
+    log.flush()
+    return res, fd.getvalue()
+
+def test_hooks():
+    expected = module(source)['dnf'](subject)
+    steps = []
+    tracer = Tracer(lambda *step: steps.append(step))
+    res, data = traced(module(source, trace=tracer), tracer, subject)
+    assert res == expected
+    assert len(steps) == 59
+
+    # the log holds what the hooks are told, and the steps replayed
+    # lead from the subject to the result
+    records = list(LogReader(StringIO(data)))
+    assert records[0] == ('begin', subject)
+    assert records[-1] == ('end', expected)
+    assert [r[1:] for r in records[1:-1]] == steps
+
+    term = subject
+    for rule, path, before, after, term in replay(StringIO(data)):
+        assert subterm(term, path) == after
+    assert term == expected
+
+    runs, n, rules = summary(StringIO(data))
+    assert (runs, n) == (1, 59)
+    assert rules['D : DnfR(Not(<term>)) -> Not(<term>)'] == 9
+
+def test_compiled_hooks():
+    # the same steps whichever way the strategy is evaluated
+    tracer = Tracer()
+    res, data = traced(module(source, trace=tracer), tracer, subject)
+    for opts in [dict(compiled=True), dict(automaton=True),
+                 dict(optimized=True, compiled=True)]:
+        mod = module(source, trace=tracer, **opts)
+        assert traced(mod, tracer, subject) == (res, data)
+
+def test_failure():
+    src = """
+    A : f(x) -> g(x)
+    B : g(Z()) -> h(Z())
+    C : g(x) -> k(x)
+
+    ab = A ; B
+    ac = A ; C
+    abc = ab <+ ac
+    s = topdown(try(abc))
+    """
+    t = aparse('p(f(Z()), f(b), [f(b), f(Z())])')
+    tracer = Tracer()
+    mod = module(src, trace=tracer)
+    res, data = traced({'dnf': mod['s']}, tracer, t)
+    assert res == aparse('p(h(Z()), k(b), [k(b), h(Z())])')
+
+    # the rewrites of ab failing are replayed over
+    steps = list(replay(StringIO(data)))
+    assert [rule[0] for rule, path, _, _, _ in steps] == list('ABAACAACAB')
+    assert steps[-1][-1] == res
+
+    mod = module(src, trace=tracer)
+    assert tracer.run(mod['C'], aparse('f(b)')) is FAIL
+
+def test_batched():
+    # the positions in long lists of leaves, rewritten in a single loop
+    src = """
+    r : A() -> B()
+
+    t = topdown(try(r))
+    b = bottomup(try(r))
+    i = innermost(r)
+    """
+    t = aparse('f([%s])' % ', '.join(['A()'] * 100))
+    tracer = Tracer()
+    mod = module(src, trace=tracer)
+    for name in 'tbi':
+        steps = []
+        tracer.hooks = [lambda *step: steps.append(step)]
+        res = tracer.run(mod[name], t)
+        assert res == aparse('f([%s])' % ', '.join(['B()'] * 100))
+        assert [path for _, path, _, _ in steps] == \
+            [(0, i) for i in range(100)]
+
+def test_reset():
+    limit = tracing.LIMIT
+    tracing.LIMIT = 8
+    try:
+        tracer = Tracer()
+        res, data = traced(module(source, trace=tracer), tracer, subject)
+    finally:
+        tracing.LIMIT = limit
+    assert data.count(chr(tracing.RESET)) > 0
+    assert list(replay(StringIO(data)))[-1][-1] == res
+
+def test_untraced():
+    mod = module(source)
+    assert mod['E'].apply.__func__ is RuleBlock.apply.__func__
+    assert mod['dnf'].combinator.tracer is None
+    assert_raises(ValueError, module, source, memo=64, trace=Tracer())
@@ -0,0 +1,163 @@
+from rewrite import aparse
+from rewrite.terms import AAppl, ATerm, AList, AInt, aappl, aterm
+from rewrite.matching import FAIL
+from rewrite.dsl import module
+from rewrite.dsl import traverse
+from rewrite.dsl.combinators import all_args
+from rewrite.dsl.memo import MemoTable
+
+source = """
+E : A() -> B()
+E : Nil() -> End()
+E : Not(Not(x)) -> x
+E : Z() -> Not(Not(A()))
+E : 0 -> 1
+
+t = topdown(try(E))
+b = bottomup(try(E))
+i = innermost(E)
+"""
+
+def deep(n):
+    cons = ATerm('Cons')
+    t = aappl(aterm('Nil', None), [])
+    a = aappl(aterm('A', None), [])
+    for i in xrange(n):
+        t = AAppl(cons, (a, t))
+    return t
+
+def test_deep_terms():
+    # far deeper than the recursion limit
+    n = 10000
+    subject = deep(n)
+
+    for compiled in (False, True):
+        mod = module(source, compiled=compiled)
+        for name in ('t', 'b', 'i'):
+            res = mod[name](subject)
+            for k in xrange(n):
+                assert res.args[0] == aparse('B()')
+                res = res.args[1]
+            assert res == aparse('End()')
+
+# the recursive definitions
+
+def topdown(s, t):
+    val = s(t)
+    if val is FAIL:
+        return FAIL
+    return all_args(lambda a: topdown(s, a), val)
+
+def bottomup(s, t):
+    val = all_args(lambda a: bottomup(s, a), t)
+    if val is FAIL:
+        return FAIL
+    return s(val)
+
+def innermost(s, t):
+    val = all_args(lambda a: innermost(s, a), t)
+    res = s(val)
+    if res is FAIL:
+        return val
+    return innermost(s, res)
+
+def test_agrees_with_recursion():
+    rules = module(source)['E']
+    subjects = [
+        aparse('f(A(), Not(Not(g(A(), Nil()))), (1, A()), Not(h()))'),
+        aparse('Not(Not(Not(Not(A()))))'),
+        aparse('f(A(), fail(), A())'),
+        aparse('1'),
+        aparse('f((A(), [Z(), 0]), [], [[A()], (Not(Not(A())), 3)])'),
+        # long lists of leaves, and results entered in their place
+        AList([aparse('A()'), aparse('C()')] * 50),
+        AList([aparse('Z()'), aparse('A()')] * 50),
+        AList([AInt(i % 3) for i in xrange(100)]),
+        AList([aparse('C()')] * 100 + [aparse('fail()')]),
+    ]
+
+    def visit(log):
+        def s(t):
+            log.append(t)
+            if t == aparse('fail()'):
+                return FAIL
+            res = rules.apply(t)
+            return t if res is FAIL else res
+        return s
+
+    for engine, recursive in [(traverse.topdown, topdown),
+                              (traverse.bottomup, bottomup)]:
+        for subject in subjects:
+            # the strategy sees the same subterms in the same order
+            seen, expected = [], []
+            assert engine(visit(seen), subject) == \
+                recursive(visit(expected), subject)
+            assert seen == expected
+
+    for subject in subjects:
+        seen, expected = [], []
+        s = lambda log: lambda t: log.append(t) or rules.apply(t)
+        assert traverse.innermost(s(seen), subject) == \
+            innermost(s(expected), subject)
+        assert seen == expected
+
+    memo = MemoTable()
+    for subject in subjects:
+        res = traverse.innermost(rules.apply, subject, memo, 'i')
+        assert res == innermost(rules.apply, subject)
+
+def test_unchanged_terms_are_kept():
+    mod = module(source)
+    compiled = module(source, compiled=True)
+    subject = aparse('f(g(C(), h(C())), g(C(), A()), Not(C()))')
+
+    for m in (mod, compiled):
+        for name in ('t', 'b', 'i'):
+            noop = aparse('f(g(C()), h(C(), 1))')
+            traverse.allocations.reset()
+            assert m[name](noop) is noop
+            assert traverse.allocations.count == 0
+
+            # only the spine down to the rewritten leaf is rebuilt
+            res = m[name](subject)
+            assert res == aparse('f(g(C(), h(C())), g(C(), B()), Not(C()))')
+            assert res.args[0] is subject.args[0]
+            assert res.args[2] is subject.args[2]
+            assert res.args[1].args[0] is subject.args[1].args[0]
+            assert traverse.allocations.count == 2
+
+def test_long_lists():
+    n = 1000
+    compiled = module(source, compiled=True)
+    for m in (module(source), compiled):
+        for name in ('t', 'b', 'i'):
+            # each rewrite is one rebuild of the list
+            traverse.allocations.reset()
+            res = m[name](AList([aparse('A()'), aparse('C()')] * n))
+            assert res == AList([aparse('B()'), aparse('C()')] * n)
+            assert traverse.allocations.count == 1
+
+            res = m[name](AList([AInt(i % 2) for i in xrange(n)]))
+            assert res == AList([AInt(1)] * n)
+
+            noop = aparse('(1, [C(), (2, [])])')
+            assert m[name](noop) is noop
+
+        # the leaves rewritten into terms with children are entered
+        zs = AList([aparse('Z()')] * n)
+        assert m['t'](zs) == AList([aparse('Not(Not(B()))')] * n)
+        assert m['b'](zs) == AList([aparse('Not(Not(A()))')] * n)
+        assert m['i'](zs) == AList([aparse('B()')] * n)
+
+def test_annotations():
+    subject = aparse('f(A()){g(A()), A()}')
+    for compiled in (False, True):
+        plain = module(source, compiled=compiled)
+        annotated = module(source, compiled=compiled, annotations=True)
+        for name in ('t', 'b', 'i'):
+            # annotated terms are leaves unless asked otherwise
+            assert plain[name](subject) is subject
+
+            res = annotated[name](subject)
+            assert res.term == aparse('f(B())')
+            assert res.annotation == ((aparse('g(B())'),), (aparse('B()'),))